@@ -18,24 +18,111 @@ def cli():
                                                readable=True))
 @click.argument('saving_file', type=click.Path(file_okay=True, writable=True,
                                                dir_okay=False))
-def parse_google_tasks(*args, **kwargs):
+@click.option('--sort', is_flag=True,
+              help='Sort the resulting file by submit time, as required by si'
+                   'mulate_task_allocation (tasks are saved as they finish).')
+@click.option('--memory_budget', type=click.INT, default=1024,
+              help='Memory used to sort, in MB (defaults to 1024).')
+@click.option('--processes', '-p', type=click.INT, default=1,
+              help='Number of processes used to sort.')
+def parse_google_tasks(dataset_dir, saving_file, sort, memory_budget,
+                       processes):
     from sdrf.tasks.filter_tasks import filter_tasks
-    filter_tasks(*args, **kwargs)
+    filter_tasks(dataset_dir, saving_file)
+    if sort:
+        from sdrf.tasks.sort_tasks import sort_tasks as run_sort_tasks
+        run_sort_tasks(saving_file, saving_file, memory_budget * 2**20,
+                       processes)
+
+
+@cli.command(help='Sort TASKS_FILE by submit time using an external merge sor'
+                  't and save it to SAVING_FILE (may be the same file). When '
+                  'SAVING_FILE ends with .npy, tasks are saved in a binary fo'
+                  'rmat that can be used in place of the csv.')
+@click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
+                                              dir_okay=False, readable=True))
+@click.argument('saving_file', type=click.Path(file_okay=True, writable=True,
+                                               dir_okay=False))
+@click.option('--memory_budget', type=click.INT, default=1024,
+              help='Memory used to sort, in MB (defaults to 1024).')
+@click.option('--processes', '-p', type=click.INT, default=1,
+              help='Number of processes sorting parts of the file.')
+def sort_tasks(tasks_file, saving_file, memory_budget, processes):
+    from sdrf.tasks.sort_tasks import sort_tasks as run_sort_tasks
+    run_sort_tasks(tasks_file, saving_file, memory_budget * 2**20, processes)
+
+
+@cli.command(help='Save a stratified sample (by user and job size) of the jobs'
+                  ' in TASKS_FILE to SAVING_FILE, for faster approximate simu'
+                  'lations, and a report comparing its utilization with the '
+                  'original one (.report.json).')
+@click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
+                                              dir_okay=False, readable=True))
+@click.argument('saving_file', type=click.Path(file_okay=True, writable=True,
+                                               dir_okay=False))
+@click.option('--fraction', '-f', type=click.FLOAT, required=True,
+              help='Fraction of the jobs of each user that is kept, e.g., 0.'
+                   '1 for a simulation about 10 times faster.')
+@click.option('--seed', type=click.INT, default=0,
+              help='Random seed (defaults to 0).')
+@click.option('--memory_budget', type=click.INT,
+              help='Calculate the utilization reading the tasks in chunks, u'
+                   'sing about MEMORY_BUDGET MB.')
+def downsample(tasks_file, saving_file, fraction, seed, memory_budget):
+    from sdrf.tasks.downsample import downsample as run_downsample
+    if memory_budget is not None:
+        memory_budget *= 2**20
+    report = run_downsample(tasks_file, saving_file, fraction, seed,
+                            memory_budget)
+    print(json.dumps(report, sort_keys=True))
 
 
 @cli.command(help='Plot system utilization with filtered tasks.')
 @click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
                                               dir_okay=False, readable=True),
                 nargs=-1)
-def system_utilization(tasks_file):
+@click.option('--user', '-u', multiple=True,
+              help='Plot the utilization of USER instead of the whole system.'
+                   ' Saved to a file ending with the user id, can be used mo'
+                   're than once.')
+@click.option('--memory_budget', type=click.INT,
+              help='Calculate the utilization reading the tasks in chunks, u'
+                   'sing about MEMORY_BUDGET MB.')
+def system_utilization(tasks_file, user, memory_budget):
     from sdrf.tasks.system_utilization import SystemUtilization
+    if memory_budget is not None:
+        memory_budget *= 2**20
     for f in tasks_file:
         if '.' in f:
             dot_split = f.split('.')
-            saving_file = '.'.join(dot_split[0:-1]) + '.pdf'
+            saving_name = '.'.join(dot_split[0:-1])
         else:
-            saving_file = f + '.pdf'
-        SystemUtilization(f).plot(saving_file)
+            saving_name = f
+        utilization = SystemUtilization(f, memory_budget=memory_budget)
+        if not user:
+            utilization.plot(saving_name + '.pdf')
+        for u in user:
+            utilization.plot('%s-%s.pdf' % (saving_name, u), u)
+
+
+def _read_config(config, allocator, delta, memory_limit):
+    """
+    :return: resources, deltas (only for sdrf) and memory limit (in bytes,
+    when not given) from the config file
+    """
+    conf_parser = configparser.ConfigParser()
+    conf_parser.read(config)
+    try:
+        resource = json.loads(conf_parser.get('config', 'resources'))
+        if allocator == 'sdrf':
+            delta = json.loads(conf_parser.get('config', 'deltas'))
+    except configparser.NoOptionError as e:
+        print ('No option "%s" found in the config file.' % e.option)
+        sys.exit(3)
+    if memory_limit is None and conf_parser.has_option(
+            'config', 'estimate_memory_usage'):
+        memory_limit = conf_parser.getint('config', 'estimate_memory_usage')
+    return resource, delta, memory_limit
 
 
 @cli.command(help='Simulate task allocation using a TASKS_FILE generated with '
@@ -71,8 +158,87 @@ def system_utilization(tasks_file):
 @click.option('--weights', '-w', is_flag=True,
               help='This makes DRF act as wDRF using weights proportional to u'
                    'sers\' resources.')
+@click.option('--snapshot_interval', type=click.FLOAT,
+              help='Save the commitments of all users every SNAPSHOT_INTERVAL'
+                   ' seconds to a .snapshots.npz file next to the result. Onl'
+                   'y makes sense for SDRF.')
+@click.option('--fast_path', is_flag=True,
+              help='Start arriving tasks right away, skipping the queues, whi'
+                   'le nobody is waiting and they fit in the system. Results '
+                   'are the same, but underloaded traces run faster. Only tas'
+                   'ks of a single user arriving at the same time skip the qu'
+                   'eues.')
+@click.option('--coalesce_events', is_flag=True,
+              help='Apply all the tasks finishing and arriving at the same ti'
+                   'me together and then run a single scheduling pass. Result'
+                   's are saved with the "coalesced" suffix.')
+@click.option('--buckets', type=click.INT,
+              help='Split the users in BUCKETS buckets, each with its own li'
+                   've tree, so that only the commitment crossings that may c'
+                   'hange the next user are processed. Results are the same,'
+                   ' but traces with many users run faster. Only for SDRF.')
+@click.option('--epoch', type=click.FLOAT,
+              help='Approximate SDRF: commitments are only brought up to dat'
+                   'e (and users reordered) every EPOCH seconds, with alloca'
+                   'tion changes accounted from the beginning of their epoch.'
+                   ' Results are saved with the "epoch" suffix, see compare_'
+                   'outputs. Only for SDRF.')
+@click.option('--machines', type=click.INT,
+              help='Split the system resources equally among MACHINES machin'
+                   'es, each task must fit in a single one. Results are save'
+                   'd with the "machines" suffix. Does not work with --fast_'
+                   'path.')
+@click.option('--placement', type=click.Choice(['first_fit', 'best_fit']),
+              default='first_fit',
+              help='How tasks are placed in the machines: in the first one '
+                   'where they fit or in the one left with the least free re'
+                   'sources (defaults to first_fit).')
+@click.option('--merge_with', '-m', multiple=True,
+              type=click.Path(exists=True, file_okay=True, dir_okay=False,
+                              readable=True),
+              help='Other tasks file to be merged with TASKS_FILE (by submit '
+                   'time) during the simulation, can be used more than once. '
+                   'Each file must be sorted by submit time.')
+@click.option('--memory_budget', type=click.INT,
+              help='Calculate the utilization reading the tasks in chunks, u'
+                   'sing about MEMORY_BUDGET MB. The resources calculated thi'
+                   's way may differ in the last digits.')
+@click.option('--memory_limit', type=click.INT,
+              help='Estimate the memory used by the simulations beforehand a'
+                   'nd don\'t start the ones above MEMORY_LIMIT MB (defaults '
+                   'to estimate_memory_usage, in bytes, from the config file'
+                   ').')
+@click.option('--fan_out', type=click.INT, default=1,
+              help='Number of simulations (parameter combinations) run togeth'
+                   'er in a single pass over the tasks file, which is then re'
+                   'ad once for all of them. Each one uses its own memory.')
+@click.option('--time_windows', type=click.INT, default=1,
+              help='Split the trace in this many time windows, simulated in p'
+                   'arallel and corrected iteratively until they agree with '
+                   'each other. Only for SDRF.')
+@click.option('--processes', '-p', type=click.INT,
+              help='Number of processes used with --time_windows (defaults t'
+                   'o one per window).')
+@click.option('--warmup', type=click.FLOAT,
+              help='Seconds simulated before each time window to estimate it'
+                   's initial state (defaults to long enough for the commitm'
+                   'ents to decay below the tolerance).')
+@click.option('--tolerance', type=click.FLOAT, default=1e-9,
+              help='Largest relative difference of commitments and allocatio'
+                   'ns accepted between the end of a time window and the beg'
+                   'inning of the next one (defaults to 1e-9).')
+@click.option('--force', is_flag=True,
+              help='Simulate every parameter combination, even the ones whos'
+                   'e results are up to date. Results are up to date when sim'
+                   'ulated from the same tasks file, parameters and code (see'
+                   ' results_manifest.json in SAVING_PATH).')
 def simulate_task_allocation(tasks_file, saving_path, allocator, config, delta,
-                             resource, same_share, reserved, weights):
+                             resource, same_share, reserved, weights,
+                             snapshot_interval, fast_path, coalesce_events,
+                             buckets, epoch, machines, placement, merge_with,
+                             memory_budget, memory_limit, fan_out,
+                             time_windows, processes, warmup, tolerance,
+                             force):
 
     if (not config) and (not resource):
         print('Must provide a config file or at least one resource percentage')
@@ -81,35 +247,310 @@ def simulate_task_allocation(tasks_file, saving_path, allocator, config, delta,
         print('Must provide a config file or at least one delta')
         sys.exit(2)
 
+    if memory_budget is not None:
+        memory_budget *= 2**20
+    if memory_limit is not None:
+        memory_limit *= 2**20
+
     if config:
-        conf_parser = configparser.ConfigParser()
-        conf_parser.read(config)
-        try:
-            resource = json.loads(conf_parser.get('config', 'resources'))
-            if allocator == 'sdrf':
-                delta = json.loads(conf_parser.get('config', 'deltas'))
-        except configparser.NoOptionError as e:
-            print ('No option "%s" found in the config file.' % e.option)
-            sys.exit(3)
+        resource, delta, memory_limit = _read_config(config, allocator,
+                                                     delta, memory_limit)
+
+    if time_windows > 1 and (allocator != 'sdrf' or merge_with or
+                             snapshot_interval is not None or fan_out > 1 or
+                             machines is not None):
+        print('--time_windows only works with SDRF and a single tasks file, '
+              'without snapshots, --fan_out or --machines')
+        sys.exit(2)
+    if machines is not None and fast_path:
+        print('--machines does not work with --fast_path')
+        sys.exit(2)
 
     saving_path = saving_path or '.'
+    if merge_with:
+        tasks_file = [tasks_file] + list(merge_with)
+
+    from sdrf.simulators.simulate_task_allocation import fan_out as sim
+    if allocator == 'wdrf':
+        parameters = [dict(resource_percentage=r, use_weights=weights,
+                           fast_path=fast_path,
+                           coalesce_events=coalesce_events,
+                           machines=machines, placement=placement)
+                      for r in resource]
+    else:  # sdrf
+        parameters = [dict(resource_percentage=r, delta=d,
+                           same_share=same_share, reserved=reserved,
+                           snapshot_interval=snapshot_interval,
+                           fast_path=fast_path,
+                           coalesce_events=coalesce_events, buckets=buckets,
+                           epoch=epoch, machines=machines,
+                           placement=placement)
+                      for r, d in product(resource, delta)]
+
+    if time_windows > 1:
+        from sdrf.simulators.time_parallel import time_parallel_sdrf
+        for kwargs in parameters:
+            for key in ['snapshot_interval', 'machines', 'placement']:
+                del kwargs[key]
+            time_parallel_sdrf(tasks_file, saving_path, windows=time_windows,
+                               processes=processes, warmup=warmup,
+                               tolerance=tolerance, memoize=True,
+                               force=force, **kwargs)
+        return
+
+    fan_out = max(fan_out, 1)
+    for i in xrange(0, len(parameters), fan_out):
+        try:
+            sim(tasks_file, saving_path, allocator,
+                parameters[i:i + fan_out], memory_budget, memoize=True,
+                force=force, memory_limit=memory_limit)
+        except MemoryError as e:
+            print(e)
+            sys.exit(4)
+
+
+@cli.command(help='Create a sweep in SWEEP_DIR (e.g., on a shared file syst'
+                  'em) with a point for each combination of parameters, to be'
+                  ' simulated by sweep_worker on any number of nodes. Results'
+                  ' are saved to SWEEP_DIR, as in simulate_task_allocation.')
+@click.argument('sweep_dir', type=click.Path(file_okay=False, dir_okay=True,
+                                             writable=True))
+@click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
+                                              dir_okay=False, readable=True))
+@click.option('--allocator', '-a', type=click.Choice(['wdrf', 'sdrf']),
+              default='sdrf', help='Allocator to use (defaults to sdrf).')
+@click.option('--config', '-c', type=click.Path(exists=True, file_okay=True,
+                                                dir_okay=False, readable=True),
+              help='Configuration file to use.')
+@click.option('--delta', '-d', type=click.FLOAT, multiple=True,
+              help='Delta to be used by SDRF, can be used more than once.')
+@click.option('--resource', '-r', type=click.FLOAT, multiple=True,
+              help='Percentage of resources, see simulate_task_allocation, c'
+                   'an be used more than once.')
+@click.option('--same_share', is_flag=True,
+              help='All users get the same share, see simulate_task_allocati'
+                   'on.')
+@click.option('--reserved', is_flag=True,
+              help='Enables the 2 stages queue for SDRF.')
+@click.option('--weights', '-w', is_flag=True,
+              help='This makes DRF act as wDRF using weights proportional to u'
+                   'sers\' resources.')
+@click.option('--vary', multiple=True,
+              type=click.Choice(['same_share', 'reserved', 'weights']),
+              help='Simulate every point with and without this flag, can be '
+                   'used more than once.')
+@click.option('--fast_path', is_flag=True,
+              help='Start arriving tasks of a single user right away while n'
+                   'obody is waiting.')
+@click.option('--coalesce_events', is_flag=True,
+              help='A single scheduling pass for the events at the same time'
+                   ', see simulate_task_allocation.')
+@click.option('--buckets', type=click.INT,
+              help='Split the users in BUCKETS buckets. Only for SDRF.')
+@click.option('--epoch', type=click.FLOAT,
+              help='Approximate SDRF with epochs of EPOCH seconds.')
+@click.option('--machines', type=click.INT,
+              help='Split the system resources equally among MACHINES machin'
+                   'es.')
+@click.option('--placement', type=click.Choice(['first_fit', 'best_fit']),
+              default='first_fit',
+              help='How tasks are placed in the machines (defaults to first_'
+                   'fit).')
+@click.option('--merge_with', '-m', multiple=True,
+              type=click.Path(exists=True, file_okay=True, dir_okay=False,
+                              readable=True),
+              help='Other tasks file to be merged with TASKS_FILE, can be use'
+                   'd more than once.')
+@click.option('--memory_budget', type=click.INT,
+              help='Calculate the utilization reading the tasks in chunks, u'
+                   'sing about MEMORY_BUDGET MB.')
+@click.option('--memory_limit', type=click.INT,
+              help='Memory limit of each simulation in MB (defaults to estim'
+                   'ate_memory_usage, in bytes, from the config file), see si'
+                   'mulate_task_allocation.')
+@click.option('--heartbeat', type=click.FLOAT, default=30.0,
+              help='Seconds between the heartbeats of the workers (defaults '
+                   'to 30).')
+@click.option('--stale_after', type=click.FLOAT,
+              help='Seconds without heartbeats after which a point is claime'
+                   'd by another worker (defaults to 10 heartbeats).')
+def create_sweep(sweep_dir, tasks_file, allocator, config, delta, resource,
+                 same_share, reserved, weights, vary, fast_path,
+                 coalesce_events, buckets, epoch, machines, placement,
+                 merge_with, memory_budget, memory_limit, heartbeat,
+                 stale_after):
+    from sdrf.simulators.sweep import create_sweep as run_create, \
+        sweep_parameters
 
+    if (not config) and (not resource):
+        print('Must provide a config file or at least one resource percentage')
+        sys.exit(1)
+    if allocator == 'sdrf' and (not config) and (not delta):
+        print('Must provide a config file or at least one delta')
+        sys.exit(2)
+    if machines is not None and fast_path:
+        print('--machines does not work with --fast_path')
+        sys.exit(2)
+
+    if memory_budget is not None:
+        memory_budget *= 2**20
+    if memory_limit is not None:
+        memory_limit *= 2**20
+    if config:
+        resource, delta, memory_limit = _read_config(config, allocator,
+                                                     delta, memory_limit)
+
+    options = dict(fast_path=fast_path, coalesce_events=coalesce_events,
+                   machines=machines, placement=placement)
     if allocator == 'wdrf':
-        from sdrf.simulators.simulate_task_allocation import wdrf as sim
-        arg_iterator = product([tasks_file], [saving_path], resource,[weights])
+        options.update(use_weights=weights)
     else:  # sdrf
-        from sdrf.simulators.simulate_task_allocation import sdrf as sim
-        arg_iterator = product([tasks_file], [saving_path], resource, delta,
-                               [same_share], [reserved])
-    for arg in arg_iterator:
-        sim(*arg)
+        options.update(same_share=same_share, reserved=reserved,
+                       buckets=buckets, epoch=epoch)
+    vary = ['use_weights' if v == 'weights' else v for v in vary]
+    parameters = sweep_parameters(allocator, resource, delta, vary, **options)
+    try:
+        manifest = run_create(sweep_dir, [tasks_file] + list(merge_with),
+                              allocator, parameters, memory_budget,
+                              memory_limit, heartbeat, stale_after)
+    except ValueError as e:
+        print(e)
+        sys.exit(2)
+    print('%d points' % len(manifest['points']))
+
+
+@cli.command(help='Simulate the points of the sweep in SWEEP_DIR (see create_'
+                  'sweep) that are not done or claimed by other workers, one '
+                  'at a time. Any number of workers may run on any node with'
+                  ' access to SWEEP_DIR.')
+@click.argument('sweep_dir', type=click.Path(exists=True, file_okay=False,
+                                             dir_okay=True, writable=True))
+@click.option('--name', help='Name of the worker, shown by sweep_status (def'
+                             'aults to the host name and process id).')
+@click.option('--no_wait', is_flag=True,
+              help='Exit when every point left is claimed by other workers, '
+                   'instead of waiting to claim the ones whose workers stop.')
+@click.option('--max_points', type=click.INT,
+              help='Exit after simulating this many points.')
+def sweep_worker(sweep_dir, name, no_wait, max_points):
+    from sdrf.simulators.sweep import work
+    simulated = work(sweep_dir, name, not no_wait, max_points)
+    print('%d points simulated' % len(simulated))
+
+
+@cli.command(help='Summarize the progress of the sweep in SWEEP_DIR: number o'
+                  'f points done, running, stale (whose worker stopped) and p'
+                  'ending, in total and by worker.')
+@click.argument('sweep_dir', type=click.Path(exists=True, file_okay=False,
+                                             dir_okay=True, readable=True))
+def sweep_status(sweep_dir):
+    from sdrf.simulators.sweep import sweep_status as run_status
+    print(json.dumps(run_status(sweep_dir), sort_keys=True))
+
+
+@cli.command(help='Run an allocator as a local scheduler service, listening '
+                  'on a Unix socket or TCP port. Users and their resources a'
+                  're taken from TASKS_FILE, as in simulate_task_allocation.')
+@click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
+                                              dir_okay=False, readable=True))
+@click.option('--allocator', '-a', type=click.Choice(['wdrf', 'sdrf']),
+              default='sdrf', help='Allocator to use (defaults to sdrf).')
+@click.option('--delta', '-d', type=click.FLOAT,
+              help='Delta to be used by SDRF.')
+@click.option('--resource', '-r', type=click.FLOAT, required=True,
+              help='Percentage of resources, see simulate_task_allocation.')
+@click.option('--same_share', is_flag=True,
+              help='All users get the same share, see simulate_task_allocati'
+                   'on.')
+@click.option('--reserved', is_flag=True,
+              help='Enables the 2 stages queue for SDRF.')
+@click.option('--weights', '-w', is_flag=True,
+              help='This makes DRF act as wDRF using weights proportional to u'
+                   'sers\' resources.')
+@click.option('--fast_path', is_flag=True,
+              help='Start arriving tasks of a single user right away while n'
+                   'obody is waiting.')
+@click.option('--coalesce_events', is_flag=True,
+              help='A single scheduling pass for all the tasks finishing in a'
+                   ' message.')
+@click.option('--socket', 'unix_socket', default='sdrf.sock',
+              type=click.Path(dir_okay=False, writable=True),
+              help='Unix socket to listen on (defaults to sdrf.sock).')
+@click.option('--port', type=click.INT,
+              help='Listen on this TCP port (on localhost) instead of a Unix'
+                   ' socket.')
+def serve(tasks_file, allocator, delta, resource, same_share, reserved,
+          weights, fast_path, coalesce_events, unix_socket, port):
+    from sdrf.service.server import listening_socket, scheduler_service, \
+        serve as run_server
+    if allocator == 'sdrf' and delta is None:
+        print('Must provide a delta')
+        sys.exit(2)
+    service = scheduler_service(tasks_file, allocator, resource, delta,
+                                same_share, reserved, weights, fast_path,
+                                coalesce_events)
+    listener = listening_socket(unix_socket, port)
+    print('Listening on %s' % (unix_socket if port is None else port))
+    run_server(service, listener)
+    print(json.dumps(service.stats(), sort_keys=True))
+
+
+@cli.command(help='Replay TASKS_FILE against a running scheduler service (see'
+                  ' serve) and save the result to SAVING_FILE, in the same fo'
+                  'rmat as simulate_task_allocation.')
+@click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
+                                              dir_okay=False, readable=True))
+@click.argument('saving_file', type=click.Path(file_okay=True, writable=True,
+                                               dir_okay=False))
+@click.option('--socket', 'unix_socket', default='sdrf.sock',
+              type=click.Path(dir_okay=False),
+              help='Unix socket of the service (defaults to sdrf.sock).')
+@click.option('--port', type=click.INT,
+              help='TCP port of the service (on localhost), used instead of '
+                   'the Unix socket.')
+@click.option('--shutdown', is_flag=True,
+              help='Stop the service in the end.')
+def replay(tasks_file, saving_file, unix_socket, port, shutdown):
+    from sdrf.service.replay import replay as run_replay
+    from sdrf.service.server import ServiceClient, connect
+    client = ServiceClient(connect(unix_socket, port))
+    try:
+        stats = run_replay(tasks_file, saving_file, client)
+        print(json.dumps(stats, sort_keys=True))
+        if shutdown:
+            client.request([{'type': 'shutdown'}])
+    finally:
+        client.close()
+
+
+@cli.command(help='Compare two results of simulate_task_allocation for the sa'
+                  'me tasks file, e.g., an approximate simulation (OUTPUT_B,'
+                  ' with --epoch) with the exact one (OUTPUT_A).')
+@click.argument('output_a', type=click.Path(exists=True, file_okay=True,
+                                            dir_okay=False, readable=True))
+@click.argument('output_b', type=click.Path(exists=True, file_okay=True,
+                                            dir_okay=False, readable=True))
+@click.option('--users', is_flag=True,
+              help='Also print the difference of the mean wait time of each '
+                   'user (OUTPUT_B - OUTPUT_A, in the tasks time unit).')
+def compare_outputs(output_a, output_b, users):
+    from sdrf.tasks.compare_outputs import compare_outputs as run_compare, \
+        read_output, users_wait_time_difference
+    print(json.dumps(run_compare(output_a, output_b), sort_keys=True))
+    if users:
+        difference = users_wait_time_difference(read_output(output_a),
+                                                read_output(output_b))
+        for user, value in difference.iteritems():
+            print('%s,%r' % (user, value))
 
 
 @cli.command(help='Summary of tasks execution from a tasks file.')
 @click.argument('tasks_file', type=click.Path(exists=True, file_okay=True,
                                               dir_okay=False, readable=True),
                 nargs=-1)
-def jobs_summary(tasks_file):
+@click.option('--processes', '-p', type=click.INT, default=1,
+              help='Number of processes used to summarize each file.')
+def jobs_summary(tasks_file, processes):
     from sdrf.tasks.jobs_summary import jobs_summary as run_jobs_summary
     for f in tasks_file:
         file_att = FileName(f)
@@ -120,7 +561,7 @@ def jobs_summary(tasks_file):
         saving_file = FileName('task_sim', allocator, resource_percentage,
                                delta, **file_att.attributes)
         saving_file = saving_file.name
-        run_jobs_summary(f, saving_file)
+        run_jobs_summary(f, saving_file, processes)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 import itertools
 from collections import defaultdict, deque
+from operator import attrgetter
 
 import numpy as np
 
-from ..helpers.priority_queue import PriorityQueue
+from ..helpers.calendar_queue import CalendarQueue
 
 
 class Task(object):
@@ -25,6 +26,34 @@ class Task(object):
     _user_index_generator = itertools.count()
     _user_index = defaultdict(_user_index_generator.next)
 
+    @classmethod
+    def reset_user_index(cls):
+        """
+        Forgets the indices given to the users, shared by every task in the
+        process, e.g., before simulating tasks of other users
+        """
+        cls._user_index_generator = itertools.count()
+        cls._user_index = defaultdict(cls._user_index_generator.next)
+
+    @classmethod
+    def user_ids(cls):
+        """
+        :return: users in the order of their indices
+        """
+        return sorted(cls._user_index, key=cls._user_index.get)
+
+    @classmethod
+    def set_user_index(cls, user_ids):
+        """
+        Gives the users the indices 0, 1, ... in the given order, e.g., to use
+        the same ones as another process (see user_ids). New users get the
+        next indices
+        """
+        cls._user_index_generator = itertools.count(len(user_ids))
+        cls._user_index = defaultdict(cls._user_index_generator.next,
+                                      ((user_id, user) for user, user_id
+                                       in enumerate(user_ids)))
+
     def __hash__(self):
         return hash(self.count)
 
@@ -36,6 +65,15 @@ class Task(object):
     def __getitem__(self, key):
         return self.__dict__[key]  # gets KeyError exception when invalid
 
+    def copy(self):
+        """
+        :return: copy of the task, with the same count, to be given to another
+        allocator (the demands are shared)
+        """
+        task = Task.__new__(Task)
+        task.__dict__.update(self.__dict__)
+        return task
+
     @property
     def duration(self):
         return self.finish_time - self.start_time
@@ -49,20 +87,80 @@ class Task(object):
 # the finished_tasks deque with the submit, start and finish times as well as
 # the amount of CPU and memory used. This queue can be inspected after the
 # simulation is complete or, even better, while it's still running.
+#
+# When fast_path is enabled, tasks that arrive while nobody is waiting and that
+# fit in the available resources are started right away, without going through
+# the users queues. The queues are only brought up to date (_sync_users) when
+# some task has to wait again, by replaying the allocation changes of every
+# user that was touched in the meantime. The result is the same as the exact
+# path. Only tasks of a single user arriving at the same time skip the queues:
+# the exact path starts the tasks of several users in the order of their
+# priorities (compared in the native precision), which the fast path doesn't
+# keep, so those groups still go through the queues and only underloaded
+# traces whose simultaneous arrivals come from one user run faster.
+#
+# When coalesce_events is enabled, all the events with the same timestamp are
+# applied together (tasks finishing and arriving) before a single scheduling
+# pass. Otherwise, each task that finishes is followed by its own pass, before
+# the tasks arriving at the same time are queued.
+#
+# When online is enabled, the events come from outside instead (e.g., from the
+# scheduler service) through submit_tasks, finish_tasks and advance, in
+# chronological order. Tasks run until finish_tasks is called for them, so
+# their durations are not needed, and each call returns the tasks it started.
+#
+# When machines are given, the capacity is split among them and every task
+# must fit in a single machine (see MachineIndex), where it stays until it
+# finishes (task.machine). The user with best priority must then wait when no
+# machine has room for their task, even if the system as a whole has. The
+# capacities are still the total of all machines, used by the allocators to
+# compute the users shares. The fast path starts tasks in arrival order, which
+# would place them differently, so it can't be used with machines.
 class Arrival(object):
-    def __init__(self, capacities, num_users, keep_history=False):
+    def __init__(self, capacities, num_users, keep_history=False,
+                 fast_path=False, coalesce_events=False, online=False,
+                 machines=None, placement='first_fit'):
+        """
+        :param machines: (optional) cpu and memory of each machine
+        :param placement: (optional) how tasks are placed in the machines,
+        'first_fit' or 'best_fit', see MachineIndex
+        """
+        if machines is None:
+            self.machines = None
+        elif fast_path:
+            raise ValueError('The fast path does not work with machines')
+        else:
+            # the native library is only needed by the allocators
+            from ..helpers.live_tree import MachineIndex
+            self.machines = MachineIndex(machines, placement)
+        # machine found for the task that is about to start
+        self._placement = None
+
         self.num_resources = len(capacities)
         self.num_users = num_users
         self._capacities = np.array(capacities, dtype=float)
         self.consumed_resources = np.zeros(self.num_resources)
         self.allocations = np.zeros((self.num_users, self.num_resources))
         self.users_queues = defaultdict(deque)
-        self.running_tasks = PriorityQueue()
+        # completion events (finish_time, task.count), ties finish in the
+        # order the tasks were created
+        self.running_tasks = CalendarQueue()
+        self._tasks_by_id = {}
         self.current_time = 0.0
         self.finished_tasks = deque()
 
         self._system_full = False
 
+        self.fast_path = fast_path
+        self.coalesce_events = coalesce_events
+        self.online = online
+        self.started_tasks = []
+        self._queued_tasks = 0
+        # while deferring, nobody is waiting and users are not in the queues,
+        # allocation changes are kept in _deferred_updates instead
+        self._deferring = fast_path
+        self._deferred_updates = defaultdict(list)
+
         if keep_history:
             self.allocation_history = []
         else:
@@ -74,20 +172,61 @@ class Arrival(object):
     def _insert_user(self, user):
         raise NotImplementedError()
 
+    def _replay_user(self, user, updates):
+        """
+        Brings the queues up to date with the allocation changes that happened
+        while the fast path was deferring them
+        :param updates: list of (time, allocation) with the user allocation
+        after each change
+        """
+        pass
+
     def run_task(self):
         task = self.pick_task()
         if task is None:
             return False
 
+        self._start_task(task)
+        self._insert_user(task.user)
+        return True
+
+    def _start_task(self, task):
+        if self.machines is not None:
+            self._place_task(task)
         self.consumed_resources += task.demands
         self.allocations[task.user] += task.demands
         if self.allocation_history is not None:
             self.allocation_history.append(self.allocations.copy())
+        self._add_running_task(task)
+
+    def _add_running_task(self, task):
         task.finish_time = self.current_time + task.duration
         task.start_time = self.current_time
-        self.running_tasks.add(task, task.finish_time)
-        self._insert_user(task.user)
-        return True
+        self._tasks_by_id[task.count] = task
+        if self.online:
+            self.started_tasks.append(task)
+        else:
+            self.running_tasks.push(task.count, task.finish_time)
+
+    def _place_task(self, task):
+        # tasks only start right after _system_fulfills_request found them a
+        # machine
+        machine = self._placement
+        if machine is None:
+            machine = self.machines.find(task.demands)
+        self._placement = None
+        self.machines.allocate(machine, task.demands)
+        task.machine = machine
+
+    def _finish_running_task(self, task_id):
+        task = self._tasks_by_id.pop(task_id)
+        self._advance_time(task.finish_time)
+        if self.machines is not None:
+            self.machines.release(task.machine, task.demands)
+        self.consumed_resources -= task.demands
+        self.allocations[task.user] -= task.demands
+        self.finished_tasks.append(task)
+        return task
 
     def run_all_tasks(self):
         while self.run_task():
@@ -97,33 +236,201 @@ class Arrival(object):
         raise NotImplementedError()
 
     def simulate(self, tasks, simulation_limit=None):
-        if simulation_limit is None:
-            simulation_limit = np.inf
+        simulate_in_lockstep([self], tasks, simulation_limit)
+
+    def _simulate_arrivals(self, submit_time, arrivals):
+        if submit_time < self.current_time:
+            raise RuntimeError('Task arrived in the future! Must provide '
+                               'tasks in chronological order.')
+        if submit_time > self.current_time:
+            self._finish_tasks_until(submit_time)
+            self._advance_time(submit_time)
+        self._submit_tasks(arrivals)
+
+    def resume(self, running_tasks, queued_tasks, consumed_resources=None,
+               allocations=None):
+        """
+        Continues from the state of another simulation at the current time,
+        e.g., at the end of a time window
+        :param running_tasks: tasks running, with their start and finish times
+        :param queued_tasks: tasks waiting, in the order they were submitted
+        :param consumed_resources: (optional) as it was, by default it is
+        added up from the running tasks
+        :param allocations: (optional) same as consumed_resources
+        """
+        if self.machines is not None:
+            raise ValueError('Resuming does not work with machines')
+        for task in running_tasks:
+            self.consumed_resources += task.demands
+            self.allocations[task.user] += task.demands
+            self._tasks_by_id[task.count] = task
+            self.running_tasks.push(task.count, task.finish_time)
+        if consumed_resources is not None:
+            self.consumed_resources[:] = consumed_resources
+        if allocations is not None:
+            self.allocations[:] = allocations
+        for user in np.flatnonzero(self.allocations.any(axis=1)):
+            self._replay_user(user, [(self.current_time,
+                                      self.allocations[user].copy())])
+        if queued_tasks:
+            self._submit_tasks(queued_tasks)
+
+    def _end_simulation(self, simulation_limit):
+        self._finish_tasks_until(simulation_limit)
+        self._sync_users()
+
+    def submit_tasks(self, tasks, time):
+        """
+        Online mode: tasks submitted at the given time
+        :return: list of tasks started
+        """
+        self.advance(time)
+        self._submit_tasks(tasks)
+        self._scheduling_pass()
+        return self._take_started_tasks()
+
+    def finish_tasks(self, task_ids, time):
+        """
+        Online mode: running tasks (by Task.count) finished at the given time
+        :return: list of tasks started
+        """
+        self.advance(time)
+        last_finished = {}
+        for task_id in task_ids:
+            self._tasks_by_id[task_id].finish_time = time
+            task = self._finish_running_task(task_id)
+            if self._deferring:
+                self._defer_user_update(task.user)
+            elif self.coalesce_events:
+                last_finished[task.user] = task
+            else:
+                self.finish_task(task)
+                self._scheduling_pass()
+        for user in sorted(last_finished):
+            self.finish_task(last_finished[user])
+        self._scheduling_pass()
+        return self._take_started_tasks()
+
+    def advance(self, time):
+        """
+        Online mode: moves the clock forward to the given time
+        """
+        if time < self.current_time:
+            raise ValueError('Event in the past! Current time is %r, got %r'
+                             % (self.current_time, time))
+        if time > self.current_time:
+            self._advance_time(time)
+
+    def _scheduling_pass(self):
+        if not self._deferring:
+            self.run_all_tasks()
+            self._deferring = self.fast_path and self._queued_tasks == 0
+
+    def _take_started_tasks(self):
+        started_tasks = self.started_tasks
+        self.started_tasks = []
+        return started_tasks
+
+    def _submit_tasks(self, tasks):
+        if self.machines is not None:
+            for task in tasks:
+                if not self.machines.fits_empty(task.demands):
+                    raise ValueError('Task %s does not fit in any machine' %
+                                     task.task_id)
+        if self._deferring and self._start_tasks_now(tasks):
+            return
+
+        self._sync_users()
+        self._deferring = False
         for task in tasks:
-            if task.submit_time < self.current_time:
-                raise RuntimeError('Task arrived in the future! Must provide '
-                                   'tasks in chronological order.')
-            if task.submit_time > simulation_limit:
-                self._finish_tasks_until(simulation_limit)
-                return
-            if task.submit_time > self.current_time:
-                self._finish_tasks_until(task.submit_time)
-                self.current_time = task.submit_time
-            self._insert_user(task.user)
             self.users_queues[task.user].append(task)
-        self._finish_tasks_until(simulation_limit)
+        self._queued_tasks += len(tasks)
+        # the allocations don't change while tasks arrive, inserting each user
+        # once is the same as once per task
+        for user in sorted(set(task.user for task in tasks)):
+            self._insert_user(user)
+
+    def _start_tasks_now(self, tasks):
+        """
+        Starts the tasks (while nobody is waiting) if the exact path would
+        start all of them, in the same order
+        :return: False if they must go through the queues
+        """
+        user = tasks[0].user
+        # the exact path starts the tasks of different users in the order of
+        # their priorities, which are not kept up to date here, and the
+        # resources consumed would be added up in another order
+        if any(task.user != user for task in tasks):
+            return False
+        # resources consumed before each task starts, added one task at a
+        # time (cumsum is sequential) and checked as _pick_from_queue does
+        demands = np.array([task.demands for task in tasks])
+        consumed = np.cumsum(np.vstack([self.consumed_resources, demands]),
+                             axis=0)
+        if np.any(demands > self._capacities - consumed[:-1]):
+            return False
+        if self.allocation_history is None:
+            self.consumed_resources[:] = consumed[-1]
+            self.allocations[user] = np.cumsum(
+                np.vstack([self.allocations[user], demands]), axis=0)[-1]
+            for task in tasks:
+                self._add_running_task(task)
+        else:
+            for task in tasks:
+                self._start_task(task)
+        self._defer_user_update(user)
+        return True
+
+    def _defer_user_update(self, user):
+        self._deferred_updates[user].append((self.current_time,
+                                             self.allocations[user].copy()))
+
+    def _sync_users(self):
+        for user, updates in self._deferred_updates.iteritems():
+            self._replay_user(user, updates)
+        self._deferred_updates.clear()
 
     def _finish_tasks_until(self, next_time):
-        while True:
+        while not self._deferring:
             self.run_all_tasks()
-            next_task = self.running_tasks.get_min()
-            if next_task is None or next_task.finish_time > next_time:
+            # nobody is waiting and every user was removed from the queues by
+            # run_all_tasks, until a task has to wait again there is no need
+            # to update the queues
+            self._deferring = self.fast_path and self._queued_tasks == 0
+            if self._deferring:
                 break
-            self.current_time = next_task.finish_time
-            self.consumed_resources -= next_task.demands
-            self.allocations[next_task.user] -= next_task.demands
-            self.finished_tasks.append(self.running_tasks.pop())
-            self.finish_task(next_task)
+            next_event = self.running_tasks.get_min()
+            if next_event is None or next_event[0] > next_time:
+                return
+            if not self.coalesce_events:
+                self.running_tasks.pop()
+                self.finish_task(self._finish_running_task(next_event[1]))
+            elif next_event[0] < next_time:
+                self._finish_simultaneous_tasks(next_event[0])
+            else:
+                # the scheduling pass for next_time must wait for the tasks
+                # arriving at next_time
+                self._finish_simultaneous_tasks(next_time)
+                return
+
+        # finishing tasks can't start others when nobody is waiting, so all
+        # of them can be taken at once
+        for _, task_id in self.running_tasks.pop_until(next_time):
+            task = self._finish_running_task(task_id)
+            self._defer_user_update(task.user)
+
+    def _finish_simultaneous_tasks(self, time):
+        last_finished = {}
+        for _, task_id in self.running_tasks.pop_until(time):
+            task = self._finish_running_task(task_id)
+            last_finished[task.user] = task
+        for user in sorted(last_finished):
+            self.finish_task(last_finished[user])
+
+    def _advance_time(self, next_time):
+        # the system state remains the same between events, so this is the
+        # place to observe it at any time in [current_time, next_time]
+        self.current_time = next_time
 
     def _pick_from_queue(self, queue, constraints=None):
         """
@@ -142,6 +449,9 @@ class Arrival(object):
             return demands[1] <= available_resource[1]
             # return np.all(task.demands <= self._capacities)
 
+        if self.machines is not None:
+            system_fulfills_request = self._system_fulfills_request
+
         for user in queue.sorted_elements():
             if user is None:
                 break
@@ -160,10 +470,9 @@ class Arrival(object):
             if not pass_constraints:
                 queue.remove(user)
             elif system_fulfills_request(task.demands):
-                picked_task = self.users_queues[user].popleft()
                 # no need to remove the user from the queue here, it will be
                 # removed just after when we update its usage
-                return picked_task
+                return self._pop_task(user)
             else:
                 # the user with best priority cannot be fulfilled, stop
                 self._system_full = True
@@ -171,5 +480,42 @@ class Arrival(object):
 
         return None
 
+    def _pop_task(self, user):
+        self._queued_tasks -= 1
+        return self.users_queues[user].popleft()
+
+    def _system_fulfills_request(self, demands):
+        if self.machines is not None:
+            self._placement = self.machines.find(demands)
+            return self._placement is not None
+        available_resource = self._capacities - self.consumed_resources
+        if demands[0] > available_resource[0]:
+            return False
+        return demands[1] <= available_resource[1]
+
     def print_stats(self, extra_info=None):
         pass
+
+
+def simulate_in_lockstep(allocators, tasks, simulation_limit=None):
+    """
+    Simulates the same tasks with several allocators, the tasks are read only
+    once and every allocator after the first gets copies of them
+    :param allocators: list of Arrival
+    :param tasks: tasks generator, see Arrival.simulate
+    """
+    if simulation_limit is None:
+        simulation_limit = np.inf
+    for submit_time, arrivals in itertools.groupby(
+            tasks, attrgetter('submit_time')):
+        if submit_time > simulation_limit:
+            break
+        arrivals = list(arrivals)
+        # allocators change the start and finish times of the tasks
+        copies = [[task.copy() for task in arrivals]
+                  for _ in allocators[1:]]
+        for allocator, allocator_arrivals in zip(allocators,
+                                                 [arrivals] + copies):
+            allocator._simulate_arrivals(submit_time, allocator_arrivals)
+    for allocator in allocators:
+        allocator._end_simulation(simulation_limit)
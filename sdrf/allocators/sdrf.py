@@ -4,7 +4,7 @@ from math import log
 
 from . import Arrival, Task
 from ..helpers.priority_queue import PriorityQueue
-from ..helpers.live_tree import LiveTree, Element
+from ..helpers.live_tree import BucketedLiveTree, LiveTree, Element
 
 
 # Using those indexes make stuff less generic, but generality was kinda
@@ -23,16 +23,41 @@ time_scale_multiplier = 1e6  # using seconds
 # there must be a separate commitment for each resource and user
 class SDRF(Arrival):
     def __init__(self, capacities, users_resources_dict, delta, start_time,
-                 initial_commitments=None, keep_history=False):
+                 initial_commitments=None, keep_history=False,
+                 snapshot_interval=None, fast_path=False,
+                 coalesce_events=False, online=False, buckets=None,
+                 epoch=None, machines=None, placement='first_fit'):
         """
         :param capacities: array with capacities for each resource
         :param users_resources_dict: dict with users resources user:[resources]
+        :param fast_path: (optional) start tasks that fit right away when
+        nobody is waiting, only for tasks of a single user arriving at the
+        same time, see Arrival
+        :param coalesce_events: (optional) a single scheduling pass for all
+        the events with the same timestamp, see Arrival
+        :param online: (optional) events are given through submit_tasks,
+        finish_tasks and advance instead of simulate, see Arrival
+        :param snapshot_interval: (optional) when provided, the commitments of
+        all users are recorded every snapshot_interval (in the tasks time
+        unit), see save_snapshots
+        :param buckets: (optional) split the users in this many buckets, each
+        with its own LiveTree, see BucketedLiveTree. The result is the same,
+        but fewer crossings are processed when there are many users
+        :param epoch: (optional) approximate SDRF, commitments are only
+        brought up to date (and users reordered) at multiples of epoch (in
+        the tasks time unit) since start_time, see QueueProxy
+        :param machines: (optional) cpu and memory of each machine, tasks are
+        placed in them with placement, see Arrival
         """
         num_users = len(users_resources_dict)
 
-        super(SDRF, self).__init__(capacities, num_users, keep_history)
+        super(SDRF, self).__init__(capacities, num_users, keep_history,
+                                   fast_path, coalesce_events, online,
+                                   machines, placement)
 
         self.current_time = start_time
+        self.time_origin = start_time
+        self.epoch = epoch
 
         users_resources = [0]*num_users
         for user, resource in users_resources_dict.iteritems():
@@ -62,12 +87,60 @@ class SDRF(Arrival):
             mem_share = system_mem / num_users
 
             # in the beginning all users are idle
-            self.idle_users[user] = Element(user, self.current_time, self.tau,
+            self.idle_users[user] = Element(user, 0.0, self.tau,
                                             system_cpu, cred_cpu, cpu_relativ,
                                             cpu_share, system_mem, cred_mem,
                                             mem_relativ, mem_share)
 
-        self.user_commitments_queue = QueueProxy(self)
+        if buckets is None:
+            self.user_commitments_queue = QueueProxy(self)
+        else:
+            self.user_commitments_queue = BucketedQueueProxy(self, buckets)
+
+        self.snapshot_interval = snapshot_interval
+        self._next_snapshot = start_time
+        self.snapshots = []
+
+    def commitment_snapshot(self, time=None):
+        """
+        Commitments of every user (active or idle) at the given time
+        :param time: (optional) defaults to the current time, must not be
+        before the last event
+        :return: dict with cpu_commitment, memory_commitment, priority and
+        update_time arrays indexed by user
+        """
+        if time is None:
+            time = self.current_time
+        idle_elements = [self.idle_users[u] for u in xrange(self.num_users)]
+        cpu, memory, priority, update_time = \
+            self.user_commitments_queue.snapshot(idle_elements, time)
+        return {'cpu_commitment': cpu, 'memory_commitment': memory,
+                'priority': priority, 'update_time': update_time}
+
+    def save_snapshots(self, saving_file):
+        users = [None] * self.num_users
+        for user_id, user in Task._user_index.iteritems():
+            if user < self.num_users:
+                users[user] = user_id
+        data = {'time': np.array([t for t, _ in self.snapshots]),
+                'user_id': np.array(users, dtype=str)}
+        for key in ['cpu_commitment', 'memory_commitment', 'priority',
+                    'update_time']:
+            data[key] = np.array([s[key] for _, s in self.snapshots])
+        np.savez_compressed(saving_file, **data)
+
+    def _advance_time(self, next_time):
+        if self.snapshot_interval is not None:
+            if self._next_snapshot <= next_time:
+                # the commitments of deferred users are only known after the
+                # replay
+                self._sync_users()
+            while self._next_snapshot <= next_time:
+                self.snapshots.append((self._next_snapshot,
+                                       self.commitment_snapshot(
+                                           self._next_snapshot)))
+                self._next_snapshot += self.snapshot_interval
+        super(SDRF, self)._advance_time(next_time)
 
     def _insert_user(self, user):
         cpu_relative_allocation = self.allocations[user][cpu_index] - \
@@ -77,6 +150,18 @@ class SDRF(Arrival):
         self.user_commitments_queue.add(user, cpu_relative_allocation,
                                           memory_relative_allocation)
 
+    def _replay_user(self, user, updates):
+        # while deferring users are idle, so it's enough to go through the
+        # same updates on their idle element
+        element = self.idle_users[user]
+        for time, allocation in updates:
+            element.update(self.user_commitments_queue._native_time(time))
+            element.cpu_relative_allocation = \
+                allocation[cpu_index] - self._user_resources[user][cpu_index]
+            element.memory_relative_allocation = \
+                allocation[memory_index] - \
+                self._user_resources[user][memory_index]
+
     def pick_task(self):
         return self._pick_from_queue(self.user_commitments_queue)
 
@@ -91,7 +176,8 @@ class SDRF(Arrival):
     def print_stats(self, extra_info=None):
         info_dict = {
             'delta': self.delta,
-            'capacities': list(self._capacities)
+            'capacities': list(self._capacities),
+            'exp_count': self.user_commitments_queue.exp_count()
         }
         if extra_info is not None:
             info_dict['extra_info'] = extra_info
@@ -100,7 +186,10 @@ class SDRF(Arrival):
 
 class ReservedSDRF(SDRF):
     def __init__(self, capacities, users_resources_dict, delta, start_time,
-                 initial_commitments=None, keep_history=False):
+                 initial_commitments=None, keep_history=False,
+                 snapshot_interval=None, fast_path=False,
+                 coalesce_events=False, online=False, buckets=None,
+                 epoch=None, machines=None, placement='first_fit'):
         """
         :param capacities: array with capacities for each resource
         :param users_resources_dict: dict with users resources user:[resources]
@@ -108,47 +197,83 @@ class ReservedSDRF(SDRF):
         super(ReservedSDRF, self).__init__(capacities, users_resources_dict,
                                             delta, start_time,
                                             initial_commitments,
-                                            keep_history)
+                                            keep_history, snapshot_interval,
+                                            fast_path, coalesce_events, online,
+                                            buckets, epoch, machines,
+                                            placement)
 
-        self._user_resources_queue = PriorityQueue(np.zeros(self.num_users))
+        # only users whose next task fits in their reserved resources are kept
+        # in this queue, the first stage is then just a look at its head
+        self._user_resources_queue = PriorityQueue()
 
-    def _insert_user_resources_heap(self, user):
-        # same as wDRF when user_resources/capacities are used as the weight
-        res_left = np.max(self.allocations[user] / self._user_resources[user])
+    def _user_fulfills_request(self, task):
+        user_alloc = self.allocations[task.user]
+        return np.all((user_alloc + task.demands)
+                      <= self._user_resources[task.user])
 
-        # don't bother adding when users are using more than they have (their
-        # share is >= 1)
-        if res_left < 1:
-            self._user_resources_queue.add(user, res_left)
+    def _insert_user_resources_heap(self, user):
+        # called whenever the user allocation or next task changes
+        queue = self.users_queues[user]
+        if queue and self._user_fulfills_request(queue[0]):
+            # same as wDRF when user_resources/capacities are used as the
+            # weight
+            res_left = np.max(self.allocations[user] /
+                              self._user_resources[user])
+
+            # don't bother adding when users are using more than they have
+            # (their share is >= 1)
+            if res_left < 1:
+                self._user_resources_queue.add(user, res_left)
+                return
+
+        if user in self._user_resources_queue.finder:
+            self._user_resources_queue.remove(user)
 
     def _insert_user(self, user):
         self._insert_user_resources_heap(user)
         super(ReservedSDRF, self)._insert_user(user)
 
     def pick_task(self):
-        def user_fulfills_request(task):
-            user_alloc = self.allocations[task.user]
-            return np.all((user_alloc + task.demands)
-                          <= self._user_resources[task.user])
-
-        picked_task = self._pick_from_queue(self._user_resources_queue,
-                                            user_fulfills_request)
-        if self._system_full:
+        self._system_full = False
+        user = self._user_resources_queue.get_min()
+        if user is None:
+            return super(ReservedSDRF, self).pick_task()
+
+        task = self.users_queues[user][0]
+        if not self._system_fulfills_request(task.demands):
+            # the user with best priority cannot be fulfilled, stop
+            self._system_full = True
             return None
 
-        if picked_task is None:
-            picked_task = super(ReservedSDRF, self).pick_task()
-
-        return picked_task
+        return self._pop_task(user)
 
 
 # This class has 2 main purposes, to make sure the commitment remains up to
-# date when the user is removed and to guarantee that only the name goes out
+# date when the user is removed and to guarantee that only the name goes out.
+# It also rebases times to the simulation start (time_origin) before they
+# reach the native code, so that they keep their precision even when the
+# library is compiled with double instead of long double.
+# With an epoch, times are also rounded down to the beginning of their epoch.
+# The tree then only moves (and processes the crossings) once per epoch and
+# commitments account for allocation changes as if they happened at the
+# beginning of the epoch, which bounds the error of every commitment to what
+# an allocation change adds to it in one epoch
 class QueueProxy(LiveTree):
-    def __init__(self, sdrf_obj):
-        super(QueueProxy, self).__init__()
+    def __init__(self, sdrf_obj, *args):
+        """
+        :param args: passed to the tree
+        """
+        super(QueueProxy, self).__init__(*args)
         self.sdrf_obj = sdrf_obj
 
+    def _native_time(self, current_time=None):
+        if current_time is None:
+            current_time = self.sdrf_obj.current_time
+        time = current_time - self.sdrf_obj.time_origin
+        if self.sdrf_obj.epoch is not None:
+            time -= time % self.sdrf_obj.epoch
+        return time
+
     def sorted_elements(self):
         self.update()
         return (e.name for e in super(QueueProxy, self).sorted_elements())
@@ -158,7 +283,7 @@ class QueueProxy(LiveTree):
             self.remove(user_name)
 
         element = self.sdrf_obj.idle_users[user_name]
-        element.update(self.sdrf_obj.current_time)
+        element.update(self._native_time())
 
         element.cpu_relative_allocation = cpu_relative_alloc
         element.memory_relative_allocation = memory_relative_alloc
@@ -166,26 +291,36 @@ class QueueProxy(LiveTree):
         super(QueueProxy, self).add(element)
 
     def update(self, current_time=None):
-        if current_time is None:
-            current_time = self.sdrf_obj.current_time
-        super(QueueProxy, self).update(current_time)
+        super(QueueProxy, self).update(self._native_time(current_time))
 
     def get_min(self, current_time=None):
-        if current_time is None:
-            current_time = self.sdrf_obj.current_time
-        return super(QueueProxy, self).get_min(current_time).name
+        return super(QueueProxy, self).get_min(
+            self._native_time(current_time)).name
 
     def pop(self, current_time=None):
-        if current_time is None:
-            current_time = self.sdrf_obj.current_time
-        element = super(QueueProxy, self).pop(current_time)
+        element = super(QueueProxy, self).pop(self._native_time(current_time))
         self._idle_element(element)
         return element.name
 
+    def snapshot(self, idle_elements, current_time=None):
+        # evaluated at the exact time, even with an epoch
+        if current_time is None:
+            current_time = self.sdrf_obj.current_time
+        cpu, memory, priority, update_time = super(QueueProxy, self).snapshot(
+            idle_elements, current_time - self.sdrf_obj.time_origin)
+        update_time += self.sdrf_obj.time_origin
+        return cpu, memory, priority, update_time
+
     def remove(self, name):
         removed_element = super(QueueProxy, self).remove(name)
         self._idle_element(removed_element)
 
     def _idle_element(self, element):
-        element.update(self.sdrf_obj.current_time)
+        element.update(self._native_time())
         self.sdrf_obj.idle_users[element.name] = element
+
+
+# QueueProxy on top of a BucketedLiveTree (its calls to the tree go to the
+# BucketedLiveTree methods), created with the number of buckets
+class BucketedQueueProxy(QueueProxy, BucketedLiveTree):
+    pass
@@ -2,7 +2,7 @@
 import numpy as np
 
 from . import Arrival, Task
-from ..helpers.priority_queue import PriorityQueue
+from ..helpers.live_tree import DominantShareQueue
 
 
 # arrival allocations are simpler, they just decide which task to run based on
@@ -14,12 +14,24 @@ from ..helpers.priority_queue import PriorityQueue
 
 class WDRF(Arrival):
     def __init__(self, capacities, num_users, users_weights_dict=None,
-                 keep_history=False):
+                 keep_history=False, fast_path=False, coalesce_events=False,
+                 online=False, machines=None, placement='first_fit'):
         """
         :param capacities: array with system capacities for each resource
         :param weights: each user's resources weight
+        :param fast_path: (optional) start tasks that fit right away when
+        nobody is waiting, only for tasks of a single user arriving at the
+        same time, see Arrival
+        :param coalesce_events: (optional) a single scheduling pass for all
+        the events with the same timestamp, see Arrival
+        :param online: (optional) events are given through submit_tasks,
+        finish_tasks and advance instead of simulate, see Arrival
+        :param machines: (optional) cpu and memory of each machine, tasks are
+        placed in them with placement, see Arrival
         """
-        super(WDRF, self).__init__(capacities, num_users, keep_history)
+        super(WDRF, self).__init__(capacities, num_users, keep_history,
+                                   fast_path, coalesce_events, online,
+                                   machines, placement)
 
         weights = [[1, 1]] * num_users
         if users_weights_dict is not None:
@@ -27,15 +39,34 @@ class WDRF(Arrival):
                 weights[Task._user_index[user]] = weight  # HACK!
 
         self.weights = np.array(weights)
-        self.dominant_share_queue = PriorityQueue()
+        self.dominant_share_queue = DominantShareQueue(
+            num_users, self._capacities[0], self._capacities[1], self.weights)
 
     def _insert_user(self, user):
-        dominant_share = np.max(self.allocations[user] / self._capacities /
-                                self.weights[user])
-        self.dominant_share_queue.add(user, dominant_share)
+        # the queue computes the dominant share from the allocation and only
+        # keeps users with waiting tasks
+        if self.users_queues[user]:
+            self.dominant_share_queue.add(user, self.allocations[user],
+                                          self.users_queues[user][0].demands)
+        else:
+            self.dominant_share_queue.remove(user)
 
     def pick_task(self):
-        return self._pick_from_queue(self.dominant_share_queue)
+        self._system_full = False
+        user = self.dominant_share_queue.pick(self._capacities -
+                                              self.consumed_resources)
+        if user == DominantShareQueue.SYSTEM_FULL:
+            # the user with best priority cannot be fulfilled, stop
+            self._system_full = True
+            return None
+        if user == DominantShareQueue.EMPTY:
+            return None
+        if self.machines is not None and not self._system_fulfills_request(
+                self.users_queues[user][0].demands):
+            # there are enough resources, but not in a single machine
+            self._system_full = True
+            return None
+        return self._pop_task(user)
 
     def finish_task(self, task):
         self._insert_user(task.user)
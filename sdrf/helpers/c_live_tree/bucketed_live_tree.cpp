@@ -0,0 +1,221 @@
+//
+// Bucketed Live Tree
+// Live Tree split in buckets, for a large number of elements
+//
+
+#include <algorithm>
+#include <cmath>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include "element.h"
+#include "live_tree.h"
+#include "bucketed_live_tree.h"
+
+
+BucketedLiveTree::Iterator::Iterator(BucketedLiveTree& tree) : tree(tree) {
+  heads_it = tree.heads.cbegin();
+}
+
+bool BucketedLiveTree::Iterator::is_end() const {
+  skip_opened();
+  return heads_it == tree.heads.cend() && open_buckets.empty();
+}
+
+const Element& BucketedLiveTree::Iterator::operator*() const {
+  if (from_heads()) {
+    return heads_it->first;
+  }
+  return open_buckets.front().first->first;
+}
+
+BucketedLiveTree::Iterator& BucketedLiveTree::Iterator::operator++() {
+  if (from_heads()) {
+    unsigned bucket = tree.bucket_of(heads_it->first.name);
+    ++heads_it;
+    opened.insert(bucket);
+    open(bucket, std::next(tree.buckets[bucket].cbegin()));
+  } else {
+    auto greater = [](const bucket_position& a, const bucket_position& b) {
+      return b.first->first < a.first->first;
+    };
+    std::pop_heap(open_buckets.begin(), open_buckets.end(), greater);
+    bucket_position position = open_buckets.back();
+    open_buckets.pop_back();
+    open(position.second, std::next(position.first));
+  }
+  return *this;
+}
+
+// the next element is the first of a bucket not reached yet
+bool BucketedLiveTree::Iterator::from_heads() const {
+  skip_opened();
+  if (heads_it == tree.heads.cend()) {
+    return false;
+  }
+  if (open_buckets.empty()) {
+    return true;
+  }
+  return heads_it->first < open_buckets.front().first->first;
+}
+
+// Elements already reached may be removed while iterating. When the minimum
+// of a bucket is removed, the next one takes its place in the heads, but it
+// was already reached through the bucket
+void BucketedLiveTree::Iterator::skip_opened() const {
+  while (heads_it != tree.heads.cend() &&
+         opened.count(tree.bucket_of(heads_it->first.name))) {
+    ++heads_it;
+  }
+}
+
+void BucketedLiveTree::Iterator::open(
+    unsigned bucket, LiveTree::elements_map::const_iterator it) {
+  if (it == tree.buckets[bucket].cend()) {
+    return;
+  }
+  // elements of different buckets are only compared at the current time
+  if (it->first.get_update_time() < tree.last_time) {
+    it->first.update(tree.last_time);
+  }
+  auto greater = [](const bucket_position& a, const bucket_position& b) {
+    return b.first->first < a.first->first;
+  };
+  open_buckets.emplace_back(it, bucket);
+  std::push_heap(open_buckets.begin(), open_buckets.end(), greater);
+}
+
+
+BucketedLiveTree::BucketedLiveTree(unsigned num_buckets)
+    : last_time(-1), buckets(num_buckets), has_head(num_buckets, false),
+      head_names(num_buckets, 0), bucket_events(num_buckets, events.end()) {
+  if (num_buckets == 0) {
+    throw std::invalid_argument("BucketedLiveTree needs at least one bucket");
+  }
+  for (LiveTree& bucket : buckets) {
+    bucket.set_decay_memo(&decay_memo);
+  }
+  heads.set_decay_memo(&decay_memo);
+}
+
+void BucketedLiveTree::add(Element element) {
+  if (element.get_update_time() > last_time) {
+    update(element.get_update_time());
+  }
+  unsigned bucket = bucket_of(element.name);
+  buckets[bucket].add(std::move(element));
+  refresh_bucket(bucket);
+}
+
+Element BucketedLiveTree::pop(lt_time_t current_time) {
+  if (empty()) {
+    throw std::out_of_range("LiveTree is empty");
+  }
+  update(current_time);
+  return remove(heads.get_min(current_time).name);
+}
+
+Element BucketedLiveTree::get_min(lt_time_t current_time) {
+  if (empty()) {
+    throw std::out_of_range("LiveTree is empty");
+  }
+  update(current_time);
+  return *find(heads.get_min(current_time).name);
+}
+
+Element BucketedLiveTree::remove(const lt_name_t& name) {
+  unsigned bucket = bucket_of(name);
+  Element removed_element = buckets[bucket].remove(name);
+  refresh_bucket(bucket);
+  return removed_element;
+}
+
+bool BucketedLiveTree::empty() const {
+  return heads.empty();
+}
+
+bool BucketedLiveTree::element_is_in(const lt_name_t& name) const {
+  return buckets[bucket_of(name)].element_is_in(name);
+}
+
+const Element* BucketedLiveTree::find(const lt_name_t& name) const {
+  return buckets[bucket_of(name)].find(name);
+}
+
+BucketedLiveTree::operator std::string() const {
+  std::string out_str = "{ ";
+  for (unsigned bucket = 0; bucket < buckets.size(); ++bucket) {
+    if (!buckets[bucket].empty()) {
+      out_str += std::to_string(bucket) + ": " +
+                 std::string(buckets[bucket]) + ", ";
+    }
+  }
+  if (out_str.size() == 2) {
+    out_str = "{}";
+  } else {
+    out_str[out_str.size() - 2] = ' ';
+    out_str[out_str.size() - 1] = '}';
+  }
+  return out_str;
+}
+
+void BucketedLiveTree::update(lt_time_t current_time) {
+  if (last_time > current_time) {
+    throw std::runtime_error("LiveTree can't go back in time...");
+  }
+  last_time = current_time;
+
+  std::vector<unsigned> due_buckets;
+  for (auto event_it = events.begin();
+       event_it != events.end() && event_it->first < current_time;
+       ++event_it) {
+    due_buckets.push_back(event_it->second);
+  }
+  for (unsigned bucket : due_buckets) {
+    buckets[bucket].update(current_time);
+    refresh_bucket(bucket);
+  }
+  heads.update(current_time);
+}
+
+DecayMemo* BucketedLiveTree::get_decay_memo() {
+  return &decay_memo;
+}
+
+unsigned long long BucketedLiveTree::get_exp_count() const {
+  return decay_memo.get_exp_count();
+}
+
+unsigned BucketedLiveTree::bucket_of(const lt_name_t& name) const {
+  return name % buckets.size();
+}
+
+// called whenever the elements of the bucket or their order change
+void BucketedLiveTree::refresh_bucket(unsigned bucket) {
+  LiveTree& bucket_tree = buckets[bucket];
+  if (bucket_events[bucket] != events.end()) {
+    events.erase(bucket_events[bucket]);
+  }
+  lt_time_t next_event = bucket_tree.next_event_time();
+  if (std::isfinite(next_event)) {
+    bucket_events[bucket] = events.emplace(next_event, bucket).first;
+  } else {
+    bucket_events[bucket] = events.end();
+  }
+
+  if (has_head[bucket] && (bucket_tree.empty() ||
+      bucket_tree.cbegin()->first.name != head_names[bucket])) {
+    heads.remove(head_names[bucket]);
+    has_head[bucket] = false;
+  }
+  if (!bucket_tree.empty() && !has_head[bucket]) {
+    Element head(bucket_tree.cbegin()->first);
+    if (head.get_update_time() < last_time) {
+      head.update(last_time);
+    }
+    head_names[bucket] = head.name;
+    has_head[bucket] = true;
+    heads.add(std::move(head));
+  }
+}
@@ -0,0 +1,84 @@
+//
+// Bucketed Live Tree
+// Live Tree split in buckets, for a large number of elements
+//
+
+#ifndef BUCKETED_LIVE_TREE_H
+#define BUCKETED_LIVE_TREE_H
+
+#include <set>
+#include <string>
+#include <vector>
+
+#include "element.h"
+#include "live_tree.h"
+
+
+/*
+ * Elements are split in buckets (by name), each one with its own LiveTree,
+ * and the minimum of every bucket is kept in a top-level LiveTree. Only the
+ * crossings between elements of the same bucket, or between bucket minima,
+ * are tracked. Elements of different buckets may cross any number of times
+ * without any event, unless they are both at the front of their buckets.
+ *
+ * Buckets are only updated when they have an event due (or when an element is
+ * added to them). The iterator goes through the elements in the same order as
+ * a single LiveTree, merging the buckets as they are reached.
+ */
+class BucketedLiveTree {
+ public:
+  typedef std::set<std::pair<lt_time_t, unsigned>> events_set; //time, bucket
+
+  class Iterator {
+   public:
+    Iterator(BucketedLiveTree& tree);
+    bool is_end() const;
+    const Element& operator*() const;
+    Iterator& operator++();
+
+   private:
+    typedef std::pair<LiveTree::elements_map::const_iterator, unsigned>
+      bucket_position; // next element of the bucket, bucket
+
+    BucketedLiveTree& tree;
+    mutable LiveTree::elements_map::const_iterator heads_it;
+    // buckets whose minimum was already reached, as a heap of their next
+    // element
+    std::vector<bucket_position> open_buckets;
+    std::set<unsigned> opened;
+
+    bool from_heads() const;
+    void skip_opened() const;
+    void open(unsigned bucket, LiveTree::elements_map::const_iterator it);
+  };
+
+  BucketedLiveTree(unsigned num_buckets);
+  BucketedLiveTree(const BucketedLiveTree&) = delete;
+  BucketedLiveTree& operator=(const BucketedLiveTree&) = delete;
+  void add(const Element element);
+  Element pop(lt_time_t current_time);
+  Element get_min(lt_time_t current_time);
+  Element remove(const lt_name_t& name);
+  bool empty() const;
+  bool element_is_in(const lt_name_t& name) const;
+  const Element* find(const lt_name_t& name) const;
+  operator std::string() const;
+  void update(lt_time_t current_time);
+  DecayMemo* get_decay_memo();
+  unsigned long long get_exp_count() const;
+
+ private:
+  lt_time_t last_time;
+  DecayMemo decay_memo; // shared by the buckets and the heads
+  std::vector<LiveTree> buckets;
+  LiveTree heads; // a copy of the minimum of every non-empty bucket
+  std::vector<bool> has_head;
+  std::vector<lt_name_t> head_names;
+  events_set events; // next event of every bucket
+  std::vector<events_set::iterator> bucket_events;
+
+  unsigned bucket_of(const lt_name_t& name) const;
+  void refresh_bucket(unsigned bucket);
+};
+
+#endif // BUCKETED_LIVE_TREE_H
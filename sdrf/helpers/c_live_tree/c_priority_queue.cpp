@@ -5,15 +5,19 @@
 #include <string>
 #include <cstring>
 #include <chrono>
+#include <limits>
 
 #include "element.h"
 #include "priority_queue.h"
 #include "live_tree.h"
+#include "bucketed_live_tree.h"
+#include "dominant_share_queue.h"
+#include "machine_index.h"
 
 struct QueueTimes {
   QueueTimes() : new_t(0), add_t(0), pop_t(0), get_min_t(0), cbegin_t(0), it_next_t(0),
   get_element_from_it_t(0), it_is_end_t(0), delete_it_t(0), remove_t(0), empty_t(0),
-  element_is_in_t(0), update_t(0), string_t(0), delete_t(0) {}
+  element_is_in_t(0), update_t(0), string_t(0), delete_t(0), snapshot_t(0) {}
   std::chrono::nanoseconds new_t;
   std::chrono::nanoseconds add_t;
   std::chrono::nanoseconds pop_t;
@@ -29,6 +33,7 @@ struct QueueTimes {
   std::chrono::nanoseconds update_t;
   std::chrono::nanoseconds string_t;
   std::chrono::nanoseconds delete_t;
+  std::chrono::nanoseconds snapshot_t;
   void print_stats_to_stream(char* info, std::ostream& stream) {
     stream << "{" << std::endl;
     stream << "  \"info\": " << info << "," << std::endl;
@@ -47,10 +52,11 @@ struct QueueTimes {
     stream << "  \"update\": " << update_t.count() << "," << std::endl;
     stream << "  \"string\": " << string_t.count() << "," << std::endl;
     stream << "  \"delete\": " << delete_t.count() << "," << std::endl;
+    stream << "  \"snapshot\": " << snapshot_t.count() << "," << std::endl;
     std::chrono::nanoseconds total = new_t + add_t + pop_t + get_min_t
             + cbegin_t + it_next_t + get_element_from_it_t + it_is_end_t
             + delete_it_t + remove_t + empty_t + element_is_in_t + update_t
-            + string_t + delete_t;
+            + string_t + delete_t + snapshot_t;
     stream << "  \"total\": " << total.count() << std::endl;
     stream << "}" << std::endl;
   }
@@ -83,6 +89,43 @@ static std::chrono::high_resolution_clock::time_point ref_time;
 static QueueTimes priority_queue_times;
 static QueueTimes live_tree_times;
 
+// Copy of an element of a queue for the caller, which may keep it after the
+// queue (and its decay memo) is deleted
+static Element* detached_copy(const Element& element) {
+  Element* copy = new Element(element);
+  copy->set_decay_memo(nullptr);
+  return copy;
+}
+
+// Evaluates the commitments of users 0..num_elements-1 at current_time
+// without changing any element. Users in the tree are read from the tree,
+// the others from idle_elements (indexed by name).
+template<typename Queue>
+static void snapshot(Queue* queue, Element** idle_elements, int num_elements,
+                     double current_time, double* cpu_commitment,
+                     double* memory_commitment, double* priority,
+                     double* update_time) {
+  for (int i = 0; i < num_elements; ++i) {
+    const Element* element = queue->find(i);
+    if (element == nullptr) {
+      element = idle_elements[i];
+    }
+    update_time[i] = element->get_update_time();
+    if (element->get_update_time() > current_time) {
+      cpu_commitment[i] = std::numeric_limits<double>::quiet_NaN();
+      memory_commitment[i] = std::numeric_limits<double>::quiet_NaN();
+      priority[i] = std::numeric_limits<double>::quiet_NaN();
+      continue;
+    }
+    Element cpy(*element);
+    cpy.set_decay_memo(queue->get_decay_memo());
+    cpy.update(current_time);
+    cpu_commitment[i] = cpy.get_cpu_commitment();
+    memory_commitment[i] = cpy.get_memory_commitment();
+    priority[i] = cpy.get_priority();
+  }
+}
+
 extern "C" {
   typedef PriorityQueue::elements_set::const_iterator PriorityQueue_it;
   typedef LiveTree::elements_map::const_iterator LiveTree_it;
@@ -106,7 +149,7 @@ extern "C" {
   Element* PriorityQueue_pop(PriorityQueue* queue, double current_time) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(queue->pop(current_time));
+    Element* element = detached_copy(queue->pop(current_time));
 
     priority_queue_times.pop_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -114,7 +157,7 @@ extern "C" {
   Element* PriorityQueue_get_min(PriorityQueue* queue, double current_time) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(queue->get_min(current_time));
+    Element* element = detached_copy(queue->get_min(current_time));
 
     priority_queue_times.get_min_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -137,7 +180,7 @@ extern "C" {
   Element* PriorityQueue_get_element_from_it(PriorityQueue_it* it) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(**it);
+    Element* element = detached_copy(**it);
 
     priority_queue_times.get_element_from_it_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -160,7 +203,7 @@ extern "C" {
   Element* PriorityQueue_remove(PriorityQueue* queue, lt_name_t name) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(queue->remove(name));
+    Element* element = detached_copy(queue->remove(name));
 
     priority_queue_times.remove_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -205,6 +248,9 @@ extern "C" {
   void PriorityQueue_print_stats(char* info, char* file_name) {
     priority_queue_times.print_stats(info, file_name);
   }
+  unsigned long long PriorityQueue_get_exp_count(PriorityQueue* queue) {
+    return queue->get_exp_count();
+  }
 
 
   LiveTree* LiveTree_new() {
@@ -227,7 +273,7 @@ extern "C" {
                                     double current_time) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(queue->pop(current_time));
+    Element* element = detached_copy(queue->pop(current_time));
 
     live_tree_times.pop_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -236,7 +282,7 @@ extern "C" {
                                         double current_time) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(queue->get_min(current_time));
+    Element* element = detached_copy(queue->get_min(current_time));
 
     live_tree_times.get_min_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -261,7 +307,7 @@ extern "C" {
           LiveTree_it* it) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element((*it)->first);
+    Element* element = detached_copy((*it)->first);
 
     live_tree_times.get_element_from_it_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -286,7 +332,7 @@ extern "C" {
                                        lt_name_t name) {
     ref_time = std::chrono::high_resolution_clock::now();
 
-    Element* element = new Element(queue->remove(name));
+    Element* element = detached_copy(queue->remove(name));
 
     live_tree_times.remove_t += std::chrono::high_resolution_clock::now() - ref_time;
     return element;
@@ -331,12 +377,164 @@ extern "C" {
 
     live_tree_times.delete_t += std::chrono::high_resolution_clock::now() - ref_time;
   }
+  void LiveTree_snapshot(LiveTree* queue, Element** idle_elements,
+                         int num_elements, double current_time,
+                         double* cpu_commitment, double* memory_commitment,
+                         double* priority, double* update_time) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    snapshot(queue, idle_elements, num_elements, current_time, cpu_commitment,
+             memory_commitment, priority, update_time);
+
+    live_tree_times.snapshot_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
   void LiveTree_print_stats(char* info, char* file_name) {
     int insert_count = LiveTree::get_insert_count();
     int update_count = LiveTree::get_update_count();
     int events_count = LiveTree::get_events_count();
     live_tree_times.print_stats(info, file_name, insert_count, update_count, events_count);
   }
+  unsigned long long LiveTree_get_exp_count(LiveTree* queue) {
+    return queue->get_exp_count();
+  }
+
+
+  // the bucketed live tree is timed as a LiveTree, as they are used the same
+  // way
+  typedef BucketedLiveTree::Iterator BucketedLiveTree_it;
+
+  BucketedLiveTree* BucketedLiveTree_new(unsigned num_buckets) {
+    live_tree_times = QueueTimes();
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    BucketedLiveTree* ptr = new BucketedLiveTree(num_buckets);
+
+    live_tree_times.new_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return ptr;
+  }
+  void BucketedLiveTree_add(BucketedLiveTree* queue, Element* element) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    queue->add(*element);
+
+    live_tree_times.add_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  Element* BucketedLiveTree_pop(BucketedLiveTree* queue, double current_time) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    Element* element = detached_copy(queue->pop(current_time));
+
+    live_tree_times.pop_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return element;
+  }
+  Element* BucketedLiveTree_get_min(BucketedLiveTree* queue,
+                                    double current_time) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    Element* element = detached_copy(queue->get_min(current_time));
+
+    live_tree_times.get_min_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return element;
+  }
+  BucketedLiveTree_it* BucketedLiveTree_cbegin(BucketedLiveTree* queue) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    BucketedLiveTree_it* it = new BucketedLiveTree_it(*queue);
+
+    live_tree_times.cbegin_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return it;
+  }
+  void BucketedLiveTree_it_next(BucketedLiveTree_it* it) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    ++(*it);
+
+    live_tree_times.it_next_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  Element* BucketedLiveTree_get_element_from_it(BucketedLiveTree_it* it) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    Element* element = detached_copy(**it);
+
+    live_tree_times.get_element_from_it_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return element;
+  }
+  int BucketedLiveTree_it_is_end(BucketedLiveTree_it* it) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    bool is_end = it->is_end();
+
+    live_tree_times.it_is_end_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return is_end;
+  }
+  void BucketedLiveTree_delete_it(BucketedLiveTree_it* it) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    delete it;
+
+    live_tree_times.delete_it_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  Element* BucketedLiveTree_remove(BucketedLiveTree* queue, lt_name_t name) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    Element* element = detached_copy(queue->remove(name));
+
+    live_tree_times.remove_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return element;
+  }
+  int BucketedLiveTree_empty(BucketedLiveTree* queue) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    bool is_empty = queue->empty();
+
+    live_tree_times.empty_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return is_empty;
+  }
+  int BucketedLiveTree_element_is_in(BucketedLiveTree* queue, lt_name_t name) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    bool is_in = queue->element_is_in(name);
+
+    live_tree_times.element_is_in_t += std::chrono::high_resolution_clock::now() - ref_time;
+    return is_in;
+  }
+  void BucketedLiveTree_update(BucketedLiveTree* queue, double current_time) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    queue->update(current_time);
+
+    live_tree_times.update_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  void BucketedLiveTree_string(BucketedLiveTree* queue, char* buffer,
+                               int max_size) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    std::strncpy(buffer, std::string(*queue).c_str(), max_size);
+
+    live_tree_times.string_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  void BucketedLiveTree_delete(BucketedLiveTree* queue) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    delete queue;
+
+    live_tree_times.delete_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  void BucketedLiveTree_snapshot(BucketedLiveTree* queue,
+                                 Element** idle_elements, int num_elements,
+                                 double current_time, double* cpu_commitment,
+                                 double* memory_commitment, double* priority,
+                                 double* update_time) {
+    ref_time = std::chrono::high_resolution_clock::now();
+
+    snapshot(queue, idle_elements, num_elements, current_time, cpu_commitment,
+             memory_commitment, priority, update_time);
+
+    live_tree_times.snapshot_t += std::chrono::high_resolution_clock::now() - ref_time;
+  }
+  unsigned long long BucketedLiveTree_get_exp_count(BucketedLiveTree* queue) {
+    return queue->get_exp_count();
+  }
 
 
   Element* Element_new(lt_name_t name, double update_time, double tau,
@@ -352,6 +550,70 @@ extern "C" {
   void Element_update(Element* element, double current_time) {
     element->update(current_time);
   }
+  DominantShareQueue* DominantShareQueue_new(lt_name_t num_users,
+                                             double system_cpu,
+                                             double system_memory) {
+    return new DominantShareQueue(num_users, system_cpu, system_memory);
+  }
+  void DominantShareQueue_set_weights(DominantShareQueue* queue,
+                                      lt_name_t name, double cpu_weight,
+                                      double memory_weight) {
+    queue->set_weights(name, cpu_weight, memory_weight);
+  }
+  void DominantShareQueue_add(DominantShareQueue* queue, lt_name_t name,
+                              double cpu_allocation, double memory_allocation,
+                              double cpu_demand, double memory_demand) {
+    queue->add(name, cpu_allocation, memory_allocation, cpu_demand,
+               memory_demand);
+  }
+  void DominantShareQueue_remove(DominantShareQueue* queue, lt_name_t name) {
+    queue->remove(name);
+  }
+  long DominantShareQueue_pick(DominantShareQueue* queue, double available_cpu,
+                               double available_memory) {
+    return queue->pick(available_cpu, available_memory);
+  }
+  double DominantShareQueue_get_dominant_share(DominantShareQueue* queue,
+                                               lt_name_t name) {
+    return queue->get_dominant_share(name);
+  }
+  bool DominantShareQueue_element_is_in(DominantShareQueue* queue,
+                                        lt_name_t name) {
+    return queue->element_is_in(name);
+  }
+  bool DominantShareQueue_empty(DominantShareQueue* queue) {
+    return queue->empty();
+  }
+  void DominantShareQueue_delete(DominantShareQueue* queue) {
+    delete queue;
+  }
+  MachineIndex* MachineIndex_new(unsigned num_machines,
+                                 const double* cpu_capacities,
+                                 const double* memory_capacities,
+                                 bool best_fit) {
+    return new MachineIndex(num_machines, cpu_capacities, memory_capacities,
+                            best_fit);
+  }
+  long MachineIndex_find(MachineIndex* index, double cpu, double memory) {
+    return index->find(cpu, memory);
+  }
+  void MachineIndex_allocate(MachineIndex* index, unsigned machine,
+                             double cpu, double memory) {
+    index->allocate(machine, cpu, memory);
+  }
+  void MachineIndex_release(MachineIndex* index, unsigned machine, double cpu,
+                            double memory) {
+    index->release(machine, cpu, memory);
+  }
+  double MachineIndex_get_free_cpu(MachineIndex* index, unsigned machine) {
+    return index->get_free_cpu(machine);
+  }
+  double MachineIndex_get_free_memory(MachineIndex* index, unsigned machine) {
+    return index->get_free_memory(machine);
+  }
+  void MachineIndex_delete(MachineIndex* index) {
+    delete index;
+  }
   lt_name_t Element_get_name(Element* element) {
     return element->get_name();
   }
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 rm *.o
-rm lib_c_priority_queue.so
+rm lib_c_priority_queue.so lib_c_priority_queue_double.so
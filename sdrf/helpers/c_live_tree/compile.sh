@@ -1,2 +1,13 @@
 #!/usr/bin/env bash
-g++ -fdiagnostics-color=always -shared -fPIC -O3 --std=c++11 -march=native -Wall -Wextra -pedantic -o lib_c_priority_queue.so c_priority_queue.cpp live_tree.cpp priority_queue.cpp element.cpp
+# usage: bash compile.sh [long_double|double]
+# The double build is faster but less precise, to use it set the environment
+# variable SDRF_PRECISION=double when running the simulator.
+PRECISION=${1:-long_double}
+if [ "$PRECISION" == "double" ]; then
+  FLAGS="-DLT_DOUBLE"
+  LIB=lib_c_priority_queue_double.so
+else
+  FLAGS=""
+  LIB=lib_c_priority_queue.so
+fi
+g++ -fdiagnostics-color=always -shared -fPIC -O3 --std=c++11 -march=native -Wall -Wextra -pedantic $FLAGS -o $LIB c_priority_queue.cpp live_tree.cpp priority_queue.cpp element.cpp dominant_share_queue.cpp bucketed_live_tree.cpp machine_index.cpp
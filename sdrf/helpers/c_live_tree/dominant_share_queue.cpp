@@ -0,0 +1,79 @@
+
+#include <algorithm>
+#include <set>
+#include <vector>
+#include <stdexcept>
+
+#include "dominant_share_queue.h"
+
+
+DominantShareQueue::DominantShareQueue(lt_name_t num_users, double system_cpu,
+                                       double system_memory)
+    : system_cpu(system_cpu), system_memory(system_memory),
+      users(num_users, User{0, 0, 1, 1, 0, 0, false, users_set::iterator()}) {}
+
+void DominantShareQueue::set_weights(lt_name_t name, double cpu_weight,
+                                     double memory_weight) {
+  if (users.at(name).in_queue) {
+    throw std::logic_error("Can't change the weights of a queued user");
+  }
+  users[name].cpu_weight = cpu_weight;
+  users[name].memory_weight = memory_weight;
+}
+
+// same operations (and order) used by numpy in
+// np.max(allocation / capacities / weights), so that ties are also the same
+double DominantShareQueue::dominant_share(const User& user) const {
+  double cpu_share = user.cpu_allocation / system_cpu / user.cpu_weight;
+  double memory_share = user.memory_allocation / system_memory /
+                        user.memory_weight;
+  return std::max(cpu_share, memory_share);
+}
+
+void DominantShareQueue::add(lt_name_t name, double cpu_allocation,
+                             double memory_allocation, double cpu_demand,
+                             double memory_demand) {
+  remove(name);
+  User& user = users.at(name);
+  user.cpu_allocation = cpu_allocation;
+  user.memory_allocation = memory_allocation;
+  user.cpu_demand = cpu_demand;
+  user.memory_demand = memory_demand;
+  user.position = users_share.emplace(dominant_share(user), name).first;
+  user.in_queue = true;
+}
+
+void DominantShareQueue::remove(lt_name_t name) {
+  User& user = users.at(name);
+  if (user.in_queue) {
+    users_share.erase(user.position);
+    user.in_queue = false;
+  }
+}
+
+// the first user in the queue gets the resources when their next task fits,
+// otherwise the system is full
+long DominantShareQueue::pick(double available_cpu,
+                              double available_memory) const {
+  if (users_share.empty()) {
+    return empty_queue;
+  }
+  const User& user = users[users_share.begin()->second];
+  if (user.cpu_demand > available_cpu ||
+      user.memory_demand > available_memory) {
+    return system_full;
+  }
+  return users_share.begin()->second;
+}
+
+double DominantShareQueue::get_dominant_share(lt_name_t name) const {
+  return dominant_share(users.at(name));
+}
+
+bool DominantShareQueue::element_is_in(lt_name_t name) const {
+  return users.at(name).in_queue;
+}
+
+bool DominantShareQueue::empty() const {
+  return users_share.empty();
+}
@@ -0,0 +1,58 @@
+//
+// Dominant Share Queue
+// Users sorted by their weighted dominant share, used by (w)DRF
+//
+
+#ifndef DOMINANT_SHARE_QUEUE_H
+#define DOMINANT_SHARE_QUEUE_H
+
+#include <set>
+#include <vector>
+
+#include "element.h"
+
+
+/*
+ * Keeps the allocation, weights and next task demands of every user. Only
+ * users with a waiting task are kept in the queue, so that picking a task is
+ * just a look at the first user.
+ */
+class DominantShareQueue {
+ public:
+  typedef std::set<std::pair<double, lt_name_t>> users_set; // share, name
+
+  static const long empty_queue = -1;
+  static const long system_full = -2;
+
+  DominantShareQueue(lt_name_t num_users, double system_cpu,
+                     double system_memory);
+  void set_weights(lt_name_t name, double cpu_weight, double memory_weight);
+  void add(lt_name_t name, double cpu_allocation, double memory_allocation,
+           double cpu_demand, double memory_demand);
+  void remove(lt_name_t name);
+  long pick(double available_cpu, double available_memory) const;
+  double get_dominant_share(lt_name_t name) const;
+  bool element_is_in(lt_name_t name) const;
+  bool empty() const;
+
+ private:
+  struct User {
+    double cpu_allocation;
+    double memory_allocation;
+    double cpu_weight;
+    double memory_weight;
+    double cpu_demand;
+    double memory_demand;
+    bool in_queue;
+    users_set::iterator position;
+  };
+
+  double system_cpu;
+  double system_memory;
+  std::vector<User> users;
+  users_set users_share;
+
+  double dominant_share(const User& user) const;
+};
+
+#endif // DOMINANT_SHARE_QUEUE_H
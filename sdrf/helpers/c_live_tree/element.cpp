@@ -11,6 +11,26 @@
 
 #include "element.h"
 
+DecayMemo::DecayMemo()
+  : last_time_delta(-1), last_tau(0), last_decay(1), exp_count(0) { }
+
+lt_float_t DecayMemo::decay(lt_time_t time_delta, lt_float_t tau) {
+  if (time_delta != last_time_delta || tau != last_tau) {
+    last_time_delta = time_delta;
+    last_tau = tau;
+    last_decay = exp(-time_delta/tau);
+  }
+  return last_decay;
+}
+
+lt_float_t DecayMemo::exp(lt_float_t x) {
+  exp_count++;
+  return std::exp(x);
+}
+
+unsigned long long DecayMemo::get_exp_count() const {
+  return exp_count;
+}
 
 Element::Element(const lt_name_t& name, lt_time_t update_time, double tau,
   double system_cpu, double cpu_commitment, double cpu_relative_allocation,
@@ -19,8 +39,11 @@ Element::Element(const lt_name_t& name, lt_time_t update_time, double tau,
   : name(name), update_time(update_time), tau(tau),
     cpu(system_cpu, cpu_commitment, cpu_relative_allocation, cpu_share),
     memory(system_memory, memory_commitment, memory_relative_allocation,
-           memory_share)
-  { }
+           memory_share), priority_cached(false), decay_memo(nullptr)
+{
+  reference_time = get_reference_time(update_time);
+  scale_offsets();
+}
 
 bool Element::operator<(const Element& rhs) const {
   // it's not really necessary to update the other element, however it's
@@ -31,8 +54,8 @@ bool Element::operator<(const Element& rhs) const {
   } else {
     update(rhs.update_time);
   }
-  long double my_priority = get_priority();
-  long double rhs_priority = rhs.get_priority();
+  lt_float_t my_priority = get_priority();
+  lt_float_t rhs_priority = rhs.get_priority();
   if (my_priority != rhs_priority) {
     return my_priority < rhs_priority;
   }
@@ -57,10 +80,18 @@ void Element::update(lt_time_t next_update_time) const {
   if (next_update_time < update_time) {
     throw std::runtime_error("Can't update Element to the past");
   }
-  lt_time_t time_delta = next_update_time - update_time;
-  cpu.update_commitment(time_delta, tau);
-  memory.update_commitment(time_delta, tau);
   update_time = next_update_time;
+  lt_float_t scale = 0; // without tau the offsets are always zero
+  if (tau != 0) {
+    lt_time_t next_reference_time = get_reference_time(update_time);
+    if (next_reference_time != reference_time) {
+      move_reference_time(next_reference_time);
+    }
+    scale = decay(update_time - reference_time);
+  }
+  cpu.update_commitment(scale);
+  memory.update_commitment(scale);
+  priority_cached = false;
 }
 
 lt_time_t Element::get_switch_time(const Element& other_element) const {
@@ -94,40 +125,101 @@ lt_name_t Element::get_name() const {
   return name;
 }
 
-long double Element::get_cpu_commitment() const {
+lt_float_t Element::get_cpu_commitment() const {
   return cpu.commitment;
 }
 
-long double Element::get_memory_commitment() const {
+lt_float_t Element::get_memory_commitment() const {
   return memory.commitment;
 }
 
-long double Element::get_priority() const {
-  long double dominant_commitment = std::max(
+lt_float_t Element::get_priority() const {
+  if (!priority_cached) {
+    cache_priority();
+  }
+  return cached_priority;
+}
+
+void Element::cache_priority() const {
+  lt_float_t dominant_commitment = std::max(
     cpu.norm_commitment(), memory.norm_commitment());
   const Resource& dominant_resource = get_dominant_resource();
 
-  return dominant_resource.norm_allocation() + dominant_commitment;
+  cached_priority = dominant_resource.norm_allocation() + dominant_commitment;
+  cached_priority_derivative = (dominant_resource.overused_resource() /
+    dominant_resource.system_total - dominant_resource.norm_commitment()) / tau;
+  priority_cached = true;
 }
 
 lt_time_t Element::get_update_time() const {
   return update_time;
 }
 
-long double Element::get_cpu_relative_allocation() const {
+lt_float_t Element::get_cpu_relative_allocation() const {
   return cpu.relative_allocation;
 }
 
-long double Element::get_memory_relative_allocation() const {
+lt_float_t Element::get_memory_relative_allocation() const {
   return memory.relative_allocation;
 }
 
-void Element::set_cpu_relative_allocation(long double cpu_relative_allocation) {
+// the commitment stays the same, but it now tends to the new overused
+// resource, so the offset changes
+void Element::set_cpu_relative_allocation(lt_float_t cpu_relative_allocation) {
   cpu.relative_allocation = cpu_relative_allocation;
+  scale_offsets();
+  priority_cached = false;
 }
 
-void Element::set_memory_relative_allocation(long double memory_relative_allocation){
+void Element::set_memory_relative_allocation(lt_float_t memory_relative_allocation){
   memory.relative_allocation = memory_relative_allocation;
+  scale_offsets();
+  priority_cached = false;
+}
+
+void Element::set_decay_memo(DecayMemo* memo) const {
+  decay_memo = memo;
+}
+
+lt_float_t Element::exp(lt_float_t x) const {
+  if (decay_memo == nullptr) {
+    return std::exp(x);
+  }
+  return decay_memo->exp(x);
+}
+
+// exp(-time_delta/tau), memoized by the queue of the element
+lt_float_t Element::decay(lt_time_t time_delta) const {
+  if (decay_memo == nullptr) {
+    return std::exp(-time_delta/tau);
+  }
+  return decay_memo->decay(time_delta, tau);
+}
+
+lt_time_t Element::get_reference_time(lt_time_t time) const {
+  if (tau == 0) {
+    return time;
+  }
+  lt_time_t period = renormalization_period * tau;
+  return std::floor(time / period) * period;
+}
+
+// the offsets are kept scaled to the new reference time
+void Element::move_reference_time(lt_time_t next_reference_time) const {
+  lt_float_t scale = exp(-(next_reference_time - reference_time) / tau);
+  cpu.scaled_offset *= scale;
+  memory.scaled_offset *= scale;
+  reference_time = next_reference_time;
+}
+
+// sets the scaled offsets from the commitments at update_time
+void Element::scale_offsets() const {
+  if (tau == 0) {
+    return;
+  }
+  lt_float_t scale = decay(update_time - reference_time);
+  cpu.scale_offset(scale);
+  memory.scale_offset(scale);
 }
 
 Element::operator std::string() const {
@@ -136,32 +228,38 @@ Element::operator std::string() const {
   return std::to_string(name) + "(" + priority_out_stream.str() + ")";
 }
 
-Element::Resource::Resource(long double system_total, long double commitment,
-   long double relative_allocation, long double share)
-   : system_total(system_total), commitment(commitment),
+Element::Resource::Resource(lt_float_t system_total, lt_float_t commitment,
+   lt_float_t relative_allocation, lt_float_t share)
+   : system_total(system_total), commitment(commitment), scaled_offset(0),
      relative_allocation(relative_allocation), share(share) { }
 
 lt_time_t Element::calculate_intersec(const Element::Resource& my_res,
     const Element::Resource& other_res, const Element& other_element) const
 {
   // overused resources
-  long double ov1 = my_res.overused_resource() / my_res.system_total;
-  long double ov2 = other_res.overused_resource() / other_res.system_total;
+  lt_float_t ov1 = my_res.overused_resource() / my_res.system_total;
+  lt_float_t ov2 = other_res.overused_resource() / other_res.system_total;
   
   // commitments
-  long double c1 = my_res.norm_commitment();
-  long double c2 = other_res.norm_commitment();
+  lt_float_t c1 = my_res.norm_commitment();
+  lt_float_t c2 = other_res.norm_commitment();
 
   // dominant allocations
-  long double dom1 = get_dominant_resource().norm_allocation();
-  long double dom2 = other_element.get_dominant_resource().norm_allocation();
+  lt_float_t dom1 = get_dominant_resource().norm_allocation();
+  lt_float_t dom2 = other_element.get_dominant_resource().norm_allocation();
 
   return tau * std::log((ov1 - ov2 + c2 - c1) / (ov1 - ov2 + dom1 - dom2));
 }
 
-long double Element::get_priority_derivative(lt_time_t time_delta) const {
+lt_float_t Element::get_priority_derivative(lt_time_t time_delta) const {
+  if (time_delta == 0) {
+    if (!priority_cached) {
+      cache_priority();
+    }
+    return cached_priority_derivative;
+  }
   const Resource& dominant_resource = get_dominant_resource();
-  return dominant_resource.commitment_derivative(time_delta, tau);
+  return dominant_resource.commitment_derivative(exp(-time_delta/tau), tau);
 }
 
 const Element::Resource& Element::get_dominant_resource() const {
@@ -171,31 +269,34 @@ const Element::Resource& Element::get_dominant_resource() const {
   return memory;
 }
 
-long double Element::get_dominant_commitment() const {
+lt_float_t Element::get_dominant_commitment() const {
   return std::max(cpu.norm_commitment(), memory.norm_commitment());
 }
 
-long double Element::Resource::norm_allocation() const {
+lt_float_t Element::Resource::norm_allocation() const {
   return relative_allocation / system_total;
 }
 
-long double Element::Resource::norm_commitment() const {
+lt_float_t Element::Resource::norm_commitment() const {
   return commitment / system_total;
 }
 
-long double Element::Resource::overused_resource() const {
-  return std::max<long double>(relative_allocation - share, 0);
+lt_float_t Element::Resource::overused_resource() const {
+  return std::max<lt_float_t>(relative_allocation - share, 0);
 }
 
-long double Element::Resource::commitment_derivative(lt_time_t time_delta,
-    long double tau) const {
+// decay is exp(-time_delta / tau)
+lt_float_t Element::Resource::commitment_derivative(lt_float_t decay,
+    lt_float_t tau) const {
   return (overused_resource() / system_total - norm_commitment()) / 
-         tau * std::exp(-time_delta/tau);
+         tau * decay;
 }
 
-void Element::Resource::update_commitment(lt_time_t time_delta, long double tau)
-const
-{
-  long double alpha = 1 - std::exp(-time_delta/tau);
-  commitment += alpha * (overused_resource() - commitment);
+// scale is exp(-(update_time - reference_time) / tau)
+void Element::Resource::scale_offset(lt_float_t scale) const {
+  scaled_offset = (commitment - overused_resource()) / scale;
+}
+
+void Element::Resource::update_commitment(lt_float_t scale) const {
+  commitment = overused_resource() + scaled_offset * scale;
 }
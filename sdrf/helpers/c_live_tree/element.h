@@ -8,8 +8,36 @@
 #include <cmath>
 
 typedef unsigned lt_name_t;
-typedef long double lt_time_t;
 
+// Build with -DLT_DOUBLE (see compile.sh) to use double instead of the slower
+// x87 long double. Times are relative to the origin chosen by the caller, so
+// that microsecond timestamps keep their precision in a double.
+#ifdef LT_DOUBLE
+typedef double lt_float_t;
+#else
+typedef long double lt_float_t;
+#endif
+typedef lt_float_t lt_time_t;
+
+// Memo of the last exponential decay evaluated by the elements of a queue,
+// which also counts the exponentials they evaluate. Elements updated to the
+// same time share the same reference time (and thus the same time delta), so
+// the exponential is only evaluated when the time delta changes. Every queue
+// keeps its own, so that queues used at the same time (other threads, or
+// several simulations in a single pass) don't evict each other's decay.
+class DecayMemo {
+ public:
+  DecayMemo();
+  lt_float_t decay(lt_time_t time_delta, lt_float_t tau);
+  lt_float_t exp(lt_float_t x);
+  unsigned long long get_exp_count() const;
+
+ private:
+  lt_time_t last_time_delta;
+  lt_float_t last_tau;
+  lt_float_t last_decay;
+  unsigned long long exp_count;
+};
 
 class Element {
  public:
@@ -23,48 +51,76 @@ class Element {
   bool operator<(const Element& rhs) const;
   bool operator==(const Element& rhs) const;
   void update(lt_time_t current_time) const;
-  long double get_switch_time(const Element& other_element) const;
+  lt_float_t get_switch_time(const Element& other_element) const;
   lt_name_t get_name() const;
-  long double get_cpu_commitment() const;
-  long double get_memory_commitment() const;
-  long double get_priority() const;
+  lt_float_t get_cpu_commitment() const;
+  lt_float_t get_memory_commitment() const;
+  lt_float_t get_priority() const;
   lt_time_t get_update_time() const;
-  long double get_cpu_relative_allocation() const;
-  long double get_memory_relative_allocation() const;
-  void set_cpu_relative_allocation(long double cpu_relative_allocation);
-  void set_memory_relative_allocation(long double memory_relative_allocation);
+  lt_float_t get_cpu_relative_allocation() const;
+  lt_float_t get_memory_relative_allocation() const;
+  void set_cpu_relative_allocation(lt_float_t cpu_relative_allocation);
+  void set_memory_relative_allocation(lt_float_t memory_relative_allocation);
+  // the memo of the queue holding the element, nullptr when it isn't in one
+  void set_decay_memo(DecayMemo* memo) const;
   operator std::string() const;
 
  private:
+  // The commitment of a resource tends to the overused resource with time,
+  // c(t) = overused + (c(t0) - overused) * exp(-(t - t0) / tau). The offset
+  // from the overused resource is kept scaled to a reference time R instead,
+  // scaled_offset = (c(t0) - overused) * exp((t0 - R) / tau), which does not
+  // change with time. Every element at time t then shares the same factor
+  // exp(-(t - R) / tau) and the reference is moved forward every
+  // renormalization_period taus, so that the scaled offset never overflows.
   struct Resource { // none of these values are normalized!
-    Resource(long double system_total, long double commitment=0,
-             long double relative_allocation=0, long double share=0);
-    const long double system_total; // total amount of resources in the system
-    mutable long double commitment; // non-normalized commitment
-    long double relative_allocation; // non-normalized allocation
-    long double share; // non-normalized share of resources that the user can
+    Resource(lt_float_t system_total, lt_float_t commitment=0,
+             lt_float_t relative_allocation=0, lt_float_t share=0);
+    const lt_float_t system_total; // total amount of resources in the system
+    mutable lt_float_t commitment; // non-normalized commitment at update_time
+    mutable lt_float_t scaled_offset; // time-invariant commitment offset
+    lt_float_t relative_allocation; // non-normalized allocation
+    lt_float_t share; // non-normalized share of resources that the user can
                        // use without commitment
 
-    long double norm_allocation() const;
-    long double norm_commitment() const;
-    long double overused_resource() const;
-    long double commitment_derivative(lt_time_t time_delta,
-      long double tau) const;
-    void update_commitment(lt_time_t time_delta, long double tau) const;
+    lt_float_t norm_allocation() const;
+    lt_float_t norm_commitment() const;
+    lt_float_t overused_resource() const;
+    lt_float_t commitment_derivative(lt_float_t decay, lt_float_t tau) const;
+    void scale_offset(lt_float_t scale) const;
+    void update_commitment(lt_float_t scale) const;
   };
+  static const int renormalization_period = 32; // in taus
+
   mutable lt_time_t update_time;
-  const long double tau;
+  mutable lt_time_t reference_time;
+  const lt_float_t tau;
   Resource cpu;
   Resource memory;
 
-  long double calculate_commitment(lt_time_t current_time,
-    long double previous_commitment, long double relative_allocation,
-    long double share) const;
+  // priority and its derivative at update_time, they are only recalculated
+  // when the element is updated or its allocation changes
+  mutable bool priority_cached;
+  mutable lt_float_t cached_priority;
+  mutable lt_float_t cached_priority_derivative;
+
+  mutable DecayMemo* decay_memo;
+
+  void cache_priority() const;
+  lt_float_t exp(lt_float_t x) const;
+  lt_float_t decay(lt_time_t time_delta) const;
+  lt_time_t get_reference_time(lt_time_t time) const;
+  void move_reference_time(lt_time_t next_reference_time) const;
+  void scale_offsets() const;
+
+  lt_float_t calculate_commitment(lt_time_t current_time,
+    lt_float_t previous_commitment, lt_float_t relative_allocation,
+    lt_float_t share) const;
   lt_time_t calculate_intersec(const Element::Resource& my_res,
     const Element::Resource& other_res, const Element& other_element) const;
-  long double get_priority_derivative(lt_time_t time_delta=0.0L) const;
+  lt_float_t get_priority_derivative(lt_time_t time_delta=0) const;
   const Resource& get_dominant_resource() const;
-  long double get_dominant_commitment() const;
+  lt_float_t get_dominant_commitment() const;
 };
 
 namespace std {
@@ -9,6 +9,7 @@
 #include <functional>
 #include <iomanip>
 #include <iostream>
+#include <limits>
 #include <map>
 #include <set>
 #include <sstream>
@@ -25,12 +26,12 @@ int LiveTree::insert_count = 0;
 int LiveTree::update_count = 0;
 int LiveTree::events_count = 0;
 
-LiveTree::LiveTree() {
+LiveTree::LiveTree() : decay_memo(&own_decay_memo) {
   #ifdef LOGIC_CHECK
     #pragma message "Logic check is activated, this will make the code slower."
     std::cout << "LOGIC CHECK" << std::endl;
   #endif
-  last_time = -1.0L;
+  last_time = -1;
 }
 
 void LiveTree::add(Element element) {
@@ -44,6 +45,7 @@ void LiveTree::add(Element element) {
     update(element.get_update_time());
   }
 
+  element.set_decay_memo(decay_memo);
   auto element_emplace_pair = elements_priority.emplace(std::move(element),
                                                         events.end());
   auto element_it = element_emplace_pair.first;
@@ -131,6 +133,13 @@ bool LiveTree::element_is_in(const lt_name_t& name) const {
   return existing_element != elements_priority.end();
 }
 
+const Element* LiveTree::find(const lt_name_t& name) const {
+  if (!element_is_in(name)) {
+    return nullptr;
+  }
+  return &(elements_name_mapper.at(name)->first);
+}
+
 LiveTree::operator std::string() const {
   std::string out_str = "[ ";
   for (auto element : elements_priority) {
@@ -149,7 +158,7 @@ LiveTree::operator std::string() const {
 }
 
 void LiveTree::check_order() const {
-  long double last_priority = -100;
+  lt_float_t last_priority = -100;
   for (auto element : elements_priority) {
     Element cpy(element.first);
     cpy.update(last_time);
@@ -205,11 +214,33 @@ void LiveTree::update(lt_time_t current_time) {
     add(std::move(pending_reinsertion.front()));
     pending_reinsertion.pop_front();
   }
+
   #ifdef LOGIC_CHECK
     check_order();
   #endif
 }
 
+// the order only changes at this time (or when elements are added or removed)
+lt_time_t LiveTree::next_event_time() const {
+  if (events.empty()) {
+    return std::numeric_limits<lt_time_t>::infinity();
+  }
+  return events.begin()->first;
+}
+
+DecayMemo* LiveTree::get_decay_memo() {
+  return decay_memo;
+}
+
+// only before adding any element
+void LiveTree::set_decay_memo(DecayMemo* memo) {
+  decay_memo = memo;
+}
+
+unsigned long long LiveTree::get_exp_count() const {
+  return decay_memo->get_exp_count();
+}
+
 int LiveTree::get_insert_count(){
   return LiveTree::insert_count;
 }
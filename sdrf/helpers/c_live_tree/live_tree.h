@@ -27,6 +27,9 @@ class LiveTree {
   typedef std::vector<elements_map::iterator> elements_name_map;
 
   LiveTree();
+  // elements point to the decay memo of the tree, which must not be copied
+  LiveTree(const LiveTree&) = delete;
+  LiveTree& operator=(const LiveTree&) = delete;
   void add(const Element element);
   Element pop(lt_time_t current_time);
   Element get_min(lt_time_t current_time);
@@ -35,8 +38,13 @@ class LiveTree {
   Element remove(const lt_name_t& name);
   bool empty() const;
   bool element_is_in(const lt_name_t& name) const;
+  const Element* find(const lt_name_t& name) const;
   operator std::string() const;
   void update(lt_time_t current_time);
+  lt_time_t next_event_time() const;
+  DecayMemo* get_decay_memo();
+  void set_decay_memo(DecayMemo* memo);
+  unsigned long long get_exp_count() const;
 
   static int get_insert_count();
   static int get_update_count();
@@ -47,6 +55,8 @@ class LiveTree {
   events_set events;
   elements_map elements_priority; // sort elements and also link to events
   elements_name_map elements_name_mapper;
+  DecayMemo own_decay_memo;
+  DecayMemo* decay_memo; // own_decay_memo unless shared with other trees
 
   static int insert_count;
   static int update_count;
@@ -0,0 +1,140 @@
+#include <algorithm>
+#include <limits>
+#include <stdexcept>
+#include <vector>
+
+#include "machine_index.h"
+
+
+MachineIndex::MachineIndex(unsigned num_machines,
+                           const double* cpu_capacities,
+                           const double* memory_capacities, bool best_fit)
+    : best_fit(best_fit), size(1),
+      cpu_capacities(cpu_capacities, cpu_capacities + num_machines),
+      memory_capacities(memory_capacities, memory_capacities + num_machines),
+      used_cpu(num_machines, 0), used_memory(num_machines, 0) {
+  if (num_machines == 0) {
+    throw std::invalid_argument("At least one machine is required");
+  }
+  while (size < num_machines) {
+    size *= 2;
+  }
+  largest_cpu = *std::max_element(this->cpu_capacities.begin(),
+                                  this->cpu_capacities.end());
+  largest_memory = *std::max_element(this->memory_capacities.begin(),
+                                     this->memory_capacities.end());
+
+  const double inf = std::numeric_limits<double>::infinity();
+  nodes.assign(2 * size, Node{-inf, -inf, inf, 0});
+  for (unsigned machine = 0; machine < num_machines; ++machine) {
+    set_leaf(machine);
+  }
+  for (unsigned node = size - 1; node > 0; --node) {
+    pull(node);
+  }
+}
+
+void MachineIndex::set_leaf(unsigned machine) {
+  Node& leaf = nodes[size + machine];
+  leaf.cpu = get_free_cpu(machine);
+  leaf.memory = get_free_memory(machine);
+  leaf.score = leaf.cpu / largest_cpu + leaf.memory / largest_memory;
+  leaf.score_machine = machine;
+}
+
+void MachineIndex::pull(unsigned node) {
+  const Node& left = nodes[2 * node];
+  const Node& right = nodes[2 * node + 1];
+  nodes[node].cpu = std::max(left.cpu, right.cpu);
+  nodes[node].memory = std::max(left.memory, right.memory);
+  // on ties, the left child has the lowest index
+  const Node& smallest = right.score < left.score ? right : left;
+  nodes[node].score = smallest.score;
+  nodes[node].score_machine = smallest.score_machine;
+}
+
+void MachineIndex::update(unsigned machine) {
+  set_leaf(machine);
+  for (unsigned node = (size + machine) / 2; node > 0; node /= 2) {
+    pull(node);
+  }
+}
+
+void MachineIndex::allocate(unsigned machine, double cpu, double memory) {
+  used_cpu.at(machine) += cpu;
+  used_memory[machine] += memory;
+  update(machine);
+}
+
+void MachineIndex::release(unsigned machine, double cpu, double memory) {
+  used_cpu.at(machine) -= cpu;
+  used_memory[machine] -= memory;
+  update(machine);
+}
+
+double MachineIndex::get_free_cpu(unsigned machine) const {
+  return cpu_capacities.at(machine) - used_cpu[machine];
+}
+
+double MachineIndex::get_free_memory(unsigned machine) const {
+  return memory_capacities.at(machine) - used_memory[machine];
+}
+
+bool MachineIndex::fits(unsigned node, double cpu, double memory) const {
+  return cpu <= nodes[node].cpu && memory <= nodes[node].memory;
+}
+
+long MachineIndex::find(double cpu, double memory) const {
+  if (best_fit) {
+    return find_best_fit(cpu, memory);
+  }
+  return first_fit(cpu, memory);
+}
+
+long MachineIndex::first_fit(double cpu, double memory) const {
+  std::vector<unsigned> stack(1, 1);
+  while (!stack.empty()) {
+    unsigned node = stack.back();
+    stack.pop_back();
+    if (!fits(node, cpu, memory)) {
+      continue;
+    }
+    if (node >= size) {
+      return node - size;
+    }
+    // left child on top
+    stack.push_back(2 * node + 1);
+    stack.push_back(2 * node);
+  }
+  return no_machine;
+}
+
+long MachineIndex::find_best_fit(double cpu, double memory) const {
+  long best_machine = no_machine;
+  double best_score = std::numeric_limits<double>::infinity();
+  std::vector<unsigned> stack(1, 1);
+  while (!stack.empty()) {
+    unsigned node = stack.back();
+    stack.pop_back();
+    // machines are compared by (score, index)
+    if (!fits(node, cpu, memory) || nodes[node].score > best_score ||
+        (nodes[node].score == best_score &&
+         nodes[node].score_machine > best_machine)) {
+      continue;
+    }
+    if (node >= size) {
+      best_machine = node - size;
+      best_score = nodes[node].score;
+      continue;
+    }
+    // the child with the smallest score is searched first, left on ties
+    unsigned left = 2 * node;
+    unsigned right = left + 1;
+    if (nodes[right].score < nodes[left].score) {
+      std::swap(left, right);
+    }
+    stack.push_back(right);
+    stack.push_back(left);
+  }
+  return best_machine;
+}
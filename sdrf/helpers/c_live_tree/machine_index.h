@@ -0,0 +1,72 @@
+//
+// Machine Index
+// Free capacity of a set of machines, used to place tasks
+//
+
+#ifndef MACHINE_INDEX_H
+#define MACHINE_INDEX_H
+
+#include <vector>
+
+
+/*
+ * Machines are the leaves of a segment tree (in their original order) where
+ * every node keeps the largest free cpu and the largest free memory among its
+ * machines, as well as the smallest free score (free cpu plus free memory,
+ * each relative to the largest machine). Placing a task or freeing its
+ * resources updates a single path, O(log machines).
+ *
+ * Searches go down the tree skipping the nodes where no machine can fit the
+ * task (not enough free cpu or memory). A node that passes this test has a
+ * machine with enough cpu and one with enough memory, which are usually the
+ * same, so first fit usually visits O(log machines) nodes:
+ * - first fit: the first machine (lowest index) where the task fits
+ * - best fit: the machine where the task fits with the smallest free score,
+ *   the one left with the least free resources (ties go to the lowest
+ *   index). Nodes that can't have a smaller score (or the same score and a
+ *   lower index) than the best machine found so far are also skipped.
+ *
+ * The resources used by each machine are kept, rather than the free ones, and
+ * a task fits when its demands are at most the capacity minus the used
+ * resources. These are the same operations used by the simulator for the
+ * system as a whole, so a single machine behaves exactly as no machines.
+ */
+class MachineIndex {
+ public:
+  static const long no_machine = -1;
+
+  MachineIndex(unsigned num_machines, const double* cpu_capacities,
+               const double* memory_capacities, bool best_fit);
+  long find(double cpu, double memory) const;
+  void allocate(unsigned machine, double cpu, double memory);
+  void release(unsigned machine, double cpu, double memory);
+  double get_free_cpu(unsigned machine) const;
+  double get_free_memory(unsigned machine) const;
+
+ private:
+  struct Node {
+    double cpu;  // largest free cpu
+    double memory;  // largest free memory
+    double score;  // smallest free score
+    long score_machine;  // machine with the smallest score (lowest index)
+  };
+
+  bool best_fit;
+  unsigned size;  // number of leaves, a power of 2
+  double largest_cpu;
+  double largest_memory;
+  std::vector<double> cpu_capacities;
+  std::vector<double> memory_capacities;
+  std::vector<double> used_cpu;
+  std::vector<double> used_memory;
+  std::vector<Node> nodes;
+
+  void set_leaf(unsigned machine);
+  void pull(unsigned node);
+  void update(unsigned machine);
+  bool fits(unsigned node, double cpu, double memory) const;
+  long first_fit(double cpu, double memory) const;
+  long find_best_fit(double cpu, double memory) const;
+};
+
+#endif // MACHINE_INDEX_H
@@ -18,6 +18,7 @@ void PriorityQueue::add(Element element) {
   if (element_is_in(element.name)) {
     throw std::runtime_error("Element already on PriorityQueue");
   }
+  element.set_decay_memo(&decay_memo);
 
   auto element_emplace_pair = elements_priority.insert(element);
   auto element_it = element_emplace_pair.first;
@@ -121,3 +122,7 @@ void PriorityQueue::update(lt_time_t current_time) {
     add(std::move(element));
   }
 }
+
+unsigned long long PriorityQueue::get_exp_count() const {
+  return decay_memo.get_exp_count();
+}
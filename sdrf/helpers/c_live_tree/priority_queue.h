@@ -16,6 +16,9 @@ class PriorityQueue {
   typedef std::vector<elements_set::iterator> elements_name_map; // name, element
 
   PriorityQueue();
+  // elements point to the decay memo of the queue, which must not be copied
+  PriorityQueue(const PriorityQueue&) = delete;
+  PriorityQueue& operator=(const PriorityQueue&) = delete;
   void add(Element element);
   Element pop(lt_time_t current_time);
   Element get_min(lt_time_t current_time);
@@ -26,9 +29,11 @@ class PriorityQueue {
   bool element_is_in(const lt_name_t& name) const;
   operator std::string() const;
   void update(lt_time_t current_time);
+  unsigned long long get_exp_count() const;
 
  private:
   lt_time_t last_time;
+  DecayMemo decay_memo;
   elements_set elements_priority; // sort elements
   elements_name_map elements_name_mapper;
 };
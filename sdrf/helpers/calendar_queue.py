@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import heapq
+from bisect import insort
+
+
+# Calendar queue for completion events. It only supports adding events and
+# taking the earliest one, which is all the simulator needs for the running
+# tasks. Events are (time, item_id) where item_id is an integer, ties in time
+# are broken by the smallest item_id.
+#
+# Events are spread in buckets of the given width. Only the earliest bucket is
+# kept sorted, all the others are plain lists that are sorted once, when they
+# become the earliest. Each bucket is sorted in reverse (using negated keys) so
+# that the earliest event is always at the end of the list.
+class CalendarQueue(object):
+    def __init__(self, width=1e6):
+        """
+        :param width: bucket width, in the same unit as the events time. The
+        default is one second for times in microseconds
+        """
+        self.width = float(width)
+        self.buckets = {}
+        self.bucket_heap = []
+        self._sorted_bucket = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, item_id, time):
+        bucket_id = int(time // self.width)
+        entry = (-time, -item_id)
+        if bucket_id == self._sorted_bucket:
+            insort(self.buckets[bucket_id], entry)
+        elif bucket_id in self.buckets:
+            self.buckets[bucket_id].append(entry)
+        else:
+            self.buckets[bucket_id] = [entry]
+            heapq.heappush(self.bucket_heap, bucket_id)
+        self._size += 1
+
+    def _first_bucket(self):
+        if not self.bucket_heap:
+            return None
+        bucket_id = self.bucket_heap[0]
+        bucket = self.buckets[bucket_id]
+        if bucket_id != self._sorted_bucket:
+            bucket.sort()
+            self._sorted_bucket = bucket_id
+        return bucket
+
+    def get_min(self):
+        """
+        :return: (time, item_id) for the earliest event or None when empty
+        """
+        bucket = self._first_bucket()
+        if bucket is None:
+            return None
+        neg_time, neg_id = bucket[-1]
+        return -neg_time, -neg_id
+
+    def pop(self):
+        bucket = self._first_bucket()
+        if bucket is None:
+            return None
+        neg_time, neg_id = bucket.pop()
+        self._size -= 1
+        if not bucket:
+            del self.buckets[heapq.heappop(self.bucket_heap)]
+            self._sorted_bucket = None
+        return -neg_time, -neg_id
+
+    def pop_until(self, time):
+        """
+        Removes all events up to (and including) the given time
+        :return: list of (time, item_id) in order
+        """
+        events = []
+        while self.bucket_heap:
+            bucket = self._first_bucket()
+            if -bucket[0][0] <= time:
+                # the whole bucket is due
+                events.extend((-t, -i) for t, i in reversed(bucket))
+                self._size -= len(bucket)
+                del self.buckets[heapq.heappop(self.bucket_heap)]
+                self._sorted_bucket = None
+                continue
+            while -bucket[-1][0] <= time:
+                neg_time, neg_id = bucket.pop()
+                events.append((-neg_time, -neg_id))
+                self._size -= 1
+            break
+        return events
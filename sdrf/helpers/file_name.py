@@ -11,8 +11,13 @@ class FileName(object):
 
     def task_sim(self, allocator, resource_percentage, delta=0,
                  *args, **kwargs):
-        extra_options = ['same_share', 'reserved', 'weighted', 'jobs', 'wait']
+        extra_options = ['same_share', 'reserved', 'weighted', 'jobs', 'wait',
+                         'coalesced', 'best_fit']
         extra_options_dict = {k: False for k in extra_options}
+        # epoch (of the quantized SDRF) and machines (number of machines) have
+        # a value, saved as "epoch<value>" and "machines<value>"
+        epoch = kwargs.pop('epoch', None)
+        machines = kwargs.pop('machines', None)
 
         for key in kwargs:
             if key not in extra_options:
@@ -21,6 +26,12 @@ class FileName(object):
         extra_options_dict.update(kwargs)
 
         for arg in args:
+            if arg.startswith('epoch'):
+                epoch = float(arg[len('epoch'):])
+                continue
+            if arg.startswith('machines'):
+                machines = int(arg[len('machines'):])
+                continue
             if arg not in extra_options:
                 raise AttributeError(arg)
             extra_options_dict[arg] = True
@@ -32,12 +43,17 @@ class FileName(object):
             for opt in extra_options:
                 if extra_options_dict[opt]:
                     self.name += '-' + opt
+            if epoch is not None:
+                self.name += '-epoch' + str(float(epoch))
+            if machines is not None:
+                self.name += '-machines%d' % machines
 
             self.name += '.csv'
 
         self.attributes = {'allocator': allocator,
                            'resource_percentage': float(resource_percentage),
-                           'delta': float(delta)}
+                           'delta': float(delta), 'epoch': epoch,
+                           'machines': machines}
         self.attributes.update(extra_options_dict)
 
     def __getattr__(self, name):
@@ -1,9 +1,21 @@
 import json
+import os
 from os.path import dirname, realpath, join
 import ctypes as ct
+import numpy as np
+
+# The library can be compiled using long double (default) or double, set the
+# SDRF_PRECISION environment variable to "double" to use the latter
+precision = os.environ.get('SDRF_PRECISION', 'long_double')
+if precision == 'double':
+    lib_name = 'lib_c_priority_queue_double.so'
+elif precision == 'long_double':
+    lib_name = 'lib_c_priority_queue.so'
+else:
+    raise ValueError('Invalid SDRF_PRECISION: %s' % precision)
 
 lib_dir = dirname(realpath(__file__))
-lib_path = join(lib_dir, 'c_live_tree', 'lib_c_priority_queue.so')
+lib_path = join(lib_dir, 'c_live_tree', lib_name)
 lib = ct.cdll.LoadLibrary(lib_path)
 
 lib.PriorityQueue_new.restype = ct.c_void_p
@@ -12,12 +24,21 @@ lib.PriorityQueue_get_min.restype = ct.c_void_p
 lib.PriorityQueue_remove.restype = ct.c_void_p
 lib.PriorityQueue_cbegin.restype = ct.c_void_p
 lib.PriorityQueue_get_element_from_it.restype = ct.c_void_p
+lib.PriorityQueue_get_exp_count.restype = ct.c_ulonglong
 lib.LiveTree_new.restype = ct.c_void_p
 lib.LiveTree_pop.restype = ct.c_void_p
 lib.LiveTree_get_min.restype = ct.c_void_p
 lib.LiveTree_remove.restype = ct.c_void_p
 lib.LiveTree_cbegin.restype = ct.c_void_p
 lib.LiveTree_get_element_from_it.restype = ct.c_void_p
+lib.LiveTree_get_exp_count.restype = ct.c_ulonglong
+lib.BucketedLiveTree_new.restype = ct.c_void_p
+lib.BucketedLiveTree_pop.restype = ct.c_void_p
+lib.BucketedLiveTree_get_min.restype = ct.c_void_p
+lib.BucketedLiveTree_remove.restype = ct.c_void_p
+lib.BucketedLiveTree_cbegin.restype = ct.c_void_p
+lib.BucketedLiveTree_get_element_from_it.restype = ct.c_void_p
+lib.BucketedLiveTree_get_exp_count.restype = ct.c_ulonglong
 lib.Element_new.restype = ct.c_void_p
 lib.Element_get_cpu_commitment.restype = ct.c_double
 lib.Element_get_memory_commitment.restype = ct.c_double
@@ -25,6 +46,38 @@ lib.Element_get_cpu_relative_allocation.restype = ct.c_double
 lib.Element_get_memory_relative_allocation.restype = ct.c_double
 lib.Element_get_priority.restype = ct.c_double
 lib.Element_get_update_time.restype = ct.c_double
+lib.DominantShareQueue_new.restype = ct.c_void_p
+lib.DominantShareQueue_new.argtypes = [ct.c_uint, ct.c_double, ct.c_double]
+lib.DominantShareQueue_set_weights.argtypes = [ct.c_void_p, ct.c_uint,
+                                               ct.c_double, ct.c_double]
+lib.DominantShareQueue_add.argtypes = [ct.c_void_p, ct.c_uint, ct.c_double,
+                                       ct.c_double, ct.c_double, ct.c_double]
+lib.DominantShareQueue_remove.argtypes = [ct.c_void_p, ct.c_uint]
+lib.DominantShareQueue_pick.restype = ct.c_long
+lib.DominantShareQueue_pick.argtypes = [ct.c_void_p, ct.c_double, ct.c_double]
+lib.DominantShareQueue_get_dominant_share.restype = ct.c_double
+lib.DominantShareQueue_get_dominant_share.argtypes = [ct.c_void_p, ct.c_uint]
+lib.DominantShareQueue_element_is_in.restype = ct.c_bool
+lib.DominantShareQueue_element_is_in.argtypes = [ct.c_void_p, ct.c_uint]
+lib.DominantShareQueue_empty.restype = ct.c_bool
+lib.DominantShareQueue_empty.argtypes = [ct.c_void_p]
+lib.DominantShareQueue_delete.argtypes = [ct.c_void_p]
+lib.MachineIndex_new.restype = ct.c_void_p
+lib.MachineIndex_new.argtypes = [ct.c_uint, ct.c_void_p, ct.c_void_p,
+                                 ct.c_bool]
+lib.MachineIndex_find.restype = ct.c_long
+lib.MachineIndex_find.argtypes = [ct.c_void_p, ct.c_double, ct.c_double]
+lib.MachineIndex_allocate.argtypes = [ct.c_void_p, ct.c_uint, ct.c_double,
+                                      ct.c_double]
+lib.MachineIndex_release.argtypes = [ct.c_void_p, ct.c_uint, ct.c_double,
+                                     ct.c_double]
+lib.MachineIndex_get_free_cpu.restype = ct.c_double
+lib.MachineIndex_get_free_cpu.argtypes = [ct.c_void_p, ct.c_uint]
+lib.MachineIndex_get_free_memory.restype = ct.c_double
+lib.MachineIndex_get_free_memory.argtypes = [ct.c_void_p, ct.c_uint]
+lib.MachineIndex_delete.argtypes = [ct.c_void_p]
+
+c_double_p = ct.POINTER(ct.c_double)
 
 
 max_repr_size = 10000
@@ -90,6 +143,10 @@ class PriorityQueue(object):
     def sorted_elements(self):
         return PriorityQueueIterator(self.obj)
 
+    def exp_count(self):
+        """Number of exponentials evaluated by the elements in the queue"""
+        return lib.PriorityQueue_get_exp_count(self.obj)
+
     @staticmethod
     def print_stats(file_name, info=None):
         if info is not None:
@@ -164,6 +221,29 @@ class LiveTree(object):
     def sorted_elements(self):
         return LiveTreeIterator(self.obj)
 
+    def exp_count(self):
+        """Number of exponentials evaluated by the elements in the tree"""
+        return lib.LiveTree_get_exp_count(self.obj)
+
+    def snapshot(self, idle_elements, current_time):
+        """
+        Evaluates every user commitment at current_time in a single call
+        :param idle_elements: sequence with one element per user, indexed by
+        name. Elements for users that are in the tree are ignored (the tree
+        version is used instead)
+        :param current_time: time to evaluate the commitments at
+        :return: (cpu_commitment, memory_commitment, priority, update_time)
+        arrays, where update_time is the last time each element was updated
+        """
+        num_elements = len(idle_elements)
+        element_ptrs = (ct.c_void_p * num_elements)(
+            *[e.obj.value for e in idle_elements])
+        columns = np.empty((4, num_elements))
+        lib.LiveTree_snapshot(self.obj, element_ptrs, num_elements,
+                              ct.c_double(current_time),
+                              *[c.ctypes.data_as(c_double_p) for c in columns])
+        return tuple(columns)
+
     @staticmethod
     def print_stats(file_name, info=None):
         if info is not None:
@@ -176,6 +256,193 @@ class LiveTree(object):
         lib.LiveTree_print_stats(c_info, c_file_name)
 
 
+class BucketedLiveTreeIterator:
+    def __init__(self, queue_ptr):
+        self.iter_ptr = ct.c_void_p(lib.BucketedLiveTree_cbegin(queue_ptr))
+
+    def __del__(self):
+        lib.BucketedLiveTree_delete_it(self.iter_ptr)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if lib.BucketedLiveTree_it_is_end(self.iter_ptr):
+            raise StopIteration
+
+        element_ptr = ct.c_void_p(lib.BucketedLiveTree_get_element_from_it(
+            self.iter_ptr))
+        lib.BucketedLiveTree_it_next(self.iter_ptr)
+        return Element(obj=element_ptr)
+
+
+# Same interface as the LiveTree, but elements are split in num_buckets
+# buckets (by name) and only the crossings inside a bucket or between the
+# bucket minima are tracked. The order is the same as the one of a LiveTree,
+# with fewer events to process when there are many elements
+class BucketedLiveTree(LiveTree):
+    def __init__(self, num_buckets):
+        self.obj = ct.c_void_p(lib.BucketedLiveTree_new(num_buckets))
+
+    def __del__(self):
+        lib.BucketedLiveTree_delete(self.obj)
+
+    def __repr__(self):
+        buf = ct.create_string_buffer(max_repr_size)
+        lib.BucketedLiveTree_string(self.obj, buf, max_repr_size)
+        return buf.value
+
+    def __contains__(self, key):
+        return bool(lib.BucketedLiveTree_element_is_in(self.obj, key))
+
+    def add(self, element):
+        lib.BucketedLiveTree_add(self.obj, element.obj)
+
+    def pop(self, current_time):
+        element_obj = ct.c_void_p(lib.BucketedLiveTree_pop(
+            self.obj, ct.c_double(current_time)))
+        return Element(obj=element_obj)
+
+    def get_min(self, current_time):
+        element_obj = ct.c_void_p(lib.BucketedLiveTree_get_min(
+            self.obj, ct.c_double(current_time)))
+        return Element(obj=element_obj)
+
+    def remove(self, name):
+        element_obj = ct.c_void_p(lib.BucketedLiveTree_remove(self.obj, name))
+        return Element(obj=element_obj)
+
+    def is_empty(self):
+        return bool(lib.BucketedLiveTree_empty(self.obj))
+
+    def update(self, current_time):
+        lib.BucketedLiveTree_update(self.obj, ct.c_double(current_time))
+
+    def sorted_elements(self):
+        return BucketedLiveTreeIterator(self.obj)
+
+    def exp_count(self):
+        return lib.BucketedLiveTree_get_exp_count(self.obj)
+
+    def snapshot(self, idle_elements, current_time):
+        num_elements = len(idle_elements)
+        element_ptrs = (ct.c_void_p * num_elements)(
+            *[e.obj.value for e in idle_elements])
+        columns = np.empty((4, num_elements))
+        lib.BucketedLiveTree_snapshot(
+            self.obj, element_ptrs, num_elements, ct.c_double(current_time),
+            *[c.ctypes.data_as(c_double_p) for c in columns])
+        return tuple(columns)
+
+
+# Users sorted by weighted dominant share, only users with a waiting task are
+# in the queue. The next task demands are given when the user is added so that
+# pick can check them against the available resources without going back to
+# Python
+class DominantShareQueue(object):
+    EMPTY = -1
+    SYSTEM_FULL = -2
+
+    def __init__(self, num_users, system_cpu, system_memory, weights=None):
+        self.obj = ct.c_void_p(lib.DominantShareQueue_new(
+            num_users, system_cpu, system_memory))
+        if weights is not None:
+            for name, (cpu_weight, memory_weight) in enumerate(weights):
+                lib.DominantShareQueue_set_weights(self.obj, name, cpu_weight,
+                                                   memory_weight)
+
+    def __del__(self):
+        lib.DominantShareQueue_delete(self.obj)
+
+    def __contains__(self, key):
+        return lib.DominantShareQueue_element_is_in(self.obj, key)
+
+    def add(self, name, allocation, demands):
+        lib.DominantShareQueue_add(self.obj, name, allocation[0],
+                                   allocation[1], demands[0], demands[1])
+
+    def remove(self, name):
+        lib.DominantShareQueue_remove(self.obj, name)
+
+    def pick(self, available_resources):
+        """
+        :return: the first user when their next task fits in
+        available_resources, otherwise EMPTY or SYSTEM_FULL
+        """
+        return lib.DominantShareQueue_pick(self.obj, available_resources[0],
+                                           available_resources[1])
+
+    def dominant_share(self, name):
+        return lib.DominantShareQueue_get_dominant_share(self.obj, name)
+
+    def is_empty(self):
+        return lib.DominantShareQueue_empty(self.obj)
+
+
+# Free capacity of each machine, used to find where a task is placed (first
+# fit or best fit) in about O(log machines), see machine_index.h
+class MachineIndex(object):
+    NO_MACHINE = -1
+    placements = ['first_fit', 'best_fit']
+
+    def __init__(self, capacities, placement='first_fit'):
+        """
+        :param capacities: cpu and memory of each machine, all of them start
+        empty
+        :param placement: 'first_fit' or 'best_fit'
+        """
+        if placement not in self.placements:
+            raise ValueError('Unknown placement: %s' % placement)
+        capacities = np.array(capacities, dtype=float)
+        if capacities.ndim != 2 or capacities.shape[1] != 2 or \
+                len(capacities) == 0:
+            raise ValueError('capacities must have cpu and memory for each '
+                             'machine')
+        self.placement = placement
+        self.num_machines = len(capacities)
+        self.largest_machine = capacities.max(axis=0)
+        cpu = np.ascontiguousarray(capacities[:, 0])
+        memory = np.ascontiguousarray(capacities[:, 1])
+        self.obj = ct.c_void_p(lib.MachineIndex_new(
+            self.num_machines, cpu.ctypes.data_as(c_double_p),
+            memory.ctypes.data_as(c_double_p), placement == 'best_fit'))
+
+    def __del__(self):
+        lib.MachineIndex_delete(self.obj)
+
+    def __len__(self):
+        return self.num_machines
+
+    def find(self, demands):
+        """
+        :return: machine where a task with the given demands is placed (see
+        placement) or None when it doesn't fit in any
+        """
+        machine = lib.MachineIndex_find(self.obj, demands[0], demands[1])
+        if machine == self.NO_MACHINE:
+            return None
+        return machine
+
+    def allocate(self, machine, demands):
+        lib.MachineIndex_allocate(self.obj, machine, demands[0], demands[1])
+
+    def release(self, machine, demands):
+        lib.MachineIndex_release(self.obj, machine, demands[0], demands[1])
+
+    def free(self, machine):
+        return (lib.MachineIndex_get_free_cpu(self.obj, machine),
+                lib.MachineIndex_get_free_memory(self.obj, machine))
+
+    def fits_empty(self, demands):
+        """
+        :return: whether the task would fit in the largest machine, when
+        empty (machines larger in cpu may be smaller in memory, in which case
+        it may still fit in none of them)
+        """
+        return (demands[0] <= self.largest_machine[0] and
+                demands[1] <= self.largest_machine[1])
+
+
 class Element(object):
     def __init__(self, name=None, update_time=None, tau=None, system_cpu=None,
                  cpu_commitment=None, cpu_relative_allocation=None,
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import psutil
+
+from sdrf.tasks import batch_size
+
+# Rough estimate of the memory used by a simulation, made before it starts.
+# Most of it goes to the tasks running or waiting in the allocator. Running
+# tasks are estimated from the peak number of tasks running at the same time
+# in the trace. When the system is smaller than the peak usage in the trace,
+# the tasks that don't fit have to wait, so this is scaled by how much smaller
+# it is. Moreover, a system with less resources than the mean usage can't keep
+# up with the trace, the work it doesn't do (a 1 - resource_percentage share
+# of all tasks) piles up in the queues until the end.
+#
+# The sizes were measured as the RSS growth (after gc.collect) divided by the
+# number of tasks or users. A task kept by the allocator (the Task, its
+# demands array and its entries in the queues) takes about 1500 bytes, waiting
+# or running, on the first 400000 tasks of a 2.1M-task trace in the Google
+# format. It is rounded up to 1700 for the Python objects that come and go
+# with them: with it, the estimate of the whole trace at -r0.7 is 1101 MB and
+# the peak RSS 1036 MB. Users were measured with 100000 of them, each with a
+# task waiting (their worst case): 2000 bytes with SDRF (idle element, element
+# in the tree and queue of tasks) and 900 bytes with WDRF.
+bytes_per_task = 1700
+bytes_per_user = {'sdrf': 2000, 'wdrf': 900}
+bytes_per_snapshot_user = 48
+
+
+def estimate_memory_usage(system_utilization, resource_percentage, allocator,
+                          keep_history=False, snapshot_interval=None):
+    """
+    :param system_utilization: SystemUtilization of the tasks file
+    :param allocator: 'sdrf' or 'wdrf'
+    :param snapshot_interval: (optional) in the tasks time unit
+    :return: estimated peak memory usage of the process (including what it is
+    already using) in bytes
+    """
+    utilization = system_utilization
+    num_users = utilization.number_of_users
+    num_tasks = utilization.num_tasks
+
+    if resource_percentage > 0:
+        overload = max(1.0, utilization.cpu_peak /
+                       (utilization.cpu_mean * resource_percentage),
+                       utilization.memory_peak /
+                       (utilization.memory_mean * resource_percentage))
+        tasks = utilization.peak_running_tasks * overload
+        tasks += max(0.0, 1 - resource_percentage) * num_tasks
+        tasks = min(num_tasks, tasks)
+    else:
+        tasks = num_tasks
+
+    usage = psutil.Process().memory_info().rss
+    usage += (tasks + batch_size) * bytes_per_task
+    usage += num_users * bytes_per_user[allocator]
+    if keep_history:
+        usage += num_tasks * (num_users * 16 + 112)
+    if snapshot_interval is not None:
+        num_snapshots = utilization.duration // snapshot_interval + 1
+        usage += num_snapshots * num_users * bytes_per_snapshot_user
+    return int(usage)
+
+
+# Tracks the memory used by the process (RSS) while the simulation runs,
+# warning when it goes above the budget (i.e., the estimate was too low).
+class MemoryMonitor(threading.Thread):
+    def __init__(self, budget=None, interval=1.0):
+        """
+        :param budget: (optional) memory budget in bytes
+        :param interval: seconds between measurements
+        """
+        super(MemoryMonitor, self).__init__()
+        self.daemon = True
+        self.budget = budget
+        self.interval = interval
+        self.peak_rss = 0
+        self.times_exceeded = 0
+        self._process = psutil.Process()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            rss = self._process.memory_info().rss
+            self.peak_rss = max(self.peak_rss, rss)
+            if self.budget is not None and rss > self.budget:
+                if self.times_exceeded == 0:
+                    print 'Memory usage (%d MB) above the budget (%d MB)' % (
+                        rss // 2**20, self.budget // 2**20)
+                self.times_exceeded += 1
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
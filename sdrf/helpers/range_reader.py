@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+
+
+def split_range(size, num_ranges):
+    """
+    Splits [0, size) in ranges of roughly the same size, empty ones are left
+    out
+    :return: list of (start, end) tuples
+    """
+    bounds = [size * i // num_ranges for i in xrange(num_ranges + 1)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:])
+            if end > start]
+
+
+def file_ranges(file_path, num_ranges):
+    """
+    Splits a file in byte ranges of roughly the same size, to be read by
+    RangeReader
+    :return: list of (start, end) tuples
+    """
+    return split_range(os.path.getsize(file_path), num_ranges)
+
+
+# File-like object that only reads the lines starting in the byte range
+# [start, end). Lines crossing the range boundaries belong to the range where
+# they start, so contiguous ranges read every line exactly once. This makes it
+# possible for several processes to read parts of the same csv file with
+# pandas.read_csv.
+class RangeReader(object):
+    def __init__(self, file_path, start, end):
+        self.file = open(file_path, 'rb')
+        self.start = start
+        self.end = end
+        if start > 0:
+            # skips the line that started before the range
+            self.file.seek(start - 1)
+            self.file.readline()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def tell(self):
+        return self.file.tell()
+
+    def readline(self, *args):
+        if self.file.tell() >= self.end:
+            return ''
+        return self.file.readline(*args)
+
+    def read(self, size=-1):
+        position = self.file.tell()
+        if position >= self.end:
+            return ''
+        if size < 0 or size > self.end - position:
+            size = self.end - position
+        data = self.file.read(size)
+        if self.file.tell() >= self.end and data and data[-1] != '\n':
+            # the last line goes beyond the range
+            data += self.file.readline()
+        return data
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from hashlib import sha256
+from os import path
+
+from sdrf.helpers.live_tree import lib_path
+from sdrf.helpers.shared_json import read_json, updating_json
+
+
+manifest_name = 'results_manifest.json'
+
+# parameters that don't change the results (only how fast they are simulated)
+_same_results = ['fast_path', 'buckets']
+# other values that are the same as leaving the parameter out
+_defaults = {'placement': 'first_fit'}
+
+_code_sha = None
+
+
+def code_sha():
+    """
+    sha256 of the source of the simulator (sdrf package, other than the tests)
+    and of the native library in use
+    """
+    global _code_sha
+    if _code_sha is None:
+        package_dir = path.dirname(path.dirname(path.abspath(__file__)))
+        source_files = []
+        for directory, sub_dirs, files in os.walk(package_dir):
+            sub_dirs[:] = sorted(d for d in sub_dirs if d != 'tests')
+            source_files += [path.join(directory, f) for f in sorted(files)
+                             if f.endswith('.py')]
+        sha = sha256()
+        for file_name in source_files + [lib_path]:
+            sha.update(path.relpath(file_name, package_dir))
+            with open(file_name, 'rb') as f:
+                sha.update(f.read())
+        _code_sha = sha.hexdigest()
+    return _code_sha
+
+
+def resources_sha(system_utilization):
+    """
+    sha256 of the usage of the system and of each user calculated from the
+    trace, which the resources are taken from. It differs when calculated in
+    chunks (see SystemUtilization), as the usage differs in the last digits
+    """
+    usage = [system_utilization.cpu_mean, system_utilization.memory_mean,
+             sorted(system_utilization.users_cpu_mean.iteritems()),
+             sorted(system_utilization.users_memory_mean.iteritems())]
+    return sha256(json.dumps(usage)).hexdigest()
+
+
+class ResultsManifest(object):
+    """
+    Records, for each result saved to a directory, what it was simulated from:
+    the tasks files (trace), the resources calculated from them, allocator,
+    parameters and code. A result is up to date while these are the same and
+    its files were not changed since.
+    """
+    def __init__(self, saving_dir, trace_sha, resources):
+        """
+        :param trace_sha: sha of the tasks files, see files_sha
+        :param resources: sha of the usage calculated from the tasks files,
+        see resources_sha
+        """
+        self.file_name = path.join(saving_dir, manifest_name)
+        self.trace_sha = trace_sha
+        self.resources = resources
+
+    def is_valid(self, allocator, parameters, files):
+        """
+        :param parameters: dict with the arguments of the simulation
+        :param files: files of the result, the first one is the result itself
+        """
+        entry = read_json(self.file_name).get(path.basename(files[0]))
+        expected = json.loads(json.dumps(self._entry(allocator, parameters,
+                                                     files)))
+        return entry is not None and entry == expected
+
+    def record(self, allocator, parameters, files):
+        """
+        Records a result that was just saved, see is_valid
+        """
+        entry = self._entry(allocator, parameters, files)
+        # several simulations may be saving to the same directory
+        with updating_json(self.file_name, sort_keys=True,
+                           indent=1) as entries:
+            entries[path.basename(files[0])] = entry
+
+    def _entry(self, allocator, parameters, files):
+        parameters = {k: v for k, v in parameters.iteritems()
+                      if k not in _same_results and v is not None and
+                      v is not False and _defaults.get(k) != v}
+        # files are identified by their size and modification time (None
+        # when missing)
+        stats = []
+        for file_name in files:
+            try:
+                stat = os.stat(file_name)
+                stats.append([stat.st_size, stat.st_mtime])
+            except OSError:
+                stats.append(None)
+        return {'trace': self.trace_sha, 'resources': self.resources,
+                'allocator': allocator, 'parameters': parameters,
+                'code': code_sha(), 'files': stats}
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import errno
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+
+# JSON files shared by processes that may run at the same time (e.g., caches
+# and manifests in a directory used by several simulations). Files are locked
+# while read (shared lock) or updated (exclusive lock) and updated in place,
+# so readers never see them partially written and no lock file is left.
+def read_json(file_name):
+    """
+    :return: contents of the file, an empty dict when it doesn't exist
+    """
+    try:
+        f = open(file_name, 'r')
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}
+    with f:
+        fcntl.lockf(f, fcntl.LOCK_SH)
+        content = f.read()
+    # the file may have just been created by a process about to write it
+    return json.loads(content) if content else {}
+
+
+@contextmanager
+def updating_json(file_name, **dump_options):
+    """
+    Yields the contents of the file (an empty dict when it doesn't exist),
+    which are written back in the end (unless an exception is raised)
+    :param dump_options: passed to json.dump
+    """
+    fd = os.open(file_name, os.O_RDWR | os.O_CREAT, 0666)
+    with os.fdopen(fd, 'r+') as f:
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        content = f.read()
+        data = json.loads(content) if content else {}
+        yield data
+        f.seek(0)
+        f.truncate()
+        json.dump(data, f, **dump_options)
+        f.flush()
+        os.fsync(f.fileno())
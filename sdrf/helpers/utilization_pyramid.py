@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+def _reduce_at(ufunc, array, series, bucket, values):
+    """
+    Same as ufunc.at(array, (series, bucket), values), which is much slower
+    """
+    if len(values) == 0:
+        return
+    flat_array = array.reshape(-1, array.shape[-1])
+    index = series * array.shape[1] + bucket
+    order = np.argsort(index, kind='mergesort')
+    index = index[order]
+    starts = np.flatnonzero(np.append(True, index[1:] != index[:-1]))
+    index = index[starts]
+    flat_array[index] = ufunc(flat_array[index],
+                              ufunc.reduceat(values[order], starts, axis=0))
+
+
+# Multi-resolution summary of step functions, e.g., the resources used by the
+# system or by each user (a series) over time. For every bucket of every level
+# it keeps the minimum, mean and maximum values. The finest level is built
+# incrementally from the change points of the series, in time order, and the
+# coarser levels are aggregated from it by finish.
+#
+# A bucket without change points is covered by a single value, so its minimum
+# and maximum are the same as its mean. This way only the buckets where values
+# change are updated, no matter for how long the values last. Values are 0
+# before the first change point of each series.
+class UtilizationPyramid(object):
+    def __init__(self, first_time, last_time, bucket_sizes, num_series=1,
+                 num_resources=2):
+        """
+        :param first_time: beginning of the first bucket
+        :param last_time: time of the last change point of all series
+        :param bucket_sizes: increasing bucket size of each level, each one a
+        multiple of the previous
+        """
+        self.first_time = first_time
+        self.last_time = last_time
+        self.bucket_sizes = list(bucket_sizes)
+        num_buckets = int((last_time - first_time) // bucket_sizes[0]) + 1
+        shape = (num_series, num_buckets, num_resources)
+        self._integral = np.zeros(shape)
+        # difference array of the values of buckets entirely within a segment
+        self._covered = np.zeros((num_series, num_buckets + 1, num_resources))
+        self._min = np.full(shape, np.inf)
+        self._max = np.full(shape, -np.inf)
+        self._time = np.full(num_series, first_time, np.int64)
+        self._value = np.zeros((num_series, num_resources))
+        self.levels = None
+
+    @property
+    def num_series(self):
+        return self._value.shape[0]
+
+    def _first_bucket(self, time):
+        return ((time - self.first_time) // self.bucket_sizes[0]).astype(int)
+
+    def _last_bucket(self, time):
+        # last bucket of a segment that ends (exclusive) at time
+        return (-((self.first_time - time) // self.bucket_sizes[0]) -
+                1).astype(int)
+
+    def _add_segments(self, series, start_time, end_time, value):
+        non_empty = end_time > start_time
+        series = series[non_empty]
+        start_time = start_time[non_empty]
+        end_time = end_time[non_empty]
+        value = value[non_empty]
+
+        width = self.bucket_sizes[0]
+        first_bucket = self._first_bucket(start_time)
+        last_bucket = self._last_bucket(end_time)
+        ends_series = np.concatenate([series, series])
+        ends_bucket = np.concatenate([first_bucket, last_bucket])
+        ends_value = np.concatenate([value, value])
+        _reduce_at(np.minimum, self._min, ends_series, ends_bucket, ends_value)
+        _reduce_at(np.maximum, self._max, ends_series, ends_bucket, ends_value)
+
+        # segments within a single bucket add to its integral, longer ones
+        # add to their first and last buckets and cover the ones in between
+        single = first_bucket == last_bucket
+        span = ~single
+        first_end = self.first_time + (first_bucket[span] + 1) * width
+        last_start = self.first_time + last_bucket[span] * width
+        _reduce_at(np.add, self._integral,
+                   np.concatenate([series[single], series[span],
+                                   series[span]]),
+                   np.concatenate([first_bucket[single], first_bucket[span],
+                                   last_bucket[span]]),
+                   np.concatenate([
+                       value[single] *
+                       (end_time - start_time)[single][:, np.newaxis],
+                       value[span] *
+                       (first_end - start_time[span])[:, np.newaxis],
+                       value[span] *
+                       (end_time[span] - last_start)[:, np.newaxis]]))
+        _reduce_at(np.add, self._covered,
+                   np.concatenate([series[span], series[span]]),
+                   np.concatenate([first_bucket[span] + 1, last_bucket[span]]),
+                   np.concatenate([value[span], -value[span]]))
+
+    def add(self, series, times, values):
+        """
+        Adds change points. Times of the same series must be greater than the
+        ones in previous calls and distinct within a call
+        :param series: series index of each change point
+        :param times: time of each change point
+        :param values: values (one per resource) from each change point on
+        """
+        order = np.lexsort((times, series))
+        series = np.asarray(series)[order]
+        times = np.asarray(times)[order]
+        values = np.asarray(values)[order]
+        first = np.append(True, series[1:] != series[:-1])
+        last = np.append(series[1:] != series[:-1], True)
+
+        start_time = np.empty_like(times)
+        start_time[1:] = times[:-1]
+        start_time[first] = self._time[series[first]]
+        start_value = np.empty_like(values)
+        start_value[1:] = values[:-1]
+        start_value[first] = self._value[series[first]]
+        self._add_segments(series, start_time, times, start_value)
+
+        bucket = self._first_bucket(times)
+        _reduce_at(np.minimum, self._min, series, bucket, values)
+        _reduce_at(np.maximum, self._max, series, bucket, values)
+        self._time[series[last]] = times[last]
+        self._value[series[last]] = values[last]
+
+    def finish(self):
+        series = np.arange(self.num_series)
+        self._add_segments(series, self._time,
+                           np.full(self.num_series, self.last_time, np.int64),
+                           self._value)
+
+        width = self.bucket_sizes[0]
+        covered = np.cumsum(self._covered, axis=1)[:, :-1]
+        mean = (self._integral + covered * width) / width
+        no_changes = np.isinf(self._min)
+        levels = [(np.where(no_changes, mean, self._min), mean,
+                   np.where(no_changes, mean, self._max))]
+        for previous_size, size in zip(self.bucket_sizes[:-1],
+                                       self.bucket_sizes[1:]):
+            factor = size // previous_size
+            minimum, mean, maximum = levels[-1]
+            padding = -mean.shape[1] % factor
+            shape = (self.num_series, -1, factor, mean.shape[2])
+
+            def aggregate(level, pad_value, function):
+                level = np.pad(level, ((0, 0), (0, padding), (0, 0)),
+                               'constant', constant_values=pad_value)
+                return function(level.reshape(shape), axis=2)
+
+            levels.append((aggregate(minimum, np.inf, np.min),
+                           aggregate(mean, 0, np.mean),
+                           aggregate(maximum, -np.inf, np.max)))
+        self.levels = levels
+
+    def level_for(self, max_buckets):
+        """
+        :return: finest level with at most max_buckets buckets (or the
+        coarsest level)
+        """
+        for level, (_, mean, _) in enumerate(self.levels):
+            if mean.shape[1] <= max_buckets:
+                return level
+        return len(self.levels) - 1
+
+    def series(self, level, index=0):
+        """
+        :return: (bucket start times, minimum, mean, maximum), with one column
+        per resource
+        """
+        minimum, mean, maximum = self.levels[level]
+        times = (self.first_time + np.arange(mean.shape[1]) *
+                 self.bucket_sizes[level])
+        return times, minimum[index], mean[index], maximum[index]
+
+    def to_arrays(self, prefix):
+        arrays = {prefix + 'info': np.array([self.first_time, self.last_time] +
+                                            self.bucket_sizes, np.int64)}
+        for level, stats in enumerate(self.levels):
+            for name, array in zip(['min', 'mean', 'max'], stats):
+                arrays['%s%s%d' % (prefix, name, level)] = array
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        info = arrays[prefix + 'info'].tolist()
+        pyramid = cls.__new__(cls)
+        pyramid.first_time, pyramid.last_time = info[:2]
+        pyramid.bucket_sizes = info[2:]
+        pyramid.levels = [tuple(arrays['%s%s%d' % (prefix, name, level)]
+                                for name in ['min', 'mean', 'max'])
+                          for level in xrange(len(pyramid.bucket_sizes))]
+        return pyramid
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import csv
+import heapq
+import itertools
+
+from sdrf.tasks import batch_size, tasks_chunks, tasks_file_header
+
+# maximum number of messages sent before reading their responses
+pipeline_window = 256
+
+
+def _arrivals(tasks_file):
+    """
+    :return: iterator of (submit time, [(position, row), ...]), the position
+    of each task in the file is used as its id in the service
+    """
+    positions = itertools.count()
+
+    def rows():
+        for df, _ in tasks_chunks(tasks_file, batch_size):
+            columns = [df[name].values.tolist() for name in tasks_file_header]
+            for row in itertools.izip(*columns):
+                yield positions.next(), row
+
+    for submit_time, arrivals in itertools.groupby(rows(),
+                                                   lambda a: a[1][0]):
+        yield submit_time, list(arrivals)
+
+
+# Replays a tasks file against a scheduler service, the same way the simulator
+# does: tasks are submitted at their submit time and, once started, finish
+# after running for as long as they did in the trace. Tasks finishing at the
+# same time as others arrive are finished first, each one with its own
+# message. The result is saved in the same format as the simulations.
+def replay(tasks_file, saving_file, client):
+    """
+    :param client: ServiceClient connected to the service
+    :return: stats of the service in the end
+    """
+    waiting = {}  # task id -> row
+    started = {}  # task id -> (row, start time)
+    running = []  # heap of (finish time, task id)
+    arrivals = _arrivals(tasks_file)
+    next_arrival = next(arrivals, None)
+
+    with open(saving_file, 'wb') as f:
+        writer = csv.writer(f)
+        while next_arrival is not None or running:
+            if running and (next_arrival is None or
+                            running[0][0] <= next_arrival[0]):
+                time = running[0][0]
+                messages = []
+                while running and running[0][0] == time:
+                    task_id = heapq.heappop(running)[1]
+                    row, start_time = started.pop(task_id)
+                    writer.writerow((row[0], start_time, time) + row[3:])
+                    messages.append({'type': 'finish', 'time': time,
+                                     'tasks': [task_id]})
+            else:
+                time, tasks = next_arrival
+                waiting.update(tasks)
+                messages = [{'type': 'submit', 'time': time, 'tasks': [
+                    {'task_id': task_id, 'user_id': row[3], 'cpu': row[5],
+                     'memory': row[6]} for task_id, row in tasks]}]
+                next_arrival = next(arrivals, None)
+
+            for start in xrange(0, len(messages), pipeline_window):
+                responses = client.request(
+                    messages[start:start + pipeline_window])
+                for response in responses:
+                    if 'error' in response:
+                        raise RuntimeError('Service error: ' +
+                                           response['error'])
+                    for task_id in response['started']:
+                        row = waiting.pop(task_id)
+                        started[task_id] = (row, time)
+                        heapq.heappush(running,
+                                       (time + row[2] - row[1], task_id))
+
+    return client.request([{'type': 'stats'}])[0]
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+import errno
+import json
+import os
+import select
+import socket
+from collections import deque
+from timeit import default_timer
+
+import numpy as np
+
+from sdrf.allocators import Task
+
+# number of recent messages used for the latency percentiles
+latency_samples = 100000
+latency_percentiles = [50, 90, 99]
+recv_size = 2**20
+
+
+# Keeps an allocator (in online mode) in memory and applies the messages it
+# receives to it. Messages are dicts with a type and a time, the time must
+# never decrease:
+#
+#   {"type": "submit", "time": T, "tasks": [{"task_id": ID, "user_id": USER,
+#                                            "cpu": CPU, "memory": MEM}, ...]}
+#   {"type": "finish", "time": T, "tasks": [ID, ...]}
+#   {"type": "tick", "time": T}
+#   {"type": "stats"}
+#   {"type": "shutdown"}
+#
+# submit, finish and tick are answered with the ids of the tasks started, as
+# {"started": [ID, ...]}, or with {"error": MESSAGE}, in which case the
+# allocator is left untouched. An "id" in the message is sent back in the
+# response. Task ids are chosen by the client and must be unique among the
+# tasks not finished yet. Only the given users are accepted.
+class SchedulerService(object):
+    def __init__(self, allocator, users):
+        """
+        :param allocator: allocator in online mode
+        :param users: ids of the users the allocator was created for
+        """
+        if not allocator.online:
+            raise ValueError('The allocator must be in online mode')
+        self.allocator = allocator
+        self.users = set(users)
+        self.running = True
+        self.num_messages = 0
+        self.latencies = deque(maxlen=latency_samples)
+        self._tasks = {}  # client task id -> Task
+
+    def handle(self, message):
+        try:
+            response = self._handle(message)
+        except (KeyError, TypeError, ValueError) as e:
+            response = {'error': '%s: %s' % (type(e).__name__, e)}
+        if 'id' in message:
+            response['id'] = message['id']
+        self.num_messages += 1
+        return response
+
+    def _handle(self, message):
+        message_type = message['type']
+        if message_type == 'submit':
+            started = self._submit(message['time'], message['tasks'])
+        elif message_type == 'finish':
+            started = self._finish(message['time'], message['tasks'])
+        elif message_type == 'tick':
+            self.allocator.advance(message['time'])
+            started = []
+        elif message_type == 'stats':
+            return self.stats()
+        elif message_type == 'shutdown':
+            self.running = False
+            return {}
+        else:
+            raise ValueError('Unknown message type %r' % message_type)
+        return {'started': [task.task_id for task in started]}
+
+    def _submit(self, time, tasks):
+        # everything is checked before the first task is created
+        arguments = []
+        new_ids = set()
+        for task in tasks:
+            if task['user_id'] not in self.users:
+                raise ValueError('Unknown user %r' % task['user_id'])
+            task_id = task['task_id']
+            if task_id in self._tasks or task_id in new_ids:
+                raise ValueError('Task %r already submitted' % task_id)
+            new_ids.add(task_id)
+            arguments.append((task['user_id'], task_id, time, time,
+                              (float(task['cpu']), float(task['memory'])),
+                              time))
+
+        self.allocator.advance(time)
+        new_tasks = [Task(*a) for a in arguments]
+        started = self.allocator.submit_tasks(new_tasks, time)
+        for task in new_tasks:
+            self._tasks[task.task_id] = task
+        return started
+
+    def _finish(self, time, task_ids):
+        for task_id in task_ids:
+            task = self._tasks.get(task_id)
+            if task is None or task.count not in self.allocator._tasks_by_id:
+                raise ValueError('Task %r is not running' % task_id)
+        if len(set(task_ids)) < len(task_ids):
+            raise ValueError('Task finished more than once')
+        self.allocator.advance(time)
+
+        counts = [self._tasks.pop(task_id).count for task_id in task_ids]
+        started = self.allocator.finish_tasks(counts, time)
+        # nobody saves them, the client already knows
+        self.allocator.finished_tasks.clear()
+        return started
+
+    def record_latency(self, latency):
+        self.latencies.append(latency)
+
+    def stats(self):
+        """
+        :return: dict with the number of messages, tasks and the percentiles
+        of the decision latency (in microseconds)
+        """
+        stats = {'messages': self.num_messages,
+                 'time': self.allocator.current_time,
+                 'queued_tasks': self.allocator._queued_tasks,
+                 'running_tasks': len(self.allocator._tasks_by_id)}
+        latencies = np.array(self.latencies) * 10**6
+        if len(latencies) > 0:
+            for p, value in zip(latency_percentiles,
+                                np.percentile(latencies, latency_percentiles)):
+                stats['latency_p%d' % p] = value
+            stats['latency_max'] = latencies.max()
+        return stats
+
+
+def listening_socket(unix_socket=None, port=None):
+    """
+    :param unix_socket: path of a Unix socket
+    :param port: (optional) TCP port on localhost, used instead of the Unix
+    socket
+    """
+    if port is not None:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', port))
+    else:
+        try:
+            os.remove(unix_socket)
+        except OSError:
+            pass
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(unix_socket)
+    listener.listen(16)
+    return listener
+
+
+def connect(unix_socket=None, port=None):
+    if port is not None:
+        connection = socket.create_connection(('127.0.0.1', port))
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(unix_socket)
+    return connection
+
+
+# Newline-delimited JSON over a stream socket, every message gets a response
+# in the same order. Clients may send many messages without waiting for the
+# responses (pipelining). The server runs a single thread: every time a
+# client has data, all the complete messages received are handled and their
+# responses are sent together.
+def serve(service, listener):
+    clients = {}  # socket -> incomplete message
+    try:
+        while service.running:
+            readable, _, _ = select.select([listener] + clients.keys(), [],
+                                           [])
+            for sock in readable:
+                if sock is listener:
+                    connection, _ = listener.accept()
+                    if connection.family == socket.AF_INET:
+                        connection.setsockopt(socket.IPPROTO_TCP,
+                                              socket.TCP_NODELAY, 1)
+                    clients[connection] = ''
+                    continue
+                try:
+                    data = sock.recv(recv_size)
+                except socket.error as e:
+                    if e.errno != errno.ECONNRESET:
+                        raise
+                    data = ''
+                received = default_timer()
+                if not data:
+                    sock.close()
+                    del clients[sock]
+                    continue
+
+                lines = (clients[sock] + data).split('\n')
+                clients[sock] = lines.pop()
+                responses = [_respond(service, line)
+                             for line in lines if line.strip()]
+                if not responses:
+                    continue
+                sock.sendall('\n'.join(responses) + '\n')
+                latency = default_timer() - received
+                for _ in responses:
+                    service.record_latency(latency)
+                if not service.running:
+                    break
+    finally:
+        for sock in clients:
+            sock.close()
+        listener.close()
+
+
+def _respond(service, line):
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return json.dumps({'error': 'Invalid JSON message'})
+    if not isinstance(message, dict):
+        return json.dumps({'error': 'Messages must be JSON objects'})
+    return json.dumps(service.handle(message))
+
+
+class ServiceClient(object):
+    def __init__(self, connection):
+        self._connection = connection
+        self._file = connection.makefile('rb')
+
+    def request(self, messages):
+        """
+        Sends the messages at once (pipelined) and waits for all the responses
+        :return: list of responses, in the same order
+        """
+        if not messages:
+            return []
+        self._connection.sendall(''.join(json.dumps(m) + '\n'
+                                         for m in messages))
+        responses = []
+        for _ in messages:
+            line = self._file.readline()
+            if not line:
+                raise RuntimeError('Connection closed by the service')
+            responses.append(json.loads(line))
+        return responses
+
+    def close(self):
+        self._file.close()
+        self._connection.close()
+
+
+def scheduler_service(tasks_file, allocator, resource_percentage, delta=None,
+                      same_share=False, reserved=False, use_weights=False,
+                      fast_path=False, coalesce_events=False,
+                      memory_budget=None):
+    """
+    Service with an allocator for the users in the tasks file, their resources
+    are calculated from the file as in the simulations
+    :param allocator: 'sdrf' or 'wdrf'
+    """
+    from sdrf.simulators.simulate_task_allocation import build_sdrf, \
+        build_wdrf
+    from sdrf.tasks import first_submit_time
+    from sdrf.tasks.system_utilization import SystemUtilization
+
+    system_utilization = SystemUtilization(tasks_file,
+                                           memory_budget=memory_budget)
+    options = {'fast_path': fast_path, 'coalesce_events': coalesce_events,
+               'online': True}
+    if allocator == 'wdrf':
+        allocator = build_wdrf(system_utilization, resource_percentage,
+                               use_weights, **options)
+    else:
+        allocator = build_sdrf(system_utilization, resource_percentage, delta,
+                               first_submit_time(tasks_file), same_share,
+                               reserved, **options)
+    return SchedulerService(allocator, system_utilization.users_cpu_mean)
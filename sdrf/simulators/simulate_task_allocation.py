@@ -1,21 +1,112 @@
 # -*- coding: utf-8 -*-
-import csv
+import os
 import threading
+from collections import namedtuple
 from os import path
 
-from sdrf.allocators.sdrf import SDRF, ReservedSDRF
+import numpy as np
+import psutil
+
+from sdrf.allocators import Arrival, simulate_in_lockstep
+from sdrf.allocators.sdrf import SDRF, ReservedSDRF, time_scale_multiplier
 
 from sdrf.allocators.wdrf import WDRF
 from sdrf.helpers.file_name import FileName
-from sdrf.tasks import tasks_generator, save_from_deque, tasks_file_header
+from sdrf.helpers.memory_usage import MemoryMonitor, estimate_memory_usage
+from sdrf.helpers.results_manifest import ResultsManifest, resources_sha
+from sdrf.tasks import first_submit_time, merged_tasks_generator, \
+    save_from_deque, tasks_file_header
 from sdrf.tasks.system_utilization import SystemUtilization
 
 
-def wdrf(tasks_file, saving_dir, resource_percentage, use_weights=False):
-    system_utilization = SystemUtilization(tasks_file)
-    saving_file = FileName('task_sim', 'wdrf', resource_percentage,
-                           weighted=use_weights).name
+# allocator ready to simulate, the result is saved to saving_file. estimate
+# has the arguments of estimate_memory_usage (resource_percentage, allocator
+# name and keyword arguments) and finish, when not None, is called once the
+# simulation is over.
+Simulation = namedtuple('Simulation', ['allocator', 'saving_file', 'estimate',
+                                       'finish'])
+
+
+def wdrf(tasks_file, saving_dir, resource_percentage, use_weights=False,
+         fast_path=False, coalesce_events=False, memory_budget=None,
+         machines=None, placement='first_fit', memory_limit=None):
+    fan_out(tasks_file, saving_dir, 'wdrf', [dict(
+        resource_percentage=resource_percentage, use_weights=use_weights,
+        fast_path=fast_path, coalesce_events=coalesce_events,
+        machines=machines, placement=placement)], memory_budget,
+        memory_limit=memory_limit)
+
+
+def _wdrf_simulation(system_utilization, tasks_file, saving_dir,
+                     resource_percentage, use_weights=False, fast_path=False,
+                     coalesce_events=False, machines=None,
+                     placement='first_fit'):
+    saving_file = output_name('wdrf', dict(
+        resource_percentage=resource_percentage, use_weights=use_weights,
+        coalesce_events=coalesce_events, machines=machines,
+        placement=placement))
+    allocator = build_wdrf(system_utilization, resource_percentage,
+                           use_weights, machines, fast_path=fast_path,
+                           coalesce_events=coalesce_events,
+                           placement=placement)
+    return Simulation(allocator, path.join(saving_dir, saving_file),
+                      (resource_percentage, 'wdrf', {}), None)
+
+
+def output_name(allocator, parameters):
+    """
+    :param allocator: 'sdrf' or 'wdrf'
+    :param parameters: dict with the arguments of sdrf or wdrf, as in fan_out
+    (missing ones take their default values)
+    :return: name of the file the result is saved to
+    """
+    options = dict(coalesced=parameters.get('coalesce_events', False),
+                   best_fit=parameters.get('placement') == 'best_fit',
+                   machines=parameters.get('machines'))
+    if allocator == 'wdrf':
+        return FileName('task_sim', 'wdrf', parameters['resource_percentage'],
+                        weighted=parameters.get('use_weights', False),
+                        **options).name
+    return FileName('task_sim', 'sdrf', parameters['resource_percentage'],
+                    parameters['delta'],
+                    same_share=parameters.get('same_share', False),
+                    reserved=parameters.get('reserved', False),
+                    epoch=parameters.get('epoch'), **options).name
+
+
+def snapshots_file(saving_file):
+    return path.splitext(saving_file)[0] + '.snapshots.npz'
 
+
+def result_files(saving_dir, allocator, parameters):
+    """
+    :param parameters: dict with the arguments of sdrf or wdrf, as in fan_out
+    :return: files saved by the simulation, the result first
+    """
+    saving_file = path.join(saving_dir, output_name(allocator, parameters))
+    if parameters.get('snapshot_interval') is None:
+        return [saving_file]
+    return [saving_file, snapshots_file(saving_file)]
+
+
+def machines_capacities(system_resources, machines):
+    """
+    :param machines: number of machines, the system resources are split
+    equally among them
+    :return: cpu and memory of each machine, None when machines is None
+    """
+    if machines is None:
+        return None
+    return np.tile(np.array(system_resources, dtype=float) / machines,
+                   (machines, 1))
+
+
+def build_wdrf(system_utilization, resource_percentage, use_weights=False,
+               machines=None, **options):
+    """
+    :param machines: (optional) number of machines, see machines_capacities
+    :param options: passed to WDRF (e.g., fast_path, coalesce_events)
+    """
     if use_weights:
         users_weights_dict = {}
         for user in system_utilization.users_cpu_mean.keys():
@@ -30,25 +121,80 @@ def wdrf(tasks_file, saving_dir, resource_percentage, use_weights=False):
 
     system_resources = [system_utilization.cpu_mean * resource_percentage,
                         system_utilization.memory_mean * resource_percentage]
-    allocator = WDRF(system_resources, system_utilization.num_users,
-                     users_weights_dict)
-
-    saving_file = path.join(saving_dir, saving_file)
-    simulate_task_allocation(allocator, tasks_file, saving_file)
+    return WDRF(system_resources, system_utilization.num_users,
+                users_weights_dict,
+                machines=machines_capacities(system_resources, machines),
+                **options)
 
 
 def sdrf(tasks_file, saving_dir, resource_percentage, delta,
-            same_share=False, reserved=False):
+            same_share=False, reserved=False, snapshot_interval=None,
+            fast_path=False, coalesce_events=False, memory_budget=None,
+            buckets=None, epoch=None, machines=None, placement='first_fit',
+            memory_limit=None):
+    fan_out(tasks_file, saving_dir, 'sdrf', [dict(
+        resource_percentage=resource_percentage, delta=delta,
+        same_share=same_share, reserved=reserved,
+        snapshot_interval=snapshot_interval, fast_path=fast_path,
+        coalesce_events=coalesce_events, buckets=buckets, epoch=epoch,
+        machines=machines, placement=placement)], memory_budget,
+        memory_limit=memory_limit)
+
+
+def _sdrf_simulation(system_utilization, tasks_file, saving_dir,
+                     resource_percentage, delta, same_share=False,
+                     reserved=False, snapshot_interval=None, fast_path=False,
+                     coalesce_events=False, buckets=None, epoch=None,
+                     machines=None, placement='first_fit'):
+    """
+    :param epoch: (optional) in seconds, see SDRF
+    :param machines: (optional) number of machines, see machines_capacities
+    """
     print 'resource percentage: ', resource_percentage
     print 'delta: ', delta
-    system_utilization = SystemUtilization(tasks_file)
+    saving_file = path.join(saving_dir, output_name('sdrf', dict(
+        resource_percentage=resource_percentage, delta=delta,
+        same_share=same_share, reserved=reserved,
+        coalesce_events=coalesce_events, epoch=epoch, machines=machines,
+        placement=placement)))
+
+    start_time = min(first_submit_time(f) for f in _tasks_files(tasks_file))
+
+    if snapshot_interval is not None:
+        snapshot_interval *= time_scale_multiplier
+    if epoch is not None:
+        epoch *= time_scale_multiplier
+
+    allocator = build_sdrf(system_utilization, resource_percentage, delta,
+                           start_time, same_share, reserved,
+                           snapshot_interval=snapshot_interval,
+                           fast_path=fast_path,
+                           coalesce_events=coalesce_events, buckets=buckets,
+                           epoch=epoch, machines=machines,
+                           placement=placement)
+
+    def finish():
+        if snapshot_interval is not None:
+            allocator.save_snapshots(snapshots_file(saving_file))
+
+        allocator.print_stats('end - resource_percentage:%f' %
+                              resource_percentage)
+
+    return Simulation(allocator, saving_file,
+                      (resource_percentage, 'sdrf',
+                       {'snapshot_interval': snapshot_interval}), finish)
+
+
+def build_sdrf(system_utilization, resource_percentage, delta, start_time,
+               same_share=False, reserved=False, machines=None, **options):
+    """
+    :param machines: (optional) number of machines, see machines_capacities
+    :param options: passed to SDRF (e.g., snapshot_interval, fast_path)
+    """
     system_resources = [system_utilization.cpu_mean * resource_percentage,
                         system_utilization.memory_mean * resource_percentage]
 
     users_resources_dict = {}
-    saving_file = FileName('task_sim', 'sdrf', resource_percentage, delta,
-                           same_share=same_share, reserved=reserved).name
-
     if same_share:
         for user in system_utilization.users_cpu_mean.keys():
             users_resources_dict[user] = [0.0, 0.0]
@@ -59,29 +205,125 @@ def sdrf(tasks_file, saving_dir, resource_percentage, delta,
                 system_utilization.users_memory_mean[user] *resource_percentage
             ]
 
-    with open(tasks_file, 'rb') as f:
-        csv_reader = csv.reader(f)
-        row = csv_reader.next()
-        start_time = int(row[0])
-
+    options['machines'] = machines_capacities(system_resources, machines)
     if reserved:
-        allocator = ReservedSDRF(system_resources, users_resources_dict,
-                                  delta, start_time)
+        return ReservedSDRF(system_resources, users_resources_dict, delta,
+                            start_time, **options)
+    return SDRF(system_resources, users_resources_dict, delta, start_time,
+                **options)
+
+
+def fan_out(tasks_file, saving_dir, allocator, parameters,
+            memory_budget=None, memoize=False, force=False,
+            memory_limit=None):
+    """
+    Simulates several parameters in a single pass over the tasks file, the
+    tasks are read once and given to one allocator per parameters
+    :param allocator: 'sdrf' or 'wdrf'
+    :param parameters: list of dicts with the arguments of sdrf or wdrf (other
+    than tasks_file, saving_dir, memory_budget and memory_limit)
+    :param memory_budget: (optional) in bytes, the utilization is calculated
+    reading the tasks in chunks, see SystemUtilization
+    :param memoize: skip the parameters whose results in saving_dir are up to
+    date (see ResultsManifest) and record the new results
+    :param force: with memoize, simulate every parameters anyway
+    :param memory_limit: (optional) in bytes, the simulations are not started
+    if estimated to use more memory (MemoryError is raised)
+    """
+    if not path.isdir(saving_dir):
+        os.makedirs(saving_dir)
+    system_utilization = SystemUtilization(tasks_file,
+                                           memory_budget=memory_budget)
+    if memoize:
+        results = ResultsManifest(saving_dir,
+                                  system_utilization.tasks_file_sha,
+                                  resources_sha(system_utilization))
+        if not force:
+            parameters = [kwargs for kwargs in parameters
+                          if not up_to_date(results, saving_dir, allocator,
+                                            kwargs)]
+            if not parameters:
+                return
+    if allocator == 'sdrf':
+        new_simulation = _sdrf_simulation
     else:
-        allocator = SDRF(system_resources, users_resources_dict, delta,
-                           start_time)
+        new_simulation = _wdrf_simulation
+    simulations = [new_simulation(system_utilization, tasks_file, saving_dir,
+                                  **kwargs) for kwargs in parameters]
+
+    _check_memory_usage(system_utilization, memory_limit,
+                        [s.estimate for s in simulations])
+    simulate_task_allocation([s.allocator for s in simulations], tasks_file,
+                             [s.saving_file for s in simulations],
+                             memory_limit)
+    for simulation in simulations:
+        if simulation.finish is not None:
+            simulation.finish()
+    if memoize:
+        for kwargs in parameters:
+            results.record(allocator, kwargs,
+                           result_files(saving_dir, allocator, kwargs))
+
+
+def up_to_date(results, saving_dir, allocator, parameters):
+    """
+    :param results: ResultsManifest of saving_dir
+    :return: True if the result of the parameters is up to date
+    """
+    files = result_files(saving_dir, allocator, parameters)
+    if results.is_valid(allocator, parameters, files):
+        print 'up to date: %s' % path.basename(files[0])
+        return True
+    return False
+
+
+def _tasks_files(tasks_file):
+    # tasks_file may also be a list of files to be merged
+    if isinstance(tasks_file, basestring):
+        return [tasks_file]
+    return list(tasks_file)
 
-    saving_file = path.join(saving_dir, saving_file)
-    simulate_task_allocation(allocator, tasks_file, saving_file)
 
-    allocator.print_stats('end - resource_percentage:%f' % resource_percentage)
+def _check_memory_usage(system_utilization, memory_limit, estimates):
+    """
+    :param estimates: list of arguments of estimate_memory_usage, as in
+    Simulation, the simulations run together
+    """
+    if memory_limit is None:
+        return
+    estimate = sum(estimate_memory_usage(system_utilization, resource,
+                                         allocator, **kwargs)
+                   for resource, allocator, kwargs in estimates)
+    # every estimate includes the memory already used by the process
+    estimate -= (len(estimates) - 1) * psutil.Process().memory_info().rss
+    print 'estimated memory usage: %d MB' % (estimate // 2**20)
+    if estimate > memory_limit:
+        raise MemoryError('Estimated memory usage (%d MB) exceeds the memory '
+                          'limit (%d MB)' % (estimate // 2**20,
+                                             memory_limit // 2**20))
 
 
-def simulate_task_allocation(allocator, tasks_file, saving_file):
+def simulate_task_allocation(allocator, tasks_file, saving_file,
+                             memory_limit=None):
+    """
+    :param allocator: allocator or list of allocators, simulated in lockstep
+    :param saving_file: saving file of the allocator or list with one per
+    allocator
+    """
+    if isinstance(allocator, Arrival):
+        allocator, saving_file = [allocator], [saving_file]
     done = threading.Event()
-    saving_thread = threading.Thread(target=save_from_deque, args=(
-        allocator.finished_tasks, saving_file, tasks_file_header, done))
-    saving_thread.start()
-    allocator.simulate(tasks_generator(tasks_file))
+    saving_threads = [threading.Thread(target=save_from_deque, args=(
+        a.finished_tasks, f, tasks_file_header, done))
+        for a, f in zip(allocator, saving_file)]
+    monitor = MemoryMonitor(memory_limit)
+    for saving_thread in saving_threads:
+        saving_thread.start()
+    monitor.start()
+    simulate_in_lockstep(allocator,
+                         merged_tasks_generator(_tasks_files(tasks_file)))
     done.set()
-    saving_thread.join()
+    for saving_thread in saving_threads:
+        saving_thread.join()
+    monitor.stop()
+    print 'peak memory usage: %d MB' % (monitor.peak_rss // 2**20)
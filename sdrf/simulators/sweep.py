@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+import errno
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from itertools import product
+from os import path
+
+from sdrf.simulators.simulate_task_allocation import fan_out, output_name
+from sdrf.tasks.system_utilization import SystemUtilization
+
+
+# Sweeps coordinated through a shared directory (e.g., on NFS) instead of a
+# job scheduler. create_sweep writes the grid points to a manifest and
+# workers, on any number of nodes, claim and simulate them one at a time.
+#
+# A point is claimed by creating its lock file with O_EXCL, which a single
+# worker can do, and the worker keeps touching the lock (its heartbeat) while
+# simulating. A lock that is not touched for stale_after seconds belongs to a
+# worker that died, it is renamed away (again, a single worker can do it) and
+# the point is claimed again. Lock ages are measured against the time of the
+# file server, from a file created right before, so the clocks of the nodes
+# don't matter.
+#
+# Results are simulated to a temporary directory of the worker and then
+# renamed to the sweep directory, with their FileName, so they are either
+# complete or missing. A marker in done/ records who simulated each point.
+manifest_name = 'manifest.json'
+default_heartbeat = 30.0
+stale_heartbeats = 10
+
+
+def sweep_parameters(allocator, resources, deltas=(), vary=(), **options):
+    """
+    Grid points of a sweep
+    :param allocator: 'sdrf' or 'wdrf'
+    :param deltas: only used by sdrf
+    :param vary: flags (same_share, reserved or use_weights) simulated both
+    disabled and enabled
+    :param options: other arguments of sdrf or wdrf, the same for every point
+    :return: list of dicts with the arguments of sdrf or wdrf, as in fan_out
+    """
+    if allocator == 'wdrf':
+        grid = [dict(resource_percentage=r) for r in resources]
+    else:
+        grid = [dict(resource_percentage=r, delta=d)
+                for r, d in product(resources, deltas)]
+    parameters = []
+    for point in grid:
+        for values in product([False, True], repeat=len(vary)):
+            kwargs = dict(options)
+            kwargs.update(point)
+            kwargs.update(zip(vary, values))
+            parameters.append(kwargs)
+    return parameters
+
+
+def create_sweep(sweep_dir, tasks_file, allocator, parameters,
+                 memory_budget=None, memory_limit=None,
+                 heartbeat=default_heartbeat, stale_after=None):
+    """
+    :param tasks_file: tasks file or list of files to be merged, with the same
+    path on every node
+    :param parameters: list of dicts with the arguments of sdrf or wdrf (see
+    sweep_parameters), each one is a point
+    :param memory_budget: (optional) in bytes, the utilization is calculated
+    reading the tasks in chunks, see SystemUtilization
+    :param memory_limit: (optional) in bytes, of every simulation, see fan_out
+    :param heartbeat: seconds between the touches of a lock by its worker
+    :param stale_after: (optional) seconds after which a lock that is not
+    touched is claimed again, defaults to 10 heartbeats
+    :return: the manifest
+    """
+    if path.exists(path.join(sweep_dir, manifest_name)):
+        raise ValueError('There is a sweep in %s already' % sweep_dir)
+    if isinstance(tasks_file, basestring):
+        tasks_file = [tasks_file]
+
+    points = []
+    ids = set()
+    for kwargs in parameters:
+        output = output_name(allocator, kwargs)
+        point_id = path.splitext(output)[0]
+        if point_id in ids:
+            raise ValueError('More than one point is saved to %s' % output)
+        ids.add(point_id)
+        points.append({'id': point_id, 'output': output,
+                       'parameters': kwargs})
+
+    # the resources of the users are calculated (when not cached) once here,
+    # instead of by every worker when they start
+    SystemUtilization(tasks_file, memory_budget=memory_budget).cpu_mean
+
+    manifest = {'tasks_file': [path.abspath(f) for f in tasks_file],
+                'allocator': allocator, 'memory_budget': memory_budget,
+                'memory_limit': memory_limit,
+                'heartbeat': heartbeat,
+                'stale_after': stale_after or stale_heartbeats * heartbeat,
+                'points': points}
+    for directory in [sweep_dir, path.join(sweep_dir, 'locks'),
+                      path.join(sweep_dir, 'done'),
+                      path.join(sweep_dir, 'tmp')]:
+        if not path.isdir(directory):
+            os.makedirs(directory)
+    _write_json(path.join(sweep_dir, manifest_name), manifest)
+    return manifest
+
+
+def read_manifest(sweep_dir):
+    with open(path.join(sweep_dir, manifest_name)) as f:
+        return json.load(f)
+
+
+def work(sweep_dir, worker=None, wait=True, max_points=None):
+    """
+    Simulates the points of the sweep that are not done, one at a time
+    :param worker: (optional) name shown by sweep_status, defaults to the host
+    name and the process id
+    :param wait: when every point left is claimed by other workers, wait for
+    them (claiming the stale ones) instead of returning
+    :param max_points: (optional) return after simulating this many points
+    :return: ids of the points simulated by this worker
+    """
+    manifest = read_manifest(sweep_dir)
+    worker = worker or '%s-%d' % (socket.gethostname(), os.getpid())
+    token = uuid.uuid4().hex
+    simulated = []
+    while max_points is None or len(simulated) < max_points:
+        pending = [p for p in manifest['points']
+                   if not path.exists(_done_file(sweep_dir, p['id']))]
+        if not pending:
+            break
+        now = _server_time(sweep_dir)
+        for point in pending:
+            claim = _claim(sweep_dir, point['id'], worker, token,
+                           manifest['heartbeat'], manifest['stale_after'],
+                           now)
+            if claim is not None:
+                break
+        else:
+            if not wait:
+                break
+            time.sleep(manifest['heartbeat'])
+            continue
+
+        try:
+            # it may have been finished (and unlocked) since it was listed
+            if path.exists(_done_file(sweep_dir, point['id'])):
+                continue
+            if _simulate(sweep_dir, manifest, point, worker, token, claim):
+                simulated.append(point['id'])
+        finally:
+            claim.release()
+    return simulated
+
+
+def sweep_status(sweep_dir):
+    """
+    :return: dict with the number of points and of the ones done, running
+    (locked by a worker sending heartbeats), stale (locked by a worker that
+    stopped) and pending, and how many points are done, running or stale by
+    each worker
+    """
+    manifest = read_manifest(sweep_dir)
+    now = _server_time(sweep_dir)
+    status = {'points': len(manifest['points']), 'done': 0, 'running': 0,
+              'stale': 0, 'pending': 0, 'workers': {}}
+    for point in manifest['points']:
+        state, worker = _point_state(sweep_dir, point['id'],
+                                     manifest['stale_after'], now)
+        status[state] += 1
+        if worker is not None:
+            workers = status['workers']
+            if worker not in workers:
+                workers[worker] = {'done': 0, 'running': 0, 'stale': 0}
+            workers[worker][state] += 1
+    return status
+
+
+class _Claim(object):
+    """
+    Lock of a point held by this worker, touched by a thread every heartbeat.
+    lost is set if the lock is claimed by another worker (after missing too
+    many heartbeats)
+    """
+    def __init__(self, lock_file, token, heartbeat):
+        self.lock_file = lock_file
+        self.token = token
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, args=(heartbeat,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _beat(self, heartbeat):
+        while not self._stop.wait(heartbeat):
+            if not _owns(self.lock_file, self.token):
+                self.lost.set()
+                return
+            os.utime(self.lock_file, None)
+
+    def release(self):
+        self._stop.set()
+        self._thread.join()
+        if _owns(self.lock_file, self.token):
+            os.remove(self.lock_file)
+
+
+def _claim(sweep_dir, point_id, worker, token, heartbeat, stale_after, now):
+    """
+    :param now: time of the file server
+    :return: _Claim, None if the point is claimed by another worker
+    """
+    lock_file = path.join(sweep_dir, 'locks', point_id + '.lock')
+    try:
+        fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+        if not _remove_stale(lock_file, token, stale_after, now):
+            return None
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return None
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'worker': worker, 'token': token}, f)
+    return _Claim(lock_file, token, heartbeat)
+
+
+def _remove_stale(lock_file, token, stale_after, now):
+    """
+    :return: True if the lock was stale (or no longer exists) and was removed
+    """
+    try:
+        if now - os.stat(lock_file).st_mtime < stale_after:
+            return False
+    except OSError:
+        return True
+    moved = '%s.%s.stale' % (lock_file, token)
+    try:
+        os.rename(lock_file, moved)
+    except OSError:
+        return False  # removed by another worker
+    # another worker may have removed it and claimed the point again since
+    # the stat, in which case the lock is put back
+    stale = now - os.stat(moved).st_mtime >= stale_after
+    if not stale:
+        try:
+            os.link(moved, lock_file)
+        except OSError:
+            pass
+    os.remove(moved)
+    return stale
+
+
+def _owns(lock_file, token):
+    try:
+        with open(lock_file) as f:
+            return json.load(f)['token'] == token
+    except (IOError, ValueError, KeyError):
+        return False
+
+
+def _simulate(sweep_dir, manifest, point, worker, token, claim):
+    """
+    :return: True if the point was simulated and its results saved, False if
+    the claim was lost meanwhile (the results are discarded)
+    """
+    tasks_file = manifest['tasks_file']
+    if len(tasks_file) == 1:
+        tasks_file = tasks_file[0]
+    scratch = tempfile.mkdtemp(prefix=token,
+                               dir=path.join(sweep_dir, 'tmp'))
+    try:
+        start = time.time()
+        fan_out(tasks_file, scratch, manifest['allocator'],
+                [point['parameters']], manifest['memory_budget'],
+                memory_limit=manifest['memory_limit'])
+        if claim.lost.is_set():
+            return False
+        # the result and any other file saved with it (e.g., snapshots)
+        for name in os.listdir(scratch):
+            os.rename(path.join(scratch, name), path.join(sweep_dir, name))
+        _write_json(_done_file(sweep_dir, point['id']), {
+            'worker': worker, 'output': point['output'],
+            'seconds': time.time() - start})
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return True
+
+
+def _point_state(sweep_dir, point_id, stale_after, now):
+    """
+    :return: state (done, running, stale or pending) and worker (None when
+    pending or unknown)
+    """
+    try:
+        with open(_done_file(sweep_dir, point_id)) as f:
+            return 'done', json.load(f)['worker']
+    except IOError:
+        pass
+    lock_file = path.join(sweep_dir, 'locks', point_id + '.lock')
+    try:
+        age = now - os.stat(lock_file).st_mtime
+        with open(lock_file) as f:
+            worker = json.load(f)['worker']
+    except (IOError, OSError):
+        return 'pending', None
+    except (ValueError, KeyError):
+        worker = None  # just created
+    return ('running' if age < stale_after else 'stale'), worker
+
+
+def _done_file(sweep_dir, point_id):
+    return path.join(sweep_dir, 'done', point_id + '.json')
+
+
+def _server_time(sweep_dir):
+    fd, name = tempfile.mkstemp(dir=path.join(sweep_dir, 'tmp'))
+    os.close(fd)
+    try:
+        return os.stat(name).st_mtime
+    finally:
+        os.remove(name)
+
+
+def _write_json(file_name, obj):
+    # written to a temporary file first, so that readers never see it partial
+    temporary = '%s.%s' % (file_name, uuid.uuid4().hex)
+    with open(temporary, 'w') as f:
+        json.dump(obj, f, sort_keys=True, indent=1)
+    os.rename(temporary, file_name)
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+import cPickle as pickle
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from math import log
+from operator import attrgetter
+from os import path
+
+import numpy as np
+
+from sdrf.allocators import Task
+from sdrf.allocators.sdrf import time_scale_multiplier
+from sdrf.helpers.results_manifest import ResultsManifest, resources_sha
+from sdrf.simulators.simulate_task_allocation import build_sdrf, \
+    output_name, up_to_date
+from sdrf.tasks import first_submit_time, last_submit_time, \
+    save_from_deque, submit_time_position, tasks_file_header, tasks_generator
+from sdrf.tasks.system_utilization import SystemUtilization
+
+
+# Time-parallel SDRF (parareal style). The trace is split in time windows that
+# are simulated at the same time in separate processes. The state at the
+# beginning of each window (commitments, allocations, running and waiting
+# tasks) is first estimated by starting its simulation some time earlier (the
+# warm up) with nobody committed. Commitments decay by a factor e every tau,
+# so by default the warm up is long enough for the ones from before it to
+# decay below the tolerance. Tasks waiting or running since before it are
+# missed, though.
+#
+# Then, in each iteration, the windows whose initial state is not the same as
+# the final state of the previous window are simulated again from it. The
+# first window is always exact, so after k iterations at least k + 1 windows
+# are, and the iterations stop once every window starts from the state the
+# previous one ended with. Tasks must be the same and commitments and
+# allocations are compared with a relative tolerance, the largest difference
+# accepted is reported as the error bound.
+def time_parallel_sdrf(tasks_file, saving_dir, resource_percentage, delta,
+                       same_share=False, reserved=False, fast_path=False,
+                       coalesce_events=False, windows=2, processes=None,
+                       warmup=None, tolerance=1e-9, max_iterations=None,
+                       buckets=None, epoch=None, memoize=False, force=False):
+    """
+    :param windows: number of time windows (of the same length)
+    :param processes: (optional) defaults to the number of windows
+    :param warmup: (optional) in seconds, defaults to tau * log(1 / tolerance)
+    :param max_iterations: (optional) defaults to the number of windows, which
+    is enough for the result to be exact (up to the tolerance)
+    :param epoch: (optional) in seconds, see SDRF
+    :param memoize: skip the simulation if its result in saving_dir is up to
+    date and record the new result (when converged), see fan_out
+    :param force: with memoize, simulate it anyway
+    :return: dict with the number of iterations, windows simulated, whether
+    it converged and the error bound, None when up to date
+    """
+    if not isinstance(tasks_file, basestring):
+        raise ValueError('Time-parallel simulations take a single tasks file')
+    if not path.isdir(saving_dir):
+        os.makedirs(saving_dir)
+    system_utilization = SystemUtilization(tasks_file)
+    parameters = dict(resource_percentage=resource_percentage, delta=delta,
+                      same_share=same_share, reserved=reserved,
+                      fast_path=fast_path, coalesce_events=coalesce_events,
+                      buckets=buckets, epoch=epoch)
+    if memoize:
+        manifest = ResultsManifest(saving_dir,
+                                   system_utilization.tasks_file_sha,
+                                   resources_sha(system_utilization))
+        if not force and up_to_date(manifest, saving_dir, 'sdrf',
+                                    parameters):
+            return None
+    # the users get their indices here and every window is given them, so
+    # that the states exchanged by the windows (indexed by user) agree
+    allocator = _build_allocator(system_utilization, parameters,
+                                 first_submit_time(tasks_file))
+    users = Task.user_ids()
+    if warmup is None:
+        warmup = allocator.tau * log(1.0 / tolerance)
+    else:
+        warmup *= time_scale_multiplier
+    if max_iterations is None:
+        max_iterations = windows
+
+    first_time = first_submit_time(tasks_file)
+    last_time = last_submit_time(tasks_file)
+    boundaries = np.linspace(first_time, last_time + 1,
+                             windows + 1).astype(np.int64).tolist()
+    starts = boundaries[:-1]
+    ends = boundaries[1:-1] + [None]
+
+    saving_file = path.join(saving_dir, output_name('sdrf', parameters))
+    temp_dir = tempfile.mkdtemp(dir=saving_dir)
+    try:
+        def run(indices, iteration, initial_states):
+            arguments = []
+            for i in indices:
+                warmup_start = max(first_time, starts[i] - int(warmup))
+                arguments.append((tasks_file, path.join(
+                    temp_dir, '%d-%d.csv' % (i, iteration)), parameters,
+                    users, starts[i], ends[i], warmup_start,
+                    initial_states[i]))
+            return dict(zip(indices, _run_windows(arguments, temp_dir,
+                                                  processes or windows)))
+
+        # (output file, initial state, final state) of each window
+        results = run(range(windows), 0, [None] * windows)
+        simulated = windows
+        iteration = 0
+        while True:
+            differences = [_state_difference(results[i - 1][2],
+                                             results[i][1])
+                           for i in xrange(1, windows)]
+            changed = [i + 1 for i, difference in enumerate(differences)
+                       if difference > tolerance]
+            if not changed or iteration >= max_iterations:
+                break
+            iteration += 1
+            print 'iteration %d: simulating windows %s' % (iteration,
+                                                           changed)
+            states = [results[i - 1][2] if i in changed else None
+                      for i in xrange(windows)]
+            results.update(run(changed, iteration, states))
+            simulated += len(changed)
+
+        with open(saving_file, 'wb') as f:
+            for i in xrange(windows):
+                _copy_window(results[i][0], f, starts[i])
+    finally:
+        shutil.rmtree(temp_dir)
+
+    error = max(differences + [0.0])
+    report = {'iterations': iteration, 'windows_simulated': simulated,
+              'converged': not changed, 'error_bound': error}
+    if changed:
+        print 'Not converged, windows %s differ' % changed
+    elif memoize:
+        manifest.record('sdrf', parameters, [saving_file])
+    print 'iterations: %d, windows simulated: %d, error bound: %g' % (
+        iteration, simulated, error)
+    return report
+
+
+def _run_windows(arguments, temp_dir, processes):
+    """
+    Runs _simulate_window for each arguments, in up to processes processes
+    (the tasks loader can't run in a multiprocessing.Pool)
+    :return: list of results
+    """
+    result_files = [path.join(temp_dir, 'result-%d.pickle' % i)
+                    for i in xrange(len(arguments))]
+    pending = zip(arguments, result_files)
+    running = []
+    while pending or running:
+        while pending and len(running) < processes:
+            process = multiprocessing.Process(target=_window_process,
+                                              args=pending.pop(0))
+            process.start()
+            running.append(process)
+        process = running.pop(0)
+        process.join()
+        if process.exitcode != 0:
+            for other_process in running:
+                other_process.terminate()
+            raise RuntimeError('Failed to simulate a time window')
+
+    results = []
+    for result_file in result_files:
+        with open(result_file, 'rb') as f:
+            results.append(pickle.load(f))
+    return results
+
+
+def _window_process(arguments, result_file):
+    result = _simulate_window(arguments)
+    with open(result_file, 'wb') as f:
+        pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+
+
+def _build_allocator(system_utilization, parameters, start_time,
+                     initial_commitments=None):
+    epoch = parameters['epoch']
+    if epoch is not None:
+        epoch *= time_scale_multiplier
+    return build_sdrf(system_utilization, parameters['resource_percentage'],
+                      parameters['delta'], start_time,
+                      parameters['same_share'], parameters['reserved'],
+                      initial_commitments=initial_commitments,
+                      fast_path=parameters['fast_path'],
+                      coalesce_events=parameters['coalesce_events'],
+                      buckets=parameters['buckets'], epoch=epoch)
+
+
+def _boundary_state(allocator, time):
+    """
+    State of the allocator at time, which must be after every event so far
+    """
+    allocator._sync_users()
+    snapshot = allocator.commitment_snapshot(time)
+    running = allocator._tasks_by_id
+    tasks = sorted(itertools.chain(running.itervalues(),
+                                   *allocator.users_queues.values()),
+                   key=attrgetter('count'))
+    return {'tasks': [(t.user_id, t.task_id, t.start_time, t.finish_time,
+                       t.cpu, t.memory, t.submit_time, t.count in running)
+                      for t in tasks],
+            'consumed_resources': allocator.consumed_resources.copy(),
+            'allocations': allocator.allocations.copy(),
+            'commitments': np.column_stack([snapshot['cpu_commitment'],
+                                            snapshot['memory_commitment']])}
+
+
+def _resume(allocator, state):
+    running_tasks = []
+    queued_tasks = []
+    for user_id, task_id, start_time, finish_time, cpu, memory, \
+            submit_time, is_running in state['tasks']:
+        task = Task(user_id, task_id, start_time, finish_time, (cpu, memory),
+                    submit_time)
+        if is_running:
+            running_tasks.append(task)
+        else:
+            queued_tasks.append(task)
+    allocator.resume(running_tasks, queued_tasks,
+                     state['consumed_resources'], state['allocations'])
+
+
+def _relative_difference(a, b):
+    scale = max(np.abs(a).max(), np.abs(b).max())
+    if scale == 0:
+        return 0.0
+    return float(np.abs(a - b).max() / scale)
+
+
+def _state_difference(state, other_state):
+    """
+    :return: largest relative difference of commitments and allocations, or
+    inf if tasks are not the same
+    """
+    if state['tasks'] != other_state['tasks']:
+        return np.inf
+    return max(_relative_difference(state[key], other_state[key])
+               for key in ['consumed_resources', 'allocations',
+                           'commitments'])
+
+
+def _simulate_window(arguments):
+    """
+    Simulates a window, the events in [start, end), from its initial state or
+    from the warm up start when it is None. Every task finished is saved,
+    including the ones before the window starts
+    :return: (saving file, initial state, final state), the initial state is
+    None for the first window and the final state for the last
+    """
+    tasks_file, saving_file, parameters, users, start, end, warmup_start, \
+        initial_state = arguments
+    Task.set_user_index(users)
+    system_utilization = SystemUtilization(tasks_file)
+    if initial_state is None:
+        allocator = _build_allocator(system_utilization, parameters,
+                                     warmup_start)
+        boundaries = [start] if start > warmup_start else []
+    else:
+        allocator = _build_allocator(system_utilization, parameters, start,
+                                     initial_state['commitments'])
+        _resume(allocator, initial_state)
+        warmup_start = start
+        boundaries = []
+    if end is not None:
+        boundaries.append(end)
+
+    done = threading.Event()
+    saving_thread = threading.Thread(target=save_from_deque, args=(
+        allocator.finished_tasks, saving_file, tasks_file_header, done))
+    saving_thread.start()
+
+    def state_at(time):
+        # every task finishing before time, as _finish_tasks_until would take
+        # them one event time after the other, but none finishing at time,
+        # which belong to the next window with the arrivals at time
+        while True:
+            next_event = allocator.running_tasks.get_min()
+            if next_event is None or next_event[0] >= time:
+                break
+            allocator._finish_tasks_until(next_event[0])
+        allocator._scheduling_pass()
+        return _boundary_state(allocator, time)
+
+    states = []
+    tasks = tasks_generator(tasks_file, progress_label=path.basename(
+        saving_file), position=submit_time_position(tasks_file,
+                                                    warmup_start))
+    for submit_time, arrivals in itertools.groupby(
+            tasks, attrgetter('submit_time')):
+        while boundaries and submit_time >= boundaries[0]:
+            states.append(state_at(boundaries.pop(0)))
+        if end is not None and submit_time >= end:
+            break
+        allocator._simulate_arrivals(submit_time, list(arrivals))
+    tasks.close()
+    while boundaries:
+        states.append(state_at(boundaries.pop(0)))
+    if end is None:
+        allocator._end_simulation(np.inf)
+    done.set()
+    saving_thread.join()
+
+    if initial_state is None and start > warmup_start:
+        initial_state = states.pop(0)
+    final_state = states.pop() if end is not None else None
+    return saving_file, initial_state, final_state
+
+
+def _copy_window(window_file, f, start):
+    # tasks finished during the warm up belong to previous windows
+    with open(window_file, 'rb') as window:
+        for line in window:
+            if int(line.split(',', 3)[2]) >= start:
+                f.write(line)
@@ -1,15 +1,15 @@
 # -*- coding: utf-8 -*-
 import csv
-import threading
-from Queue import Queue
+import ctypes as ct
+import heapq
+import multiprocessing
+import traceback
 from time import sleep
 import os
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
 from sdrf.allocators import Task
-from sdrf.helpers import get_line_number
-from sdrf.helpers.schema import SchemaIndex
 
 tasks_file_header = ['submit_time', 'start_time', 'finish_time', 'user_id',
                      'task_id', 'cpu', 'memory']
@@ -44,59 +44,298 @@ def save_from_deque(task_deque, saving_file, header, done=None,
     save_max()
 
 
-def file_loader(file_name, out_queue, stop_time=None, truncate=False):
+# Tasks files may also be saved in a binary format (see sort_tasks), a numpy
+# structured array with the same columns as the csv. These are recognized by
+# the extension and can be used everywhere a csv tasks file is expected.
+binary_extension = '.npy'
+
+
+def is_binary(tasks_file):
+    return tasks_file.endswith(binary_extension)
+
+
+def tasks_dtype(user_id_size):
+    return np.dtype([('submit_time', np.int64), ('start_time', np.int64),
+                     ('finish_time', np.int64),
+                     ('user_id', 'S%d' % max(user_id_size, 1)),
+                     ('task_id', 'S%d' % task_id_size),
+                     ('cpu', np.float64), ('memory', np.float64)])
+
+
+def read_tasks(tasks_file):
+    """
+    Reads a whole tasks file, csv or binary, to a DataFrame
+    """
+    if is_binary(tasks_file):
+        return pd.DataFrame(np.load(tasks_file))
+    return pd.read_csv(tasks_file, header=None, index_col=False,
+                       names=tasks_file_header)
+
+
+def tasks_chunks(tasks_file, chunksize, position=0):
+    """
+    Reads a tasks file, csv or binary, in chunks
+    :param position: (optional) where to start reading from, see
+    submit_time_position
+    :return: iterator of (DataFrame, file offset after the chunk)
+    """
+    if is_binary(tasks_file):
+        tasks = np.load(tasks_file, mmap_mode='r')
+        file_size = os.path.getsize(tasks_file)
+        for start in xrange(position, len(tasks), chunksize):
+            end = min(start + chunksize, len(tasks))
+            offset = file_size - (len(tasks) - end) * tasks.itemsize
+            yield pd.DataFrame(np.array(tasks[start:end])), offset
+        return
+
+    with open(tasks_file, 'rb') as f:
+        f.seek(position)
+        csv_reader = pd.read_csv(f, header=None, index_col=False,
+                                 names=tasks_file_header,
+                                 dtype={'task_id': str}, chunksize=chunksize)
+        for df in csv_reader:
+            yield df, f.tell()
+
+
+def first_submit_time(tasks_file):
+    if is_binary(tasks_file):
+        return int(np.load(tasks_file, mmap_mode='r')[0]['submit_time'])
+    with open(tasks_file, 'rb') as f:
+        return int(csv.reader(f).next()[0])
+
+
+def last_submit_time(tasks_file):
+    if is_binary(tasks_file):
+        return int(np.load(tasks_file, mmap_mode='r')[-1]['submit_time'])
+    with open(tasks_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        return int(f.read().splitlines()[-1].split(',', 1)[0])
+
+
+def submit_time_position(tasks_file, time):
+    """
+    Position of the first task submitted at or after the given time, tasks
+    must be sorted by submit time
+    :return: row for binary files and byte offset for csv files
+    """
+    if is_binary(tasks_file):
+        tasks = np.load(tasks_file, mmap_mode='r')
+        return int(np.searchsorted(tasks['submit_time'], time))
+
+    with open(tasks_file, 'rb') as f:
+        def line_start(offset):
+            # first line starting at or after offset
+            if offset > 0:
+                f.seek(offset - 1)
+                f.readline()
+                offset = f.tell()
+            return offset
+
+        low = 0
+        high = os.path.getsize(tasks_file)
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(line_start(middle))
+            line = f.readline()
+            if not line or int(line.split(',', 1)[0]) >= time:
+                high = middle
+            else:
+                low = middle + 1
+        return line_start(low)
+
+
+# Tasks are loaded by a separate process (_load_batches) that parses the file
+# with pandas and writes them in batches of columns to a ring buffer in shared
+# memory. Users are sent as integer codes, the user_id of each new code is sent
+# separately through a queue. Task ids are kept in the buffer as strings of up
+# to task_id_size characters, the ones of a batch with longer task ids are sent
+# through another queue instead. The simulator process only copies whole
+# batches out of the buffer and creates the Task objects.
+batch_size = 10000
+num_slots = 4
+task_id_size = 64
+
+_batch_columns = [('submit_time', ct.c_int64), ('start_time', ct.c_int64),
+                  ('finish_time', ct.c_int64), ('user_id', ct.c_int32),
+                  ('cpu', ct.c_double), ('memory', ct.c_double)]
+
+# batch sizes used to signal the end of the file and errors in the loader
+_end_of_file = -1
+_loader_error = -2
+
+
+class TaskBatches(object):
+    def __init__(self, slots=None, size=None):
+        """
+        :param slots: (optional) number of batches in the buffer, defaults to
+        num_slots
+        :param size: (optional) tasks per batch, defaults to batch_size
+        """
+        self.slots = slots = slots or num_slots
+        self.size = size = size or batch_size
+        self.free_slots = multiprocessing.Semaphore(slots)
+        self.ready_slots = multiprocessing.Semaphore(0)
+        self.new_users = multiprocessing.Queue()
+        self.long_task_ids = multiprocessing.Queue()
+        # (batch size, number of new users, file offset, task ids in
+        # long_task_ids) for each slot
+        self._info = multiprocessing.RawArray(ct.c_int64, slots * 4)
+        self._columns = [(name, multiprocessing.RawArray(c_type, slots * size))
+                         for name, c_type in _batch_columns]
+        self._task_ids = multiprocessing.RawArray(ct.c_char,
+                                                  slots * size * task_id_size)
+
+    def views(self):
+        """
+        numpy views of the shared buffers, must be called by each process
+        :return: (info, columns dict, task_id)
+        """
+        info = np.ctypeslib.as_array(self._info).reshape(self.slots, 4)
+        columns = {name: np.ctypeslib.as_array(array).reshape(self.slots,
+                                                              self.size)
+                   for name, array in self._columns}
+        task_id = np.ctypeslib.as_array(self._task_ids).view(
+            'S%d' % task_id_size).reshape(self.slots, self.size)
+        return info, columns, task_id
+
+
+def _load_batches(tasks_file, batches, stop_time=None, truncate=False,
+                  position=0):
+    info, columns, task_id = batches.views()
+    users = {}
+    slot = 0
+
+    def send(batch_size, new_users, offset, long_task_ids=False):
+        info[slot] = batch_size, len(new_users), offset, long_task_ids
+        for user in new_users:
+            batches.new_users.put(user)
+        batches.ready_slots.release()
+
+    try:
+        for df, offset in tasks_chunks(tasks_file, batches.size, position):
+            if stop_time is not None:
+                df = df[df['start_time'] <= stop_time].copy()
+                if truncate:
+                    df['finish_time'] = df['finish_time'].clip(
+                        upper=stop_time)
+            long_task_ids = df['task_id'].str.len().max() > task_id_size
+
+            new_users = []
+            for user_id in df['user_id'].unique():
+                if user_id not in users:
+                    users[user_id] = len(users)
+                    new_users.append((users[user_id], user_id))
+
+            num_tasks = len(df)
+            batches.free_slots.acquire()
+            for name, _ in _batch_columns:
+                if name == 'user_id':
+                    values = df['user_id'].map(users).values
+                else:
+                    values = df[name].values
+                columns[name][slot, :num_tasks] = values
+            if long_task_ids:
+                batches.long_task_ids.put(df['task_id'].tolist())
+            else:
+                task_id[slot, :num_tasks] = df['task_id'].values
+            send(num_tasks, new_users, offset, long_task_ids)
+            slot = (slot + 1) % batches.slots
+
+        batches.free_slots.acquire()
+        send(_end_of_file, [], os.path.getsize(tasks_file))
+    except Exception:
+        info[slot] = _loader_error, 1, 0, False
+        batches.new_users.put(traceback.format_exc())
+        batches.ready_slots.release()
+
+
+def tasks_generator(tasks_file, stop_time=None, truncate=False,
+                    progress_label=None, position=0):
     """
-    Loads tasks file adding each task to the queue
-    :param file_name: tasks file name
-    :param out_queue: tasks will be appended to this queue
+    Loads tasks from the file in a separate process
+    :param tasks_file: tasks file name
     :param stop_time: (optional) when this is provided, tasks that start after
-    this time will not be loaded to the queue.
+    this time will not be loaded.
     :param truncate: (optional) truncate tasks if stop_time is provided
+    :param progress_label: (optional) printed before the progress percentage
+    :param position: (optional) where to start loading from, see
+    submit_time_position
     """
-    chunk_size = out_queue.maxsize
-    if out_queue.maxsize == 0:
-        chunk_size = None  # read the entire thing at once
-    csv_reader = pd.read_csv(file_name, header=None, index_col=False,
-                             chunksize=chunk_size, names=tasks_file_header)
-    task_index = SchemaIndex(tasks_file_header)
-    for df in csv_reader:
-        for task_line in df.itertuples():
-            submit_time = task_line[task_index['submit_time']]
-            start_time = task_line[task_index['start_time']]
-            finish_time = task_line[task_index['finish_time']]
+    batches = TaskBatches()
+    loader = multiprocessing.Process(target=_load_batches,
+                                     args=(tasks_file, batches, stop_time,
+                                           truncate, position))
+    loader.daemon = True
+    loader.start()
 
-            if stop_time is not None:
-                if start_time > stop_time:
-                    continue
-                if truncate and (finish_time > stop_time):
-                    finish_time = stop_time
-
-            user_index = task_line[task_index['user_id']]
-            demands = (task_line[task_index['cpu']],
-                       task_line[task_index['memory']])
-            task_id = task_line[task_index['task_id']]
-            task = Task(user_index, task_id, start_time, finish_time, demands,
-                        submit_time)
-            out_queue.put(task)
-    out_queue.put(None)
-
-
-def tasks_generator(tasks_file, stop_time=None, truncate=False):
-    line_queue = Queue(10000)
-    loading_thread = threading.Thread(target=file_loader,
-                                      args=(tasks_file, line_queue, stop_time,
-                                            truncate))
-    loading_thread.start()
-    task_counter = 0
-    num_tasks = get_line_number(tasks_file)
+    info, columns, task_id = batches.views()
+    users = {}
+    file_size = max(os.path.getsize(tasks_file), 1)
     last_percentage = -1
-    for task in iter(line_queue.get, None):
-        task_counter += 1
-        percentage = task_counter * 100 / num_tasks
-        if percentage > last_percentage:
-            last_percentage = percentage
-            print percentage, '%'
-        yield task
+    slot = 0
+    try:
+        while True:
+            batches.ready_slots.acquire()
+            num_tasks, num_new_users, offset, long_task_ids = info[slot]
+            if num_tasks == _loader_error:
+                raise RuntimeError('Failed to load tasks:\n' +
+                                   batches.new_users.get())
+            for _ in xrange(num_new_users):
+                code, user_id = batches.new_users.get()
+                users[code] = user_id
+
+            percentage = offset * 100 / file_size
+            if percentage > last_percentage:
+                last_percentage = percentage
+                if progress_label is None:
+                    print percentage, '%'
+                else:
+                    print progress_label, percentage, '%'
+
+            if num_tasks == _end_of_file:
+                break
+
+            batch = [columns[name][slot, :num_tasks].tolist()
+                     for name, _ in _batch_columns]
+            if long_task_ids:
+                batch.append(batches.long_task_ids.get())
+            else:
+                batch.append(task_id[slot, :num_tasks].tolist())
+            batches.free_slots.release()
+            slot = (slot + 1) % batches.slots
+
+            for submit_time, start_time, finish_time, user, cpu, memory, \
+                    task in zip(*batch):
+                yield Task(users[user], task, start_time, finish_time,
+                           (cpu, memory), submit_time)
+    finally:
+        if loader.is_alive():
+            loader.terminate()
+        loader.join()
 
-    # for task in tqdm(iter(line_queue.get, None), total=num_tasks):
-    #     yield task
+
+def merged_tasks_generator(tasks_files, stop_time=None, truncate=False):
+    """
+    Merges tasks from multiple files, each one sorted by submit_time, keeping
+    the submit_time order. Only one batch per file is kept in memory. Tasks
+    submitted at the same time are taken from the files in the given order.
+    :param tasks_files: list of tasks file names
+    """
+    if len(tasks_files) == 1:
+        for task in tasks_generator(tasks_files[0], stop_time, truncate):
+            yield task
+        return
+
+    # heapq.merge has no key in python 2, so tasks are decorated with the
+    # submit time, the file and their position in the file
+    def decorated_tasks(file_index, tasks_file):
+        tasks = tasks_generator(tasks_file, stop_time, truncate,
+                                os.path.basename(tasks_file))
+        for position, task in enumerate(tasks):
+            yield task.submit_time, file_index, position, task
+
+    merged = heapq.merge(*[decorated_tasks(i, f)
+                           for i, f in enumerate(tasks_files)])
+    for _, _, _, task in merged:
+        yield task
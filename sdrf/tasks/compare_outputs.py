@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from sdrf.tasks import tasks_file_header
+
+
+def read_output(output_file):
+    output_df = pd.read_csv(output_file, header=None, index_col=False,
+                            names=tasks_file_header)
+    output_df['order'] = np.arange(len(output_df))
+    return output_df.set_index(['user_id', 'task_id'])
+
+
+def users_wait_time_difference(output_a, output_b):
+    """
+    :param output_a: output read with read_output
+    :param output_b: output read with read_output
+    :return: Series with the mean wait time (start - submit) of each user in
+    output_b minus the one in output_a, using the tasks in both
+    """
+    common = output_a.index.intersection(output_b.index)
+    mean_waits = []
+    for output in [output_a, output_b]:
+        tasks = output.loc[common]
+        wait = tasks['start_time'] - tasks['submit_time']
+        mean_waits.append(wait.groupby(level='user_id').mean())
+    return mean_waits[1] - mean_waits[0]
+
+
+def compare_outputs(file_a, file_b):
+    """
+    Compares two simulation outputs generated from the same tasks file, e.g.,
+    an approximate simulation (file_b) with the exact one (file_a)
+    :return: dict with the number of tasks that are missing in one of the
+    outputs, the number (and fraction) of tasks started at different times,
+    the largest start time difference, the largest and mean absolute
+    difference of the users mean wait time and the first position (in finish
+    order) where the outputs differ (None when they are identical)
+    """
+    output_a = read_output(file_a)
+    output_b = read_output(file_b)
+    common = output_a.index.intersection(output_b.index)
+    missing = len(output_a.index.union(output_b.index)) - len(common)
+
+    start_a = output_a.loc[common, 'start_time']
+    start_b = output_b.loc[common, 'start_time']
+    start_difference = np.abs(start_a.values - start_b.values)
+
+    rows_a = output_a.reset_index()[tasks_file_header].values
+    rows_b = output_b.reset_index()[tasks_file_header].values
+    num_rows = min(len(rows_a), len(rows_b))
+    different_rows = np.flatnonzero(
+        np.any(rows_a[:num_rows] != rows_b[:num_rows], axis=1))
+    if len(different_rows) > 0:
+        first_difference = int(different_rows[0])
+    elif len(rows_a) != len(rows_b):
+        first_difference = num_rows
+    else:
+        first_difference = None
+
+    different_start = int(np.count_nonzero(start_difference))
+    wait_difference = np.abs(users_wait_time_difference(output_a,
+                                                        output_b).values)
+    return {
+        'tasks': len(output_a),
+        'missing_tasks': missing,
+        'different_start': different_start,
+        'different_start_fraction': float(different_start) / len(common)
+                                    if len(common) > 0 else 0.0,
+        'max_start_difference': float(np.max(start_difference))
+                                if len(common) > 0 else 0.0,
+        'max_user_wait_difference': float(np.max(wait_difference))
+                                    if len(common) > 0 else 0.0,
+        'mean_user_wait_difference': float(np.mean(wait_difference))
+                                     if len(common) > 0 else 0.0,
+        'first_difference': first_difference
+    }
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Validation harness for the double build of the native library.
+
+Runs the same simulations with the long double and the double builds and
+reports any difference in the outputs. Both builds must be compiled first::
+
+    cd sdrf/helpers/c_live_tree
+    bash compile.sh && bash compile.sh double
+
+Usage (any simulate_task_allocation option is accepted)::
+
+    python -m sdrf.tasks.compare_precision TASKS_FILE -r0.9 -d0.9999
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from os import path
+
+from sdrf.tasks.compare_outputs import compare_outputs
+
+precisions = ['long_double', 'double']
+
+
+def run_simulations(tasks_file, options, saving_dir):
+    repo_dir = path.dirname(path.dirname(path.dirname(path.abspath(
+        __file__))))
+    for precision in precisions:
+        precision_dir = path.join(saving_dir, precision)
+        os.mkdir(precision_dir)
+        env = dict(os.environ, SDRF_PRECISION=precision, PYTHONPATH=repo_dir)
+        command = [sys.executable, '-m', 'sdrf', 'simulate_task_allocation'] \
+            + options + [path.abspath(tasks_file), precision_dir]
+        with open(path.join(precision_dir, 'log.txt'), 'w') as log:
+            subprocess.check_call(command, env=env, cwd=precision_dir,
+                                  stdout=log, stderr=subprocess.STDOUT)
+
+
+def compare_precisions(tasks_file, options):
+    saving_dir = tempfile.mkdtemp()
+    try:
+        run_simulations(tasks_file, options, saving_dir)
+        reference_dir = path.join(saving_dir, precisions[0])
+        reports = {}
+        for f in sorted(os.listdir(reference_dir)):
+            if not f.startswith('task_sim'):
+                continue
+            reports[f] = compare_outputs(
+                path.join(reference_dir, f),
+                path.join(saving_dir, precisions[1], f))
+        return reports
+    finally:
+        shutil.rmtree(saving_dir)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+    reports = compare_precisions(sys.argv[1], sys.argv[2:])
+    identical = True
+    for output_file, report in sorted(reports.iteritems()):
+        print output_file, json.dumps(report, sort_keys=True)
+        if report['missing_tasks'] or report['first_difference'] is not None:
+            identical = False
+    if identical:
+        print 'Outputs are identical'
+    else:
+        print 'Outputs differ'
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
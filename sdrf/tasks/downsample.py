@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import json
+from os.path import splitext
+
+import numpy as np
+import pandas as pd
+
+from sdrf.tasks import is_binary, tasks_chunks
+from sdrf.tasks.system_utilization import SystemUtilization
+
+# Jobs (not tasks) are sampled, so that the tasks of a job are always kept or
+# dropped together. Jobs are identified by the task id prefix (before the
+# first '-', see filter_tasks) and the user. The jobs of each user are sorted
+# by size (cpu * duration of all their tasks) and sampled systematically, one
+# every 1 / fraction jobs starting at a random offset. This stratifies the
+# sample by user and by size: every user keeps a fraction of their jobs (up to
+# rounding) spread over all sizes, so that users mean usage is estimated with
+# far less variance than with a simple random sample of jobs.
+#
+# System resources and users resources are calculated from the utilization of
+# the tasks file (see SystemUtilization), so simulating the sampled file
+# scales them to match the sampled load.
+chunk_size = 1000000
+
+
+def report_file(saving_file):
+    return splitext(saving_file)[0] + '.report.json'
+
+
+def _job_ids(task_ids):
+    return task_ids.astype(str).str.split('-', n=1).str[0]
+
+
+def jobs_sizes(tasks_file):
+    """
+    :return: Series with the size (sum of cpu * duration of its tasks) of each
+    job, indexed by (user_id, job_id)
+    """
+    sizes = []
+    for df, _ in tasks_chunks(tasks_file, chunk_size):
+        df = pd.DataFrame({
+            'user_id': df['user_id'].astype(str),
+            'job_id': _job_ids(df['task_id']),
+            'size': df['cpu'] * (df['finish_time'] - df['start_time'])})
+        sizes.append(df.groupby(['user_id', 'job_id'])['size'].sum())
+        if len(sizes) > 1:
+            sizes = [pd.concat(sizes).groupby(level=[0, 1]).sum()]
+    if not sizes:
+        return pd.Series([], index=pd.MultiIndex.from_arrays(
+            [[], []], names=['user_id', 'job_id']), name='size')
+    return sizes[0]
+
+
+def sample_jobs(sizes, fraction, seed=None):
+    """
+    :param sizes: jobs sizes, see jobs_sizes
+    :return: index (user_id, job_id) of the sampled jobs
+    """
+    random_state = np.random.RandomState(seed)
+    df = sizes.reset_index().sort_values(['user_id', 'size', 'job_id'])
+    users = df['user_id'].values
+    first = np.append(True, users[1:] != users[:-1])
+    user_code = np.cumsum(first) - 1
+    rank = np.arange(len(df)) - np.flatnonzero(first)[user_code]
+    offset = random_state.random_sample(np.count_nonzero(first))[user_code]
+    # the job of rank k is sampled when a multiple of 1 / fraction (shifted by
+    # the user's offset) falls within [k, k + 1)
+    sampled = (np.floor((rank + 1) * fraction + offset) >
+               np.floor(rank * fraction + offset))
+    return pd.MultiIndex.from_arrays([df['user_id'].values[sampled],
+                                      df['job_id'].values[sampled]],
+                                     names=['user_id', 'job_id'])
+
+
+def _write_sampled(tasks_file, saving_file, sampled):
+    """
+    Writes the tasks of the sampled jobs, csv lines are written exactly as
+    they are in tasks_file
+    :return: number of tasks written
+    """
+    if is_binary(tasks_file):
+        tasks = np.load(tasks_file, mmap_mode='r')
+        keys = pd.MultiIndex.from_arrays([
+            pd.Series(tasks['user_id']).astype(str),
+            _job_ids(pd.Series(tasks['task_id']))])
+        keep = keys.isin(sampled)
+        np.save(saving_file, np.array(tasks[keep]))
+        return int(np.count_nonzero(keep))
+
+    sampled = set(sampled)
+    num_tasks = 0
+    with open(tasks_file, 'rb') as f, open(saving_file, 'wb') as out:
+        for line in f:
+            fields = line.split(',', 5)
+            if len(fields) < 6:  # blank line
+                continue
+            if (fields[3], fields[4].split('-', 1)[0]) in sampled:
+                out.write(line)
+                num_tasks += 1
+    return num_tasks
+
+
+def _relative_error(value, expected):
+    return float(value / expected - 1) if expected else 0.0
+
+
+def compare_utilization(original, sampled, fraction):
+    """
+    Compares the utilization of a sampled tasks file with the one expected
+    from the original (the original one times fraction)
+    :param original: SystemUtilization of the original tasks file
+    :param sampled: SystemUtilization of the sampled tasks file
+    :return: dict with the relative error of the means and peaks, the mean and
+    largest absolute error of the users cpu shares (users_cpu_mean /
+    cpu_mean, used to give resources to the users), the mean relative error
+    of the users cpu peaks (of the users that were sampled) and the mean
+    absolute error of the cpu utilization curve, relative to the mean
+    """
+    report = {}
+    for stat in ['cpu_mean', 'memory_mean', 'cpu_peak', 'memory_peak']:
+        report[stat] = getattr(original, stat)
+        report['sampled_' + stat] = getattr(sampled, stat)
+        report[stat + '_error'] = _relative_error(
+            getattr(sampled, stat), getattr(original, stat) * fraction)
+
+    users = sorted(original.users_cpu_mean)
+    sampled_users_cpu_mean = {str(u): v for u, v in
+                              sampled.users_cpu_mean.iteritems()}
+    sampled_users_cpu_peak = {str(u): v for u, v in
+                              sampled.users_cpu_peak.iteritems()}
+    share_error = np.array([
+        sampled_users_cpu_mean.get(str(user), 0.0) / sampled.cpu_mean -
+        original.users_cpu_mean[user] / original.cpu_mean
+        for user in users])
+    peak_error = [
+        _relative_error(sampled_users_cpu_peak[str(user)],
+                        original.users_cpu_peak[user] * fraction)
+        for user in users if str(user) in sampled_users_cpu_peak]
+    report['users'] = len(users)
+    report['sampled_users'] = len(sampled_users_cpu_mean)
+    report['users_cpu_share_max_error'] = float(np.max(np.abs(share_error)))
+    report['users_cpu_share_mean_error'] = float(np.mean(np.abs(share_error)))
+    report['users_cpu_peak_mean_error'] = (float(np.mean(peak_error))
+                                           if peak_error else 0.0)
+
+    times, _, mean, _ = original.utilization()
+    sampled_times, _, sampled_mean, _ = sampled.utilization()
+    sampled_curve = np.interp(times, sampled_times, sampled_mean[:, 0],
+                              left=0.0, right=0.0)
+    report['utilization_curve_error'] = float(
+        np.mean(np.abs(sampled_curve - mean[:, 0] * fraction)) /
+        (original.cpu_mean * fraction))
+    return report
+
+
+def downsample(tasks_file, saving_file, fraction, seed=None,
+               memory_budget=None):
+    """
+    Saves the tasks of a stratified sample of the jobs in tasks_file and a
+    report comparing its utilization with the original one (see report_file)
+    :param fraction: fraction of the jobs of each user that is sampled
+    :param seed: (optional) random seed, the same seed gives the same sample
+    :param memory_budget: (optional) used to calculate the utilization of
+    large files, see SystemUtilization
+    :return: report dict, see compare_utilization, also with the number of
+    jobs and tasks in both files
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError('fraction must be in (0, 1]')
+    if is_binary(tasks_file) != is_binary(saving_file):
+        raise ValueError('tasks_file and saving_file must have the same '
+                         'format (csv or binary)')
+    sizes = jobs_sizes(tasks_file)
+    sampled = sample_jobs(sizes, fraction, seed)
+    if len(sampled) == 0:
+        raise ValueError('no jobs sampled, fraction is too small')
+    num_tasks = _write_sampled(tasks_file, saving_file, sampled)
+
+    original = SystemUtilization(tasks_file, memory_budget=memory_budget)
+    report = compare_utilization(
+        original, SystemUtilization(saving_file, memory_budget=memory_budget),
+        fraction)
+    report.update({'fraction': fraction, 'jobs': len(sizes),
+                   'sampled_jobs': len(sampled),
+                   'tasks': original.num_tasks, 'sampled_tasks': num_tasks})
+    with open(report_file(saving_file), 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return report
@@ -1,61 +1,105 @@
-import threading
-from collections import deque, defaultdict
+import multiprocessing
 
-import sys
+import numpy as np
+import pandas as pd
+from pandas.io.common import EmptyDataError
 
-from sdrf.tasks import tasks_generator, jobs_file_header, save_from_deque
+from sdrf.helpers.range_reader import RangeReader, file_ranges, split_range
+from sdrf.tasks import is_binary, tasks_file_header, jobs_file_header
 
+# Jobs are summarized with a group by (job_id, user_id) for every chunk of the
+# tasks file. The partial summaries are merged every merge_every chunks, so
+# memory only depends on the number of jobs and the chunk size. When using
+# multiple processes, each one summarizes a byte range of the file (a range of
+# rows of a binary tasks file) and the results are merged at the end.
+chunk_size = 1000000
+merge_every = 8
 
-class RunningJob(object):
-    def __init__(self):
-        self.num_tasks = 0
-        self.submit_time = sys.maxint
-        self.start_time = sys.maxint
-        self.finish_time = 0
-        self.cpu_sum = 0.0
-        self.memory_sum = 0.0
+_partial_aggregations = {'submit_time': 'min', 'start_time': 'min',
+                         'finish_time': 'max', 'num_tasks': 'sum',
+                         'cpu_sum': 'sum', 'memory_sum': 'sum'}
 
-    def __getitem__(self, key):
-        return getattr(self, key)
 
-    @property
-    def duration(self):
-        return self.finish_time - self.start_time
+def _chunk_summary(df):
+    df['job_id'] = df['task_id'].str.split('-', n=1).str[0]
+    df['num_tasks'] = 1
+    df.rename(columns={'cpu': 'cpu_sum', 'memory': 'memory_sum'},
+              inplace=True)
+    return df.groupby(['job_id', 'user_id']).agg(_partial_aggregations)
 
-    @property
-    def cpu_mean(self):
-        return self.cpu_sum / self.num_tasks
 
-    @property
-    def memory_mean(self):
-        return self.memory_sum / self.num_tasks
+def _merge_summaries(summaries):
+    if len(summaries) == 1:
+        return summaries[0]
+    return pd.concat(summaries).groupby(level=['job_id', 'user_id']).agg(
+        _partial_aggregations)
 
-    def add_task(self, task):
-        self.num_tasks += 1
-        self.cpu_sum += task.cpu
-        self.memory_sum += task.memory
-        self.submit_time = min(self.submit_time, task.submit_time)
-        self.start_time = min(self.start_time, task.start_time)
-        self.finish_time = max(self.finish_time, task.finish_time)
 
+def _csv_chunks(tasks_file, start, end):
+    with RangeReader(tasks_file, start, end) as f:
+        try:
+            csv_reader = pd.read_csv(f, header=None, index_col=False,
+                                     names=tasks_file_header,
+                                     dtype={'user_id': str, 'task_id': str},
+                                     chunksize=chunk_size)
+            for df in csv_reader:
+                yield df
+        except EmptyDataError:  # no line starts in this range
+            pass
 
-def jobs_summary(tasks_file, saving_file):
-    jobs = deque()
-    running_jobs = defaultdict(RunningJob)
 
-    for task in tasks_generator(tasks_file):
-        job_id = task.task_id.split('-')[0]
-        running_jobs[(job_id, task.user_id)].add_task(task)
+def _binary_chunks(tasks_file, start, end):
+    tasks = np.load(tasks_file, mmap_mode='r')
+    for chunk_start in xrange(start, end, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, end)
+        yield pd.DataFrame(np.array(tasks[chunk_start:chunk_end]))
 
-    done = threading.Event()
-    saving_thread = threading.Thread(target=save_from_deque, args=(
-        jobs, saving_file, jobs_file_header, done))
-    saving_thread.start()
 
-    for (job_id, user_id), job in running_jobs.iteritems():
-        job.job_id = job_id
-        job.user_id = user_id
-        jobs.append(job)
+def _range_summary(args):
+    tasks_file, start, end = args
+    if is_binary(tasks_file):
+        chunks = _binary_chunks(tasks_file, start, end)
+    else:
+        chunks = _csv_chunks(tasks_file, start, end)
+    summaries = []
+    for df in chunks:
+        summaries.append(_chunk_summary(df))
+        if len(summaries) == merge_every:
+            summaries = [_merge_summaries(summaries)]
+    if not summaries:
+        return None
+    return _merge_summaries(summaries)
 
-    done.set()
-    saving_thread.join()
+
+def jobs_summary(tasks_file, saving_file, processes=1):
+    """
+    :param tasks_file: tasks file, csv or binary
+    :param processes: number of ranges of the file summarized in parallel
+    """
+    if is_binary(tasks_file):
+        num_tasks = len(np.load(tasks_file, mmap_mode='r'))
+        ranges = split_range(num_tasks, processes)
+    else:
+        ranges = file_ranges(tasks_file, processes)
+    ranges = [(tasks_file, start, end) for start, end in ranges]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        summaries = pool.map(_range_summary, ranges)
+        pool.close()
+        pool.join()
+    else:
+        summaries = map(_range_summary, ranges)
+
+    summaries = [s for s in summaries if s is not None]
+    if summaries:
+        jobs = _merge_summaries(summaries).reset_index()
+    else:
+        jobs = pd.DataFrame(columns=['job_id', 'user_id'] +
+                            sorted(_partial_aggregations))
+
+    jobs['duration'] = jobs['finish_time'] - jobs['start_time']
+    jobs['cpu_mean'] = jobs['cpu_sum'] / jobs['num_tasks']
+    jobs['memory_mean'] = jobs['memory_sum'] / jobs['num_tasks']
+    # same line terminator used by the csv module
+    jobs.to_csv(saving_file, header=False, index=False,
+                columns=jobs_file_header, line_terminator='\r\n')
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+from itertools import islice
+from StringIO import StringIO
+
+import numpy as np
+import pandas as pd
+
+from sdrf.helpers.range_reader import RangeReader, file_ranges
+from sdrf.tasks import binary_extension, is_binary, task_id_size, \
+    tasks_dtype, tasks_file_header
+
+# External merge sort of tasks files by submit time. The file is split in byte
+# ranges small enough to be sorted in memory (possibly by multiple processes),
+# each one is saved to a temporary run file and the runs are merged at the
+# end, merge_fan_in runs at a time. Only the submit time is parsed, lines are
+# written exactly as they are in the original file. Both steps are stable, so
+# tasks submitted at the same time keep their original order.
+#
+# A range uses about memory_factor times its size once loaded as a list of
+# lines, which is used to split the memory budget.
+memory_factor = 3
+merge_fan_in = 64
+binary_chunk_size = 100000
+
+
+def _submit_time(line):
+    return int(line[:line.index(',')])
+
+
+def _sort_range(args):
+    tasks_file, start, end, run_file = args
+    with RangeReader(tasks_file, start, end) as f:
+        lines = [line for line in f if line.strip()]
+    if lines and not lines[-1].endswith('\n'):  # last line of the file
+        lines[-1] += '\r\n' if lines[0].endswith('\r\n') else '\n'
+
+    submit_times = np.fromiter((_submit_time(line) for line in lines),
+                               np.int64, len(lines))
+    order = np.argsort(submit_times, kind='mergesort')
+    with open(run_file, 'wb') as f:
+        f.writelines(lines[i] for i in order)
+    user_id_size = max([len(line.split(',', 4)[3]) for line in lines] or [0])
+    return run_file, len(lines), user_id_size
+
+
+def _merged_lines(run_files):
+    # heapq.merge has no key in python 2, so lines are decorated with the
+    # submit time and the run they come from
+    def decorated_lines(run_index, run_file):
+        with open(run_file, 'rb') as f:
+            for line in f:
+                yield _submit_time(line), run_index, line
+
+    merged = heapq.merge(*[decorated_lines(i, f)
+                           for i, f in enumerate(run_files)])
+    for _, _, line in merged:
+        yield line
+
+
+def _merge_runs(run_files, temp_dir):
+    """
+    Merges groups of contiguous runs until there are at most merge_fan_in
+    :return: list of remaining run files
+    """
+    while len(run_files) > merge_fan_in:
+        merged_files = []
+        for i in xrange(0, len(run_files), merge_fan_in):
+            group = run_files[i:i + merge_fan_in]
+            merged_file = os.path.join(temp_dir, 'merged%d-%d' % (
+                len(run_files), i))
+            with open(merged_file, 'wb') as f:
+                f.writelines(_merged_lines(group))
+            for run_file in group:
+                os.remove(run_file)
+            merged_files.append(merged_file)
+        run_files = merged_files
+    return run_files
+
+
+def _save_binary(lines, saving_file, num_tasks, user_id_size):
+    dtype = tasks_dtype(user_id_size)
+    if num_tasks == 0:
+        np.save(saving_file, np.empty(0, dtype))
+        return
+
+    tasks = np.lib.format.open_memmap(saving_file, mode='w+', dtype=dtype,
+                                      shape=(num_tasks,))
+    position = 0
+    while True:
+        chunk = list(islice(lines, binary_chunk_size))
+        if not chunk:
+            break
+        df = pd.read_csv(StringIO(''.join(chunk)), header=None,
+                         index_col=False, names=tasks_file_header,
+                         dtype={'user_id': str, 'task_id': str})
+        if df['task_id'].str.len().max() > task_id_size:
+            raise ValueError('task_id longer than %d characters' %
+                             task_id_size)
+        for name in tasks_file_header:
+            tasks[name][position:position + len(df)] = df[name].values
+        position += len(df)
+    tasks.flush()
+    del tasks
+
+
+def sort_tasks(tasks_file, saving_file, memory_budget=2**30, processes=1):
+    """
+    Sorts a csv tasks file by submit time
+    :param tasks_file: csv tasks file
+    :param saving_file: sorted tasks file, may be the same as tasks_file. When
+    it ends with .npy tasks are saved in binary format instead of csv
+    :param memory_budget: (optional) approximate memory used to sort, in bytes,
+    shared by all processes
+    :param processes: (optional) number of processes sorting the runs
+    """
+    file_size = os.path.getsize(tasks_file)
+    range_size = max(memory_budget // (memory_factor * processes), 1)
+    num_ranges = max(-(-file_size // range_size), processes)
+
+    # temporary files are kept in the same file system as the result
+    temp_dir = tempfile.mkdtemp(
+        dir=os.path.dirname(os.path.abspath(saving_file)))
+    try:
+        ranges = file_ranges(tasks_file, num_ranges)
+        ranges = [(tasks_file, start, end, os.path.join(temp_dir, 'run%d' % i))
+                  for i, (start, end) in enumerate(ranges)]
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            runs = pool.map(_sort_range, ranges, chunksize=1)
+            pool.close()
+            pool.join()
+        else:
+            runs = map(_sort_range, ranges)
+
+        run_files = _merge_runs([run_file for run_file, _, _ in runs],
+                                temp_dir)
+        num_tasks = sum(num_lines for _, num_lines, _ in runs)
+        user_id_size = max([size for _, _, size in runs] or [0])
+
+        lines = _merged_lines(run_files)
+        if is_binary(saving_file):
+            sorted_file = os.path.join(temp_dir, 'sorted' + binary_extension)
+            _save_binary(lines, sorted_file, num_tasks, user_id_size)
+        else:
+            sorted_file = os.path.join(temp_dir, 'sorted')
+            with open(sorted_file, 'wb') as f:
+                f.writelines(lines)
+        os.rename(sorted_file, saving_file)
+    finally:
+        shutil.rmtree(temp_dir)
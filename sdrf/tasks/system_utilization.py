@@ -3,12 +3,47 @@ from collections import deque, defaultdict
 from hashlib import sha256
 import pandas as pd
 import numpy as np
-import json
-from os.path import join, dirname, abspath, exists
+import os
+import shutil
+import tempfile
+import uuid
+from os.path import join, dirname, abspath, exists, splitext
 from tqdm import tqdm
 
 from sdrf.helpers.schema import SchemaIndex
-from sdrf.tasks import tasks_file_header
+from sdrf.helpers.shared_json import read_json, updating_json
+from sdrf.helpers.utilization_pyramid import UtilizationPyramid
+from sdrf.tasks import read_tasks, tasks_chunks, tasks_file_header
+
+# Streaming calculation (used when a memory budget is given). Means only
+# depend on the integral of each task usage (resources * duration), which is
+# accumulated while reading the tasks in chunks. Peaks need the events sorted
+# by time: the start and finish events of each chunk are sorted and saved to a
+# temporary run file, then the runs are merged in blocks while keeping the
+# usage of the system and of each user (sweep line).
+#
+# A chunk of tasks uses about bytes_per_task bytes per task, including its
+# events. Merging uses about bytes_per_event for each event in the blocks.
+bytes_per_task = 500
+bytes_per_event = 200
+event_dtype = np.dtype([('time', np.int64), ('user', np.int32),
+                        ('cpu', np.float64), ('memory', np.float64),
+                        ('tasks', np.int8)])
+
+# Utilization over time is kept as pyramids (see UtilizationPyramid) with the
+# following bucket sizes, in seconds. Users have coarser buckets, as their
+# pyramid takes memory proportional to the number of users times the trace
+# duration. Plots use the finest level with at most plot_max_buckets buckets.
+system_bucket_sizes = [60, 600, 3600, 21600, 86400]
+users_bucket_sizes = [3600, 21600, 86400]
+plot_max_buckets = 2000
+
+
+def _pyramid(first_time, last_time, bucket_sizes, num_series=1):
+    # times are in microseconds
+    return UtilizationPyramid(first_time, last_time,
+                              [size * 10**6 for size in bucket_sizes],
+                              num_series)
 
 
 def df_mean(df, column, period=None):
@@ -40,25 +75,112 @@ def events_to_usage(events):
     return aggregated_time, cum_cpu, cum_memory
 
 
+def peak_running_tasks(start_time, finish_time):
+    times, time_index = np.unique(np.concatenate([start_time, finish_time]),
+                                  return_inverse=True)
+    changes = np.repeat([1, -1], [len(start_time), len(finish_time)])
+    running = np.cumsum(np.bincount(time_index, changes, len(times)))
+    return int(running.max()) if len(running) else 0
+
+
+def files_sha(files, block_size=2**20):
+    """
+    sha256 of the files contents, read in blocks. For a single file it's the
+    same as the sha of the whole file
+    """
+    sha = sha256()
+    for file_name in files:
+        with open(file_name, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), ''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def _grow(array, size):
+    if len(array) >= size:
+        return array
+    return np.concatenate([array, np.zeros(size - len(array), array.dtype)])
+
+
+def _merged_events(run_files, block_size):
+    """
+    Merges runs of events sorted by time
+    :return: iterator of blocks of events sorted by time, all events with the
+    same time are in the same block
+    """
+    runs = [np.load(f, mmap_mode='r') for f in run_files]
+    positions = [0] * len(runs)
+    while True:
+        active = [i for i in xrange(len(runs)) if positions[i] < len(runs[i])]
+        if not active:
+            return
+
+        # all events before the end of the smallest block are taken
+        block_ends = [runs[i]['time'][positions[i] + block_size - 1]
+                      for i in active if positions[i] + block_size <
+                      len(runs[i])]
+        if block_ends:
+            threshold = min(block_ends)
+            ends = [(i, positions[i] + np.searchsorted(
+                runs[i]['time'][positions[i]:], threshold, 'left'))
+                    for i in active]
+            if all(end == positions[i] for i, end in ends):
+                # the smallest block only has events at the threshold time
+                ends = [(i, positions[i] + np.searchsorted(
+                    runs[i]['time'][positions[i]:], threshold, 'right'))
+                        for i in active]
+        else:
+            ends = [(i, len(runs[i])) for i in active]
+
+        block = np.concatenate([runs[i][positions[i]:end] for i, end in ends])
+        for i, end in ends:
+            positions[i] = end
+        yield block[np.argsort(block['time'], kind='mergesort')]
+
+
 class SystemUtilization(object):
-    def __init__(self, tasks_file, cache_file=None):
-        self.tasks_file = tasks_file
-        self.tasks_file_sha = sha256(open(tasks_file, 'rb').read()).hexdigest()
+    def __init__(self, tasks_file, cache_file=None, memory_budget=None):
+        """
+        :param tasks_file: tasks file name or list of file names, in which case
+        the utilization is for the tasks of all the files together
+        :param memory_budget: (optional) when provided, the utilization is
+        calculated reading the tasks in chunks using about memory_budget bytes
+        """
+        if isinstance(tasks_file, basestring):
+            tasks_file = [tasks_file]
+        self.tasks_files = list(tasks_file)
+        self.tasks_file = self.tasks_files[0]
+        self.tasks_file_sha = files_sha(self.tasks_files)
+        # the streaming calculation adds the usage in another order, so its
+        # results differ in the last digits and are cached separately
+        if memory_budget is None:
+            self.cache_key = self.tasks_file_sha
+        else:
+            self.cache_key = self.tasks_file_sha + '-streaming'
 
         if cache_file is None:
-            cache_file = join(dirname(abspath(tasks_file)), 'cred_cache.json')
+            cache_file = join(dirname(abspath(self.tasks_file)),
+                              'cred_cache.json')
 
         self.cache_file = cache_file
+        self.pyramid_file = '%s_%s.npz' % (splitext(cache_file)[0],
+                                           self.cache_key)
+        self.memory_budget = memory_budget
 
         self._save_properties = ['cpu_mean', 'memory_mean', 'cpu_peak',
                                  'memory_peak', 'users_cpu_mean',
                                  'users_memory_mean', 'users_cpu_peak',
-                                 'users_memory_peak', 'number_of_users']
+                                 'users_memory_peak', 'number_of_users',
+                                 'num_tasks', 'peak_running_tasks',
+                                 'duration']
 
         for att in self._save_properties:
             setattr(self, '_' + att, None)
 
         self._data_df = None
+        self._system_pyramid = None
+        self._users_pyramid = None
+        self._pyramid_users = None
         self.load_from_cache()
 
     @property
@@ -72,20 +194,56 @@ class SystemUtilization(object):
             return getattr(self, '_' + name)
         raise AttributeError(name)
 
-    def plot(self, saving_file):
+    def plot(self, saving_file, user=None):
+        """
+        Plots the mean utilization in each bucket, with the range from the
+        minimum to the maximum shaded
+        :param user: (optional) plot the utilization of this user instead of
+        the whole system
+        """
         import matplotlib; matplotlib.use('PDF')
         import matplotlib.pyplot as plt
-        if self._data_df is None:
-            self.calculate()
-        df = self._data_df.resample('1T').mean()
-        df.fillna(method='pad', inplace=True)
+        times, minimum, mean, maximum = self.utilization(user)
+        times = pd.to_datetime(times, unit='us').to_pydatetime()
         plt.figure(figsize=(8, 4))
-        df.plot()
+        for i, resource in enumerate(['cpu', 'memory']):
+            line, = plt.plot(times, mean[:, i], label=resource)
+            plt.fill_between(times, minimum[:, i], maximum[:, i],
+                             color=line.get_color(), alpha=0.3, linewidth=0)
+        plt.legend()
         plt.savefig(saving_file)
+        plt.close()
+
+    def utilization(self, user=None, max_buckets=plot_max_buckets):
+        """
+        Utilization over time, in the finest level of the pyramid with at most
+        max_buckets buckets
+        :param user: (optional) utilization of this user instead of the whole
+        system
+        :return: (bucket start times, minimum, mean, maximum), with one column
+        per resource (cpu and memory)
+        """
+        if self._system_pyramid is None:
+            self._load_pyramids()
+        if user is None:
+            pyramid, index = self._system_pyramid, 0
+        elif str(user) in self._pyramid_users:
+            pyramid = self._users_pyramid
+            index = self._pyramid_users.index(str(user))
+        else:
+            raise ValueError('User %s not found' % user)
+        return pyramid.series(pyramid.level_for(max_buckets), index)
 
     def calculate(self):
-        tasks_df = pd.read_csv(self.tasks_file, header=None, index_col=False,
-                               names=tasks_file_header)
+        if self.memory_budget is None:
+            self._calculate_in_memory()
+        else:
+            self._calculate_streaming()
+        self.save_to_cache()
+
+    def _calculate_in_memory(self):
+        tasks_df = pd.concat([read_tasks(f) for f in self.tasks_files],
+                             ignore_index=True)
         task_index = SchemaIndex(tasks_file_header)
         events = deque()
         events_by_user = defaultdict(deque)
@@ -101,6 +259,9 @@ class SystemUtilization(object):
             events_by_user[user].append((finish_time, -cpu, -memory))
 
         self._number_of_users = len(events_by_user)
+        self._num_tasks = len(tasks_df)
+        self._peak_running_tasks = peak_running_tasks(
+            tasks_df['start_time'].values, tasks_df['finish_time'].values)
         del tasks_df
 
         aggregated_time, cum_cpu, cum_memory = events_to_usage(events)
@@ -108,6 +269,19 @@ class SystemUtilization(object):
         self._cpu_peak = np.max(cum_cpu)
         self._memory_peak = np.max(cum_memory)
 
+        first_time, last_time = aggregated_time[0], aggregated_time[-1]
+        self._duration = last_time - first_time
+        self._system_pyramid = _pyramid(first_time, last_time,
+                                        system_bucket_sizes)
+        self._system_pyramid.add(np.zeros(len(cum_cpu), int),
+                                 list(aggregated_time),
+                                 np.column_stack([cum_cpu, cum_memory]))
+        self._system_pyramid.finish()
+        self._users_pyramid = _pyramid(first_time, last_time,
+                                       users_bucket_sizes,
+                                       len(events_by_user))
+        self._pyramid_users = []
+
         dt_time = pd.to_datetime(list(aggregated_time), unit='us')
         self._data_df = pd.DataFrame({'cpu': cum_cpu, 'memory': cum_memory},
                                      index=dt_time)
@@ -124,6 +298,10 @@ class SystemUtilization(object):
         for user, events in tqdm(events_by_user.iteritems(),
                                  total=len(events_by_user)):
             aggregated_time, cum_cpu, cum_memory = events_to_usage(events)
+            self._users_pyramid.add(
+                np.full(len(cum_cpu), len(self._pyramid_users), int),
+                list(aggregated_time), np.column_stack([cum_cpu, cum_memory]))
+            self._pyramid_users.append(str(user))
             self._users_cpu_peak[user] = np.max(cum_cpu)
             self._users_memory_peak[user] = np.max(cum_memory)
 
@@ -134,25 +312,169 @@ class SystemUtilization(object):
             self._users_cpu_mean[user] = df_mean(user_data_df, 'cpu', period)
             self._users_memory_mean[user] = df_mean(user_data_df, 'memory',
                                                     period)
+        self._users_pyramid.finish()
 
-        self.save_to_cache()
+    def _calculate_streaming(self):
+        chunk_size = max(self.memory_budget // bytes_per_task, 1000)
+        users = {}
+        cpu_integral = np.zeros(0)
+        memory_integral = np.zeros(0)
+        first_time = None
+        last_time = None
+
+        temp_dir = tempfile.mkdtemp(dir=dirname(abspath(self.cache_file)))
+        try:
+            run_files = []
+            num_tasks = 0
+            for tasks_file in self.tasks_files:
+                for df, _ in tqdm(tasks_chunks(tasks_file, chunk_size)):
+                    for user in df['user_id'].unique():
+                        users.setdefault(user, len(users))
+                    codes = df['user_id'].map(users).values.astype(np.int32)
+                    start_time = df['start_time'].values
+                    finish_time = df['finish_time'].values
+                    cpu = df['cpu'].values
+                    memory = df['memory'].values
+
+                    num_tasks += len(df)
+                    duration = finish_time - start_time
+                    cpu_integral = _grow(cpu_integral, len(users))
+                    memory_integral = _grow(memory_integral, len(users))
+                    cpu_integral += np.bincount(codes, cpu * duration,
+                                                len(users))
+                    memory_integral += np.bincount(codes, memory * duration,
+                                                   len(users))
+
+                    times = np.concatenate([start_time, finish_time])
+                    if first_time is None:
+                        first_time, last_time = times.min(), times.max()
+                    else:
+                        first_time = min(first_time, times.min())
+                        last_time = max(last_time, times.max())
+
+                    events = np.empty(len(times), event_dtype)
+                    events['time'] = times
+                    events['user'] = np.concatenate([codes, codes])
+                    events['cpu'] = np.concatenate([cpu, -cpu])
+                    events['memory'] = np.concatenate([memory, -memory])
+                    events['tasks'] = np.repeat([1, -1], len(df))
+                    events = events[np.argsort(times, kind='mergesort')]
+                    run_files.append(join(temp_dir, 'run%d.npy' %
+                                          len(run_files)))
+                    np.save(run_files[-1], events)
+
+            block_size = max(self.memory_budget //
+                             (bytes_per_event * max(len(run_files), 1)), 1000)
+            self._system_pyramid = _pyramid(first_time, last_time,
+                                            system_bucket_sizes)
+            self._users_pyramid = _pyramid(first_time, last_time,
+                                           users_bucket_sizes, len(users))
+            self._pyramid_users = [str(user) for user in
+                                   sorted(users, key=users.get)]
+            peaks = self._sweep(_merged_events(run_files, block_size),
+                                len(users))
+        finally:
+            shutil.rmtree(temp_dir)
+
+        cpu_peak, memory_peak, users_cpu_peak, users_memory_peak, \
+            running_peak = peaks
+        period = float(last_time - first_time)
+        self._number_of_users = len(users)
+        self._num_tasks = num_tasks
+        self._peak_running_tasks = running_peak
+        self._duration = last_time - first_time
+        self._cpu_peak = cpu_peak
+        self._memory_peak = memory_peak
+        self._cpu_mean = cpu_integral.sum() / period
+        self._memory_mean = memory_integral.sum() / period
+        self._users_cpu_mean = {}
+        self._users_memory_mean = {}
+        self._users_cpu_peak = {}
+        self._users_memory_peak = {}
+        for user, code in users.iteritems():
+            self._users_cpu_mean[user] = cpu_integral[code] / period
+            self._users_memory_mean[user] = memory_integral[code] / period
+            self._users_cpu_peak[user] = users_cpu_peak[code]
+            self._users_memory_peak[user] = users_memory_peak[code]
+
+    def _sweep(self, blocks, num_users):
+        """
+        Calculates the peaks and fills the utilization pyramids
+        :param blocks: blocks of events sorted by time, see _merged_events
+        :return: (cpu peak, memory peak, users cpu peak, users memory peak,
+        running tasks peak)
+        """
+        usage = np.zeros(2)
+        peak = np.full(2, -np.inf)
+        running = 0
+        running_peak = 0
+        users_usage = np.zeros((num_users, 2))
+        users_peak = np.full((num_users, 2), -np.inf)
+        for block in blocks:
+            df = pd.DataFrame({'time': block['time'], 'user': block['user'],
+                               'cpu': block['cpu'],
+                               'memory': block['memory'],
+                               'tasks': block['tasks'].astype(np.int64)})
+
+            # usage after all the events at the same time
+            per_time = df.groupby('time')[['cpu', 'memory']].sum()
+            cum_usage = usage + per_time.values.cumsum(axis=0)
+            peak = np.maximum(peak, cum_usage.max(axis=0))
+            usage = cum_usage[-1]
+            self._system_pyramid.add(np.zeros(len(cum_usage), int),
+                                     per_time.index.values, cum_usage)
+            cum_running = running + df.groupby('time')['tasks'].sum().cumsum()
+            running_peak = max(running_peak, int(cum_running.max()))
+            running = int(cum_running.values[-1])
+
+            per_user_time = df.groupby(['user', 'time'])[['cpu',
+                                                          'memory']].sum()
+            users = per_user_time.index.get_level_values('user').values
+            cum_usage = (users_usage[users] + per_user_time.groupby(
+                level='user').cumsum().values)
+            np.maximum.at(users_peak, users, cum_usage)
+            last = np.append(users[1:] != users[:-1], True)
+            users_usage[users[last]] = cum_usage[last]
+            self._users_pyramid.add(
+                users, per_user_time.index.get_level_values('time').values,
+                cum_usage)
+
+        self._system_pyramid.finish()
+        self._users_pyramid.finish()
+        return (peak[0], peak[1], users_peak[:, 0].tolist(),
+                users_peak[:, 1].tolist(), running_peak)
 
+    # the cache may be shared by simulations running at the same time
     def load_from_cache(self):
-        if not exists(self.cache_file):
-            return
-        with open(self.cache_file, 'r') as f:
-            cache_data = json.load(f)
-            if self.tasks_file_sha in cache_data:
-                tasks_data = cache_data[self.tasks_file_sha]
-                for property in self._save_properties:
-                    setattr(self, '_' + property, tasks_data.get(property))
+        cache_data = read_json(self.cache_file)
+        if self.cache_key in cache_data:
+            tasks_data = cache_data[self.cache_key]
+            for property in self._save_properties:
+                setattr(self, '_' + property, tasks_data.get(property))
 
     def save_to_cache(self):
-        cache_data = {}
-        if exists(self.cache_file):
-            with open(self.cache_file, 'r') as f:
-                cache_data = json.load(f)
         data = {k: getattr(self, '_' + k) for k in self._save_properties}
-        cache_data[self.tasks_file_sha] = data
-        with open(self.cache_file, 'w') as f:
-            json.dump(cache_data, f)
+        with updating_json(self.cache_file) as cache_data:
+            cache_data[self.cache_key] = data
+
+        if self._system_pyramid is not None:
+            arrays = self._system_pyramid.to_arrays('system_')
+            arrays.update(self._users_pyramid.to_arrays('users_'))
+            # saved to a temporary file first, so that readers never see it
+            # partial
+            temporary = '%s.%s.npz' % (splitext(self.pyramid_file)[0],
+                                       uuid.uuid4().hex)
+            np.savez_compressed(temporary,
+                                users=np.array(self._pyramid_users), **arrays)
+            os.rename(temporary, self.pyramid_file)
+
+    def _load_pyramids(self):
+        if not exists(self.pyramid_file):
+            self.calculate()
+            return
+        arrays = np.load(self.pyramid_file)
+        self._system_pyramid = UtilizationPyramid.from_arrays(arrays,
+                                                              'system_')
+        self._users_pyramid = UtilizationPyramid.from_arrays(arrays, 'users_')
+        self._pyramid_users = arrays['users'].tolist()
+        arrays.close()
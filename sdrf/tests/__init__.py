@@ -1 +1,16 @@
-# -*- coding: utf-8 -*-
\ No newline at end of file
+# -*- coding: utf-8 -*-
+import unittest
+
+from sdrf.allocators import Task
+
+
+class SimulationTestCase(unittest.TestCase):
+    """
+    Tests creating tasks, the users indices are shared by every task in the
+    process so they are reset before and after each test
+    """
+    def setUp(self):
+        Task.reset_user_index()
+
+    def tearDown(self):
+        Task.reset_user_index()
@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 
 rm *.o
-rm test_live_tree test_priority_queue
+rm test_live_tree test_priority_queue test_dominant_share_queue
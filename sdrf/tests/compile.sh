@@ -7,3 +7,6 @@ g++ -fdiagnostics-color=always --std=c++11 -O3 -Wall -Wextra -pedantic -o test_l
 
 g++ -fdiagnostics-color=always --std=c++11 -O3 -Wall -Wextra -pedantic -c test_priority_queue.cpp $SOURCE_PATH/priority_queue.cpp
 g++ -fdiagnostics-color=always --std=c++11 -O3 -Wall -Wextra -pedantic -o test_priority_queue test_priority_queue.o priority_queue.o element.o
+
+g++ -fdiagnostics-color=always --std=c++11 -O3 -Wall -Wextra -pedantic -c test_dominant_share_queue.cpp $SOURCE_PATH/dominant_share_queue.cpp
+g++ -fdiagnostics-color=always --std=c++11 -O3 -Wall -Wextra -pedantic -o test_dominant_share_queue test_dominant_share_queue.o dominant_share_queue.o
@@ -0,0 +1,137 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from math import log
+
+from sdrf.helpers.live_tree import BucketedLiveTree, Element, LiveTree
+from sdrf.simulators.simulate_task_allocation import sdrf
+from sdrf.tests import SimulationTestCase
+
+system_cpu = 20.0
+system_memory = 100.0
+tau = -1 / log(0.999)
+num_elements = 50
+
+
+def new_element(name, update_time, cpu_allocation, memory_allocation):
+    return Element(name, update_time, tau, system_cpu, 0.0, cpu_allocation,
+                   system_cpu / num_elements, system_memory, 0.0,
+                   memory_allocation, system_memory / num_elements)
+
+
+class TestBucketedLiveTree(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.trees = [LiveTree(), BucketedLiveTree(1), BucketedLiveTree(7)]
+
+    def add_all(self):
+        for name in xrange(num_elements):
+            cpu = random.uniform(-1, 1)
+            memory = random.uniform(-5, 5)
+            for tree in self.trees:
+                tree.add(new_element(name, 0.0, cpu, memory))
+
+    def names(self, tree):
+        return [e.name for e in tree.sorted_elements()]
+
+    def test_same_order(self):
+        time = 0.0
+        in_trees = set()
+        for _ in xrange(2000):
+            time += random.choice([0.0, 1.0, 100.0])
+            name = random.randrange(num_elements)
+            if name in in_trees:
+                for tree in self.trees:
+                    tree.update(time)
+                    tree.remove(name)
+                in_trees.remove(name)
+            else:
+                cpu = random.uniform(-1, 1)
+                memory = random.uniform(-5, 5)
+                for tree in self.trees:
+                    tree.add(new_element(name, time, cpu, memory))
+                in_trees.add(name)
+
+            for tree in self.trees:
+                tree.update(time)
+            expected = self.names(self.trees[0])
+            self.assertEqual(sorted(expected), sorted(in_trees))
+            for tree in self.trees[1:]:
+                self.assertEqual(self.names(tree), expected)
+                if expected:
+                    self.assertEqual(tree.get_min(time).name, expected[0])
+
+    def test_remove_while_iterating(self):
+        self.add_all()
+        for tree in self.trees:
+            tree.update(1000.0)
+        expected = self.names(self.trees[0])
+        for tree in self.trees[1:]:
+            # the way SDRF goes through the users
+            visited = []
+            for element in tree.sorted_elements():
+                visited.append(element.name)
+                if element.name % 2:
+                    tree.remove(element.name)
+            self.assertEqual(visited, expected)
+            self.assertEqual(self.names(tree),
+                             [name for name in expected if name % 2 == 0])
+
+    def test_pop(self):
+        self.add_all()
+        time = 0.0
+        for _ in xrange(num_elements):
+            time += 50.0
+            names = set(tree.pop(time).name for tree in self.trees)
+            self.assertEqual(len(names), 1)
+        for tree in self.trees:
+            self.assertTrue(tree.is_empty())
+
+
+class TestBucketedSDRF(SimulationTestCase):
+    def setUp(self):
+        super(TestBucketedSDRF, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(1000):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 30), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestBucketedSDRF, self).tearDown()
+
+    def check_buckets(self, **kwargs):
+        results = []
+        for buckets in [None, 1, 4]:
+            saving_dir = os.path.join(self.directory, str(buckets))
+            os.mkdir(saving_dir)
+            sdrf(self.tasks_file, saving_dir, 0.5, 0.99, buckets=buckets,
+                 **kwargs)
+            name, = os.listdir(saving_dir)
+            with open(os.path.join(saving_dir, name)) as f:
+                results.append(f.readlines())
+        self.assertEqual(len(results[0]), 1000)
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], results[0])
+
+    def test_sdrf(self):
+        self.check_buckets()
+
+    def test_reserved_sdrf(self):
+        self.check_buckets(reserved=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
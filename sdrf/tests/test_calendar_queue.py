@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from sdrf.helpers.calendar_queue import CalendarQueue
+
+
+class TestCalendarQueue(unittest.TestCase):
+    def test_pop_order(self):
+        random.seed(0)
+        queue = CalendarQueue(width=10)
+        events = [(random.randint(0, 1000), i) for i in xrange(2000)]
+        for time, item_id in events:
+            queue.push(item_id, time)
+        self.assertEqual(len(queue), len(events))
+
+        popped = []
+        while len(queue):
+            next_event = queue.get_min()
+            popped.append(queue.pop())
+            self.assertEqual(next_event, popped[-1])
+        self.assertEqual(popped, sorted(events))
+        self.assertIsNone(queue.pop())
+
+    def test_push_while_popping(self):
+        random.seed(1)
+        queue = CalendarQueue(width=5)
+        reference = []
+        now = 0
+        for item_id in xrange(3000):
+            time = now + random.choice([0, 1, 3, 20, 100])
+            queue.push(item_id, time)
+            reference.append((time, item_id))
+            if random.random() < 0.5:
+                reference.sort()
+                expected = reference.pop(0)
+                self.assertEqual(queue.pop(), expected)
+                now = expected[0]
+        reference.sort()
+        self.assertEqual([queue.pop() for _ in xrange(len(queue))], reference)
+
+    def test_pop_until(self):
+        random.seed(2)
+        queue = CalendarQueue(width=7)
+        events = [(random.uniform(0, 100), i) for i in xrange(500)]
+        for time, item_id in events:
+            queue.push(item_id, time)
+        events.sort()
+
+        self.assertEqual(queue.pop_until(-1), [])
+        first = queue.pop_until(50)
+        self.assertEqual(first, [e for e in events if e[0] <= 50])
+        self.assertEqual(len(queue), len(events) - len(first))
+        self.assertEqual(queue.pop_until(100), events[len(first):])
+        self.assertEqual(len(queue), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from collections import Counter
+
+from sdrf.allocators import Task
+from sdrf.allocators.wdrf import WDRF
+from sdrf.tests import SimulationTestCase
+
+
+class TestCoalesceEvents(SimulationTestCase):
+    def new_tasks(self):
+        # a1 and a2 finish at 10. When a1 finishes alone, B has the smaller
+        # share and b1 fits, after both finish A has the smaller share
+        return [Task('A', 'a1', 0, 10, (1.0, 1.0), 0),
+                Task('A', 'a2', 0, 10, (0.75, 0.75), 0),
+                Task('B', 'b0', 0, 100, (0.25, 0.25), 0),
+                Task('B', 'b1', 1, 101, (1.0, 1.0), 1),
+                Task('A', 'a3', 1, 101, (1.0, 1.0), 1)]
+
+    def simulate(self, coalesce_events):
+        """
+        :return: start time of each task and how many times each user was
+        reinserted, by time, after their tasks finished
+        """
+        tasks = self.new_tasks()
+        allocator = WDRF([2.0, 2.0], len(Task._user_index),
+                         coalesce_events=coalesce_events)
+        finished = Counter()
+        finish_task = allocator.finish_task
+
+        def counting_finish_task(task):
+            finished[task.user_id, allocator.current_time] += 1
+            finish_task(task)
+
+        allocator.finish_task = counting_finish_task
+        allocator.simulate(iter(tasks))
+        return {t.task_id: t.start_time for t in tasks}, finished
+
+    def test_schedule(self):
+        start_times, finished = self.simulate(False)
+        self.assertEqual(start_times, {'a1': 0, 'a2': 0, 'b0': 0, 'b1': 10,
+                                       'a3': 100})
+        self.assertEqual(finished['A', 10], 2)
+
+        start_times, finished = self.simulate(True)
+        self.assertEqual(start_times, {'a1': 0, 'a2': 0, 'b0': 0, 'b1': 100,
+                                       'a3': 10})
+        # a single reinsertion of A for both of its tasks
+        self.assertEqual(finished['A', 10], 1)
+        self.assertEqual(max(finished.values()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
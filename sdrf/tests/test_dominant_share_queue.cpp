@@ -0,0 +1,47 @@
+// compile with:
+// g++ --std=c++11 -Wall -Wextra -pedantic -c test_dominant_share_queue.cpp
+// g++ --std=c++11 -Wall -Wextra -pedantic -o test_dominant_share_queue test_dominant_share_queue.o dominant_share_queue.o
+
+#include <iostream>
+#include <cassert>
+
+#include "../helpers/c_live_tree/dominant_share_queue.h"
+
+
+int main()
+{
+  double system_cpu = 10.0;
+  double system_memory = 20.0;
+
+  DominantShareQueue queue = DominantShareQueue(3, system_cpu, system_memory);
+  queue.set_weights(2, 2.0, 1.0);
+  assert(queue.empty());
+  assert(queue.pick(10.0, 20.0) == DominantShareQueue::empty_queue);
+
+  // shares: user 0 -> 0.1, user 1 -> 0.1, user 2 -> 0.1 (weighted)
+  queue.add(0, 1.0, 1.0, 1.0, 1.0);
+  queue.add(1, 1.0, 2.0, 1.0, 1.0);
+  queue.add(2, 2.0, 1.0, 5.0, 1.0);
+  assert(queue.get_dominant_share(2) == 0.1);
+
+  // ties are broken by name
+  assert(queue.pick(10.0, 10.0) == 0);
+  assert(queue.pick(0.5, 10.0) == DominantShareQueue::system_full);
+
+  // new allocation moves the user to the end
+  queue.add(0, 3.0, 1.0, 1.0, 1.0);
+  assert(queue.pick(10.0, 10.0) == 1);
+
+  queue.remove(1);
+  assert(!queue.element_is_in(1));
+  assert(queue.pick(10.0, 10.0) == 2);
+  assert(queue.pick(4.0, 10.0) == DominantShareQueue::system_full);
+
+  queue.remove(2);
+  queue.remove(2);
+  assert(queue.pick(10.0, 10.0) == 0);
+  queue.remove(0);
+  assert(queue.empty());
+
+  std::cout << "OK" << std::endl;
+}
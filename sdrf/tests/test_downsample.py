@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from sdrf.tasks import read_tasks
+from sdrf.tasks.downsample import downsample, report_file
+from sdrf.tasks.sort_tasks import sort_tasks
+
+
+def job(line):
+    fields = line.split(',')
+    return fields[3], fields[4].split('-')[0]
+
+
+class TestDownsample(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        self.lines = []
+        submit_time = 10**6
+        for i in xrange(500):
+            submit_time += random.randint(0, 10**6)
+            user = random.randint(0, 4)
+            for j in xrange(random.randint(1, 10)):
+                start_time = submit_time + random.randint(0, 1000)
+                self.lines.append('%d,%d,%d,u%d,%d-%d,%r,%r\r\n' % (
+                    submit_time, start_time,
+                    start_time + random.randint(1, 10**7), user, i, j,
+                    random.random(), random.random()))
+        with open(self.tasks_file, 'wb') as f:
+            f.writelines(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def sample(self, fraction, seed=0, name='sampled.csv'):
+        saving_file = os.path.join(self.directory, name)
+        report = downsample(self.tasks_file, saving_file, fraction, seed)
+        with open(saving_file, 'rb') as f:
+            return f.readlines(), report
+
+    def test_jobs(self):
+        lines, report = self.sample(0.2)
+        tasks_per_job = Counter(job(line) for line in self.lines)
+        sampled_tasks_per_job = Counter(job(line) for line in lines)
+        # whole jobs, with lines in the original order
+        for sampled_job, tasks in sampled_tasks_per_job.iteritems():
+            self.assertEqual(tasks, tasks_per_job[sampled_job])
+        self.assertEqual(lines, [line for line in self.lines
+                                 if job(line) in sampled_tasks_per_job])
+
+        # a fifth of the jobs of each user, up to rounding
+        user_jobs = Counter(user for user, _ in tasks_per_job)
+        sampled_user_jobs = Counter(user for user, _ in sampled_tasks_per_job)
+        for user, jobs in user_jobs.iteritems():
+            self.assertLessEqual(abs(sampled_user_jobs[user] - jobs * 0.2), 1)
+
+        self.assertEqual(report['jobs'], 500)
+        self.assertEqual(report['sampled_jobs'], len(sampled_tasks_per_job))
+        self.assertEqual(report['tasks'], len(self.lines))
+        self.assertEqual(report['sampled_tasks'], len(lines))
+        self.assertEqual(report['users'], 5)
+        with open(report_file(os.path.join(self.directory,
+                                           'sampled.csv'))) as f:
+            self.assertEqual(json.load(f), report)
+
+    def test_report(self):
+        _, report = self.sample(0.5)
+        self.assertLess(abs(report['cpu_mean_error']), 0.2)
+        self.assertLess(report['users_cpu_share_max_error'], 0.1)
+        self.assertLessEqual(report['users_cpu_share_mean_error'],
+                             report['users_cpu_share_max_error'])
+
+        _, report = self.sample(1)
+        for stat in ['cpu_mean', 'memory_mean', 'cpu_peak', 'memory_peak']:
+            self.assertAlmostEqual(report[stat + '_error'], 0)
+        self.assertAlmostEqual(report['users_cpu_share_max_error'], 0)
+        self.assertAlmostEqual(report['utilization_curve_error'], 0)
+
+    def test_seed(self):
+        lines, _ = self.sample(0.3, seed=1)
+        self.assertEqual(self.sample(0.3, seed=1)[0], lines)
+        self.assertNotEqual(self.sample(0.3, seed=2)[0], lines)
+
+    def test_binary(self):
+        lines, _ = self.sample(0.3)
+        binary_file = os.path.join(self.directory, 'tasks.npy')
+        sort_tasks(self.tasks_file, binary_file)
+        saving_file = os.path.join(self.directory, 'sampled.npy')
+        downsample(binary_file, saving_file, 0.3, 0)
+        self.assertEqual(sorted(read_tasks(saving_file)['task_id']),
+                         sorted(line.split(',')[4] for line in lines))
+
+    def test_fraction(self):
+        self.assertRaises(ValueError, self.sample, 0)
+        self.assertRaises(ValueError, self.sample, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from math import exp, log
+
+from sdrf.helpers.live_tree import BucketedLiveTree, Element, LiveTree
+
+tau = -1 / log(0.9)
+system_cpu = 10.0
+system_memory = 20.0
+
+
+def commitment(initial, overused, time_delta):
+    return overused + (initial - overused) * exp(-time_delta / tau)
+
+
+class TestElement(unittest.TestCase):
+    def new_element(self, update_time, cpu_commitment, memory_commitment):
+        # overused cpu: 3 - 1, overused memory: 0
+        return Element(0, update_time, tau, system_cpu, cpu_commitment, 3.0,
+                       1.0, system_memory, memory_commitment, -1.0, 1.0)
+
+    def test_commitment(self):
+        element = self.new_element(5.0, 4.0, 1.0)
+        for time in [5.0, 6.0, 6.5, 20.0, 100.0]:
+            element.update(time)
+            self.assertAlmostEqual(element.cpu_commitment.value,
+                                   commitment(4.0, 2.0, time - 5.0))
+            self.assertAlmostEqual(element.memory_commitment.value,
+                                   commitment(1.0, 0.0, time - 5.0))
+
+    def test_path_independent(self):
+        # the commitment only depends on the time, not on the updates made
+        element = self.new_element(0.0, 4.0, 1.0)
+        other_element = self.new_element(0.0, 4.0, 1.0)
+        for time in xrange(1, 100):
+            element.update(float(time))
+        other_element.update(99.0)
+        self.assertEqual(element.cpu_commitment.value,
+                         other_element.cpu_commitment.value)
+        self.assertEqual(element.priority.value, other_element.priority.value)
+
+    def test_renormalization(self):
+        # far beyond the time the scaled offsets would overflow without
+        # moving their reference time
+        element = self.new_element(0.0, 4.0, 1.0)
+        time = 0.0
+        for _ in xrange(100):
+            time += 1000 * tau
+            element.update(time)
+            element.cpu_relative_allocation = 3.0
+        self.assertAlmostEqual(element.cpu_commitment.value, 2.0)
+        self.assertAlmostEqual(element.memory_commitment.value, 0.0)
+
+        element.cpu_relative_allocation = 0.0  # nothing overused
+        element.update(time + tau)
+        self.assertAlmostEqual(element.cpu_commitment.value,
+                               commitment(2.0, 0.0, tau))
+
+
+class TestDecayMemo(unittest.TestCase):
+    def new_tree(self, tree, element_tau, num_elements=20):
+        elements = [Element(name, 0.0, element_tau, system_cpu, 0.0,
+                            1.0 + name, 1.0, system_memory, 0.0, 2.0, 1.0)
+                    for name in xrange(num_elements)]
+        for element in elements:
+            tree.add(element)
+        return tree, elements
+
+    def test_single_exp_per_time(self):
+        # every element of the snapshot is updated to the same time, so they
+        # share a single exponential
+        for new_tree in [LiveTree, lambda: BucketedLiveTree(3)]:
+            tree, elements = self.new_tree(new_tree(), tau)
+            exp_count = tree.exp_count()
+            for time in [1.0, 2.0, 3.0]:
+                cpu_commitment = tree.snapshot(elements, time)[0]
+                self.assertAlmostEqual(cpu_commitment[5],
+                                       commitment(0.0, 5.0, time))
+                self.assertEqual(tree.exp_count(), exp_count + 1)
+                exp_count += 1
+
+    def test_trees_keep_their_memo(self):
+        # trees with different taus used alternately, as when several
+        # simulations run in a single pass, don't evict each other's decay
+        trees = [self.new_tree(LiveTree(), tau),
+                 self.new_tree(LiveTree(), 2 * tau)]
+        for time in [1.0, 2.0]:
+            for _ in xrange(3):
+                for tree, elements in trees:
+                    tree.snapshot(elements, time)
+        for tree, _ in trees:
+            self.assertEqual(tree.exp_count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
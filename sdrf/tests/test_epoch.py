@@ -0,0 +1,83 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.helpers.file_name import FileName
+from sdrf.simulators.simulate_task_allocation import sdrf
+from sdrf.tasks.compare_outputs import compare_outputs
+from sdrf.tests import SimulationTestCase
+
+
+class TestEpoch(SimulationTestCase):
+    def setUp(self):
+        super(TestEpoch, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(1000):
+                submit_time += random.choice([0, 1, 10**6])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**7),
+                    random.randint(0, 2), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestEpoch, self).tearDown()
+
+    def simulate(self, epoch, reserved=False, fast_path=False):
+        # with the same share users are committed as soon as they use more
+        # than 1/3 of the system
+        sdrf(self.tasks_file, self.directory, 0.5, 0.99, same_share=True,
+             reserved=reserved, fast_path=fast_path, epoch=epoch)
+        return os.path.join(self.directory, FileName(
+            'task_sim', 'sdrf', 0.5, 0.99, same_share=True, reserved=reserved,
+            epoch=epoch).name)
+
+    def test_file_name(self):
+        name = FileName('task_sim', 'sdrf', 0.5, 0.99, reserved=True,
+                        epoch=10).name
+        self.assertEqual(name, 'task_sim-sdrf-0.5-0.99-reserved-epoch10.0.csv')
+        attributes = FileName(name).attributes
+        self.assertEqual(attributes['epoch'], 10.0)
+        self.assertTrue(attributes['reserved'])
+        self.assertIsNone(FileName('task_sim-sdrf-0.5-0.99.csv').epoch)
+
+    def test_exact_epoch(self):
+        # times are integers in the tasks time unit (microseconds), so an
+        # epoch of one microsecond is the same as no epoch
+        exact = self.simulate(None)
+        report = compare_outputs(exact, self.simulate(1e-6))
+        self.assertEqual(report['tasks'], 1000)
+        self.assertIsNone(report['first_difference'])
+        self.assertEqual(report['different_start_fraction'], 0.0)
+        self.assertEqual(report['max_user_wait_difference'], 0.0)
+
+    def test_epoch(self):
+        for kwargs in [{}, {'reserved': True}]:
+            exact = self.simulate(None, **kwargs)
+            report = compare_outputs(exact, self.simulate(10, **kwargs))
+            self.assertEqual(report['missing_tasks'], 0)
+            self.assertGreater(report['different_start_fraction'], 0)
+            self.assertLessEqual(report['different_start_fraction'], 1)
+            self.assertLessEqual(report['mean_user_wait_difference'],
+                                 report['max_user_wait_difference'])
+
+    def test_fast_path(self):
+        # deferred users are replayed with the same epochs
+        fast_path = self.simulate(10, fast_path=True)
+        with open(fast_path) as f:
+            fast_path_result = f.readlines()
+        with open(self.simulate(10)) as f:
+            self.assertEqual(fast_path_result, f.readlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.simulators.simulate_task_allocation import fan_out
+from sdrf.tests import SimulationTestCase
+
+
+class TestFanOut(SimulationTestCase):
+    def setUp(self):
+        super(TestFanOut, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(500):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(0, 10**6),
+                    random.randint(0, 4), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestFanOut, self).tearDown()
+
+    def check_fan_out(self, allocator, parameters):
+        separate_dir = os.path.join(self.directory, 'separate')
+        together_dir = os.path.join(self.directory, 'together')
+        os.mkdir(separate_dir)
+        os.mkdir(together_dir)
+        for kwargs in parameters:
+            fan_out(self.tasks_file, separate_dir, allocator, [kwargs])
+        fan_out(self.tasks_file, together_dir, allocator, parameters)
+
+        files = sorted(os.listdir(separate_dir))
+        self.assertEqual(len(files), len(parameters))
+        self.assertEqual(sorted(os.listdir(together_dir)), files)
+        for name in files:
+            with open(os.path.join(separate_dir, name)) as f:
+                separate = f.readlines()
+            with open(os.path.join(together_dir, name)) as f:
+                together = f.readlines()
+            self.assertEqual(len(together), 500)
+            self.assertEqual(together, separate)
+
+    def test_sdrf(self):
+        self.check_fan_out('sdrf', [
+            dict(resource_percentage=r, delta=d, fast_path=fast_path)
+            for r, d, fast_path in [(0.5, 0.9, False), (0.5, 0.999, True),
+                                    (0.8, 0.999, False)]])
+        os.remove('time_stats.txt')
+
+    def test_wdrf(self):
+        self.check_fan_out('wdrf', [
+            dict(resource_percentage=r, use_weights=use_weights)
+            for r, use_weights in [(0.5, False), (0.5, True), (0.8, False)]])
+
+
+if __name__ == '__main__':
+    unittest.main()
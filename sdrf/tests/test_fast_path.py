@@ -0,0 +1,93 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.allocators import Task
+from sdrf.allocators.sdrf import ReservedSDRF, SDRF
+from sdrf.allocators.wdrf import WDRF
+from sdrf.simulators.simulate_task_allocation import fan_out
+from sdrf.tests import SimulationTestCase
+
+
+class TestFastPath(SimulationTestCase):
+    def setUp(self):
+        super(TestFastPath, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(1000):
+                submit_time += random.choice([0, 0, 1, 10**5])
+                # demands with few digits, so that they often add up to the
+                # exact capacities
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 3), i, round(random.random(), 2),
+                    round(random.random(), 2)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestFastPath, self).tearDown()
+
+    def check_same_results(self, allocator, parameters):
+        for kwargs in parameters:
+            results = []
+            for fast_path in [False, True]:
+                saving_dir = os.path.join(self.directory, str(fast_path))
+                if not os.path.isdir(saving_dir):
+                    os.mkdir(saving_dir)
+                fan_out(self.tasks_file, saving_dir, allocator,
+                        [dict(kwargs, fast_path=fast_path)])
+                name, = [n for n in os.listdir(saving_dir)
+                         if n.startswith('task_sim')]
+                with open(os.path.join(saving_dir, name)) as f:
+                    results.append(f.readlines())
+                shutil.rmtree(saving_dir)
+            self.assertEqual(len(results[0]), 1000)
+            self.assertEqual(results[1], results[0])
+
+    def test_sdrf(self):
+        self.check_same_results('sdrf', [
+            dict(resource_percentage=r, delta=0.999) for r in [0.5, 1.5]])
+
+    def test_reserved_sdrf(self):
+        self.check_same_results('sdrf', [
+            dict(resource_percentage=r, delta=0.999, reserved=True)
+            for r in [0.5, 1.5]])
+
+    def test_wdrf(self):
+        self.check_same_results('wdrf', [
+            dict(resource_percentage=r) for r in [0.5, 1.5]])
+
+    def test_group_fit(self):
+        # added up one at a time, the last task doesn't fit anymore, though
+        # the sum of the demands does
+        demands = [(0.26, 0.1), (0.5, 0.1), (0.45, 0.1)]
+        capacities = [1.21, 1.0]
+        num_users = Task._user_index['u0'] + 1
+        for new_allocator in [
+                lambda **kw: SDRF(capacities, {'u0': [0.5, 0.5]}, 0.9, 0,
+                                  online=True, **kw),
+                lambda **kw: ReservedSDRF(capacities, {'u0': [0.5, 0.5]},
+                                          0.9, 0, online=True, **kw),
+                lambda **kw: WDRF(capacities, num_users, online=True, **kw)]:
+            started = []
+            for fast_path in [False, True]:
+                allocator = new_allocator(fast_path=fast_path)
+                tasks = [Task('u0', i, 0, 10, d, 0)
+                         for i, d in enumerate(demands)]
+                allocator.submit_tasks(tasks, 0)
+                allocator.finish_tasks([tasks[0].count], 10)
+                started.append([t.start_time for t in tasks])
+            self.assertEqual(started[0], [0, 0, 10])
+            self.assertEqual(started[1], started[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
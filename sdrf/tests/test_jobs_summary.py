@@ -0,0 +1,95 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sdrf.tasks import jobs_file_header, tasks_file_header
+import sdrf.tasks.jobs_summary as jobs_summary_module
+from sdrf.tasks.jobs_summary import jobs_summary
+from sdrf.tasks.sort_tasks import sort_tasks
+
+
+class TestJobsSummary(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        self.saving_file = os.path.join(self.directory, 'jobs.csv')
+        random.seed(0)
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(500):
+                submit_time = random.randint(0, 100) * 1000
+                start_time = submit_time + random.randint(0, 1000)
+                f.write('%d,%d,%d,u%d,%d-%d,%r,%r\r\n' % (
+                    submit_time, start_time,
+                    start_time + random.randint(1, 10**6),
+                    random.randint(0, 3), random.randint(0, 29), i,
+                    random.random(), random.random()))
+
+        # the tasks of a job are spread over the file, so jobs are split
+        # across several chunks, which are merged a few at a time
+        self.chunk_size = jobs_summary_module.chunk_size
+        self.merge_every = jobs_summary_module.merge_every
+        jobs_summary_module.chunk_size = 7
+        jobs_summary_module.merge_every = 3
+
+    def tearDown(self):
+        jobs_summary_module.chunk_size = self.chunk_size
+        jobs_summary_module.merge_every = self.merge_every
+        shutil.rmtree(self.directory)
+
+    def expected_jobs(self):
+        tasks = pd.read_csv(self.tasks_file, header=None,
+                            names=tasks_file_header,
+                            dtype={'user_id': str, 'task_id': str})
+        tasks['job_id'] = tasks['task_id'].str.split('-').str[0]
+        groups = tasks.groupby(['job_id', 'user_id'])
+        jobs = pd.DataFrame({'submit_time': groups['submit_time'].min(),
+                             'start_time': groups['start_time'].min(),
+                             'finish_time': groups['finish_time'].max(),
+                             'num_tasks': groups.size(),
+                             'cpu_mean': groups['cpu'].mean(),
+                             'memory_mean': groups['memory'].mean()})
+        jobs['duration'] = jobs['finish_time'] - jobs['start_time']
+        return jobs.reset_index()[jobs_file_header]
+
+    def read_jobs(self):
+        jobs = pd.read_csv(self.saving_file, header=None,
+                           names=jobs_file_header,
+                           dtype={'job_id': str, 'user_id': str})
+        return jobs.sort_values(['job_id', 'user_id']).reset_index(drop=True)
+
+    def check_same_jobs(self, jobs, expected):
+        self.assertEqual(len(jobs), len(expected))
+        for column in jobs_file_header:
+            if column in ['cpu_mean', 'memory_mean']:
+                # the sums are added in a different order
+                np.testing.assert_allclose(jobs[column], expected[column])
+            else:
+                self.assertEqual(list(jobs[column]), list(expected[column]))
+
+    def test_same_as_group_by(self):
+        expected = self.expected_jobs()
+        for processes in [1, 2]:
+            jobs_summary(self.tasks_file, self.saving_file, processes)
+            self.check_same_jobs(self.read_jobs(), expected)
+
+    def test_binary(self):
+        expected = self.expected_jobs()
+        binary_file = os.path.join(self.directory, 'tasks.npy')
+        sort_tasks(self.tasks_file, binary_file)
+        for processes in [1, 3]:
+            jobs_summary(binary_file, self.saving_file, processes)
+            self.check_same_jobs(self.read_jobs(), expected)
+
+    def test_empty_file(self):
+        open(self.tasks_file, 'wb').close()
+        jobs_summary(self.tasks_file, self.saving_file, processes=2)
+        self.assertEqual(os.path.getsize(self.saving_file), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,7 @@ int main()
 
   double update_time = 1.0;
 
-  LiveTree queue = LiveTree();
+  LiveTree queue;
 
   double c_o_cpu = -8.0;
   double c_o_mem = 1.0;
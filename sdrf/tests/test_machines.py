@@ -0,0 +1,155 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.allocators import Task
+from sdrf.allocators.wdrf import WDRF
+from sdrf.helpers.file_name import FileName
+from sdrf.helpers.live_tree import MachineIndex
+from sdrf.simulators.simulate_task_allocation import sdrf, wdrf
+from sdrf.tests import SimulationTestCase
+
+
+class TestMachineIndex(unittest.TestCase):
+    def check_placement(self, placement):
+        random.seed(0)
+        capacities = [(random.choice([0.5, 1.0]), random.choice([0.5, 1.0]))
+                      for _ in xrange(37)]
+        largest = (max(c for c, _ in capacities),
+                   max(m for _, m in capacities))
+        index = MachineIndex(capacities, placement)
+        running = []
+        for _ in xrange(5000):
+            demands = (random.uniform(0, 0.4), random.uniform(0, 0.4))
+            fitting = []
+            for machine in xrange(len(capacities)):
+                cpu, memory = index.free(machine)
+                if demands[0] <= cpu and demands[1] <= memory:
+                    score = cpu / largest[0] + memory / largest[1]
+                    fitting.append((score, machine))
+            if not fitting:
+                expected = None
+            elif placement == 'first_fit':
+                expected = fitting[0][1]
+            else:
+                expected = min(fitting)[1]
+
+            machine = index.find(demands)
+            self.assertEqual(machine, expected)
+            if machine is not None:
+                index.allocate(machine, demands)
+                running.append((machine, demands))
+            if running and (machine is None or random.random() < 0.3):
+                machine, demands = running.pop(
+                    random.randrange(len(running)))
+                index.release(machine, demands)
+
+    def test_first_fit(self):
+        self.check_placement('first_fit')
+
+    def test_best_fit(self):
+        self.check_placement('best_fit')
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, MachineIndex, [[1, 1]], 'worst_fit')
+        self.assertRaises(ValueError, MachineIndex, [], 'first_fit')
+
+
+class TestPlacement(SimulationTestCase):
+    def new_tasks(self, demands):
+        return [Task('u0', i, 0, 10, d, 0)
+                for i, d in enumerate(demands)]
+
+    def new_wdrf(self, machines, placement='first_fit', **kwargs):
+        num_users = Task._user_index['u0'] + 1
+        return WDRF([2.0, 2.0], num_users, online=True, machines=machines,
+                    placement=placement, **kwargs)
+
+    def test_fragmentation(self):
+        tasks = self.new_tasks([(0.6, 0.1)] * 3)
+        allocator = self.new_wdrf(None)
+        self.assertEqual(len(allocator.submit_tasks(tasks, 0)), 3)
+
+        tasks = self.new_tasks([(0.6, 0.1)] * 3)
+        allocator = self.new_wdrf([[1.0, 1.0], [1.0, 1.0]])
+        started = allocator.submit_tasks(tasks, 0)
+        self.assertEqual([t.machine for t in started], [0, 1])
+        # the machine is freed when the task finishes
+        started = allocator.finish_tasks([tasks[1].count], 5)
+        self.assertEqual(started, [tasks[2]])
+        self.assertEqual(tasks[2].machine, 1)
+
+    def test_best_fit(self):
+        machines = [[1.5, 1.5], [0.5, 0.5]]
+        for placement, machine in [('first_fit', 0), ('best_fit', 1)]:
+            allocator = self.new_wdrf(machines, placement)
+            task, = allocator.submit_tasks(self.new_tasks([(0.4, 0.4)]), 0)
+            self.assertEqual(task.machine, machine)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.new_wdrf, [[2.0, 2.0]],
+                          fast_path=True)
+        allocator = self.new_wdrf([[1.0, 1.0], [1.0, 1.0]])
+        self.assertRaises(ValueError, allocator.submit_tasks,
+                          self.new_tasks([(1.5, 0.1)]), 0)
+
+
+class TestMachinesSimulation(SimulationTestCase):
+    def setUp(self):
+        super(TestMachinesSimulation, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(1000):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 5), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestMachinesSimulation, self).tearDown()
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return sorted(f.readlines())
+
+    def test_single_machine(self):
+        # a single machine is the same as no machines
+        for reserved in [False, True]:
+            for machines in [None, 1]:
+                sdrf(self.tasks_file, self.directory, 0.7, 0.99,
+                     reserved=reserved, machines=machines)
+            name = FileName('task_sim', 'sdrf', 0.7, 0.99,
+                            reserved=reserved).name
+            self.assertEqual(self.read(name), self.read(
+                FileName('task_sim', 'sdrf', 0.7, 0.99, reserved=reserved,
+                         machines=1).name))
+
+        wdrf(self.tasks_file, self.directory, 0.7)
+        wdrf(self.tasks_file, self.directory, 0.7, machines=1,
+             placement='best_fit')
+        self.assertEqual(self.read('task_sim-wdrf-0.7-0.csv'),
+                         self.read('task_sim-wdrf-0.7-0-best_fit-'
+                                   'machines1.csv'))
+
+    def test_machines(self):
+        sdrf(self.tasks_file, self.directory, 0.7, 0.99, machines=4,
+             placement='best_fit')
+        name = 'task_sim-sdrf-0.7-0.99-best_fit-machines4.csv'
+        self.assertEqual(len(self.read(name)), 1000)
+        attributes = FileName(name).attributes
+        self.assertEqual(attributes['machines'], 4)
+        self.assertTrue(attributes['best_fit'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import psutil
+from click.testing import CliRunner
+
+from sdrf.__main__ import cli
+from sdrf.helpers.memory_usage import (bytes_per_snapshot_user,
+                                       bytes_per_task, bytes_per_user,
+                                       estimate_memory_usage)
+from sdrf.simulators.simulate_task_allocation import fan_out
+from sdrf.tasks import batch_size
+from sdrf.tests import SimulationTestCase
+
+
+class Utilization(object):
+    """
+    Properties of a SystemUtilization used by the estimate: peak usage twice
+    the mean cpu and 1.5 times the mean memory
+    """
+    number_of_users = 10
+    num_tasks = 10000
+    peak_running_tasks = 100
+    cpu_mean = 2.0
+    cpu_peak = 4.0
+    memory_mean = 2.0
+    memory_peak = 3.0
+    duration = 1000
+
+
+class TestEstimateMemoryUsage(unittest.TestCase):
+    def check_estimate(self, tasks, resource_percentage, allocator='sdrf',
+                       **kwargs):
+        """
+        :param tasks: tasks expected to be kept in memory at the same time
+        """
+        rss = psutil.Process().memory_info().rss
+        rest = estimate_memory_usage(Utilization(), resource_percentage,
+                                     allocator, **kwargs) - rss
+        rest -= (tasks + batch_size) * bytes_per_task
+        rest -= Utilization.number_of_users * bytes_per_user[allocator]
+        # the process may allocate some memory in between
+        self.assertLess(abs(rest), 2**20)
+
+    def test_running_tasks(self):
+        # the system can hold the peak usage
+        self.check_estimate(100, 2.0)
+        self.check_estimate(100, 2.0, 'wdrf')
+        # the peak is twice the system, and the half of the work that it
+        # can't do waits until the end
+        self.check_estimate(100 * 4 + 10000 / 2, 0.5)
+        # never more than the tasks in the trace
+        self.check_estimate(10000, 0.01)
+        self.check_estimate(10000, 0)
+
+    def test_history_and_snapshots(self):
+        extra = estimate_memory_usage(Utilization(), 2.0, 'sdrf',
+                                      keep_history=True,
+                                      snapshot_interval=100)
+        extra -= estimate_memory_usage(Utilization(), 2.0, 'sdrf')
+        history = 10000 * (10 * 16 + 112)
+        snapshots = 11 * 10 * bytes_per_snapshot_user
+        self.assertLess(abs(extra - history - snapshots), 2**20)
+
+
+class TestMemoryLimit(SimulationTestCase):
+    def setUp(self):
+        super(TestMemoryLimit, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        self.saving_dir = os.path.join(self.directory, 'results')
+        os.mkdir(self.saving_dir)
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(100):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 10**6),
+                    random.randint(0, 4), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestMemoryLimit, self).tearDown()
+
+    def results(self):
+        return [name for name in os.listdir(self.saving_dir)
+                if name.startswith('task_sim')]
+
+    def test_refused(self):
+        # below the memory the process already uses
+        with self.assertRaisesRegexp(MemoryError, 'exceeds the memory limit'):
+            fan_out(self.tasks_file, self.saving_dir, 'wdrf',
+                    [dict(resource_percentage=0.5)], memory_limit=2**20)
+        self.assertEqual(self.results(), [])
+
+        fan_out(self.tasks_file, self.saving_dir, 'wdrf',
+                [dict(resource_percentage=0.5)], memory_limit=2**40)
+        self.assertEqual(len(self.results()), 1)
+
+    def test_exit_code(self):
+        runner = CliRunner()
+        arguments = ['simulate_task_allocation', '-a', 'wdrf', '-r', '0.5',
+                     self.tasks_file, self.saving_dir]
+        result = runner.invoke(cli, arguments + ['--memory_limit', '1'])
+        self.assertEqual(result.exit_code, 4)
+        self.assertIn('exceeds the memory limit', result.output)
+        self.assertEqual(self.results(), [])
+
+        result = runner.invoke(cli, arguments + ['--memory_limit', '10000'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(len(self.results()), 1)
+
+    def test_config_limit(self):
+        config = os.path.join(self.directory, 'config.txt')
+        with open(config, 'w') as f:
+            f.write('[config]\nestimate_memory_usage = 1\n'
+                    'resources = [0.5]\n')
+        runner = CliRunner()
+        arguments = ['simulate_task_allocation', '-a', 'wdrf', '-c', config,
+                     self.tasks_file, self.saving_dir]
+        result = runner.invoke(cli, arguments)
+        self.assertEqual(result.exit_code, 4)
+        self.assertIn('exceeds the memory limit', result.output)
+        self.assertEqual(self.results(), [])
+
+        # the option takes precedence over the config file
+        result = runner.invoke(cli, arguments + ['--memory_limit', '10000'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(len(self.results()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import random
+import unittest
+
+import numpy as np
+
+from sdrf.allocators import Task
+from sdrf.allocators.sdrf import ReservedSDRF, SDRF
+from sdrf.helpers.priority_queue import PriorityQueue
+from sdrf.tests import SimulationTestCase
+
+
+class ScanReservedSDRF(ReservedSDRF):
+    """
+    First stage as it was before the queue only kept the users whose next
+    task fits in their reserved resources: every user under their reserved
+    resources is kept and the ones whose next task doesn't fit are dropped
+    while scanning the queue
+    """
+    def __init__(self, *args, **kwargs):
+        super(ScanReservedSDRF, self).__init__(*args, **kwargs)
+        self._user_resources_queue = PriorityQueue(np.zeros(self.num_users))
+
+    def _insert_user_resources_heap(self, user):
+        res_left = np.max(self.allocations[user] /
+                          self._user_resources[user])
+        if res_left < 1:
+            self._user_resources_queue.add(user, res_left)
+
+    def _replay_user(self, user, updates):
+        if user in self._user_resources_queue.finder:
+            self._user_resources_queue.remove(user)
+        super(ScanReservedSDRF, self)._replay_user(user, updates)
+
+    def pick_task(self):
+        picked_task = self._pick_from_queue(self._user_resources_queue,
+                                            self._user_fulfills_request)
+        if self._system_full:
+            return None
+        if picked_task is None:
+            picked_task = SDRF.pick_task(self)
+        return picked_task
+
+
+class TestReservedSDRF(SimulationTestCase):
+    def simulate(self, allocator_class, fast_path):
+        """
+        :return: tasks in the order they started (other than the ones started
+        by the fast path) and the start time of every task
+        """
+        random.seed(0)
+        users_resources = {'u%d' % u: [random.uniform(0.01, 0.3),
+                                       random.uniform(0.01, 0.3)]
+                           for u in xrange(8)}
+        tasks = []
+        submit_time = 0
+        for i in xrange(2000):
+            submit_time += random.choice([0, 10**4, 10**5])
+            tasks.append(Task('u%d' % random.randint(0, 7), i, submit_time,
+                              submit_time + random.randint(1, 2 * 10**6),
+                              (random.uniform(0, 0.2),
+                               random.uniform(0, 0.2)), submit_time))
+        allocator = allocator_class([1.0, 1.0], users_resources, 0.9, 0,
+                                    fast_path=fast_path)
+        started = []
+        start_task = allocator._start_task
+
+        def recording_start_task(task):
+            started.append((task.task_id, allocator.current_time))
+            start_task(task)
+
+        allocator._start_task = recording_start_task
+        allocator.simulate(iter(tasks))
+        self.assertEqual(len(allocator.finished_tasks), 2000)
+        return started, [task.start_time for task in tasks]
+
+    def test_same_picks(self):
+        for fast_path in [False, True]:
+            Task.reset_user_index()
+            expected = self.simulate(ScanReservedSDRF, fast_path)
+            Task.reset_user_index()
+            self.assertEqual(self.simulate(ReservedSDRF, fast_path),
+                             expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
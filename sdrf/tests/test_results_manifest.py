@@ -0,0 +1,124 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.helpers import results_manifest
+from sdrf.simulators.simulate_task_allocation import fan_out
+from sdrf.simulators.time_parallel import time_parallel_sdrf
+from sdrf.tests import SimulationTestCase
+
+
+class TestResultsManifest(SimulationTestCase):
+    def setUp(self):
+        super(TestResultsManifest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.saving_dir = os.path.join(self.directory, 'results')
+        os.mkdir(self.saving_dir)
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(500):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 5), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        results_manifest._code_sha = None
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestResultsManifest, self).tearDown()
+
+    def simulate(self, resources, force=False, memory_budget=None, **kwargs):
+        """
+        :return: names of the results simulated
+        """
+        parameters = [dict(resource_percentage=r, delta=0.9, **kwargs)
+                      for r in resources]
+        before = self.modification_times()
+        fan_out(self.tasks_file, self.saving_dir, 'sdrf', parameters,
+                memory_budget, memoize=True, force=force)
+        after = self.modification_times()
+        return sorted(n for n in after if before.get(n) != after[n])
+
+    def modification_times(self):
+        return {name: os.stat(os.path.join(self.saving_dir, name)).st_mtime
+                for name in os.listdir(self.saving_dir)
+                if name.startswith('task_sim')}
+
+    def test_memoize(self):
+        self.assertEqual(self.simulate([0.7]), ['task_sim-sdrf-0.7-0.9.csv'])
+        with open(os.path.join(self.saving_dir,
+                               results_manifest.manifest_name)) as f:
+            entry = json.load(f)['task_sim-sdrf-0.7-0.9.csv']
+        self.assertEqual(entry['parameters'],
+                         {'resource_percentage': 0.7, 'delta': 0.9})
+
+        # only the new point of an overlapping grid, the same with options
+        # that don't change the results
+        self.assertEqual(self.simulate([0.7, 1.0], fast_path=True),
+                         ['task_sim-sdrf-1.0-0.9.csv'])
+        self.assertEqual(self.simulate([0.7, 1.0]), [])
+        self.assertEqual(self.simulate([0.7], force=True),
+                         ['task_sim-sdrf-0.7-0.9.csv'])
+        # the manifest itself is locked, nothing else is left
+        self.assertEqual(sorted(os.listdir(self.saving_dir)),
+                         [results_manifest.manifest_name,
+                          'task_sim-sdrf-0.7-0.9.csv',
+                          'task_sim-sdrf-1.0-0.9.csv'])
+
+    def test_invalidate(self):
+        self.simulate([0.7, 1.0])
+        with open(os.path.join(self.saving_dir,
+                               'task_sim-sdrf-1.0-0.9.csv'), 'a') as f:
+            f.write('\n')
+        self.assertEqual(self.simulate([0.7, 1.0]),
+                         ['task_sim-sdrf-1.0-0.9.csv'])
+
+        # snapshots are part of the result
+        self.assertEqual(self.simulate([0.7], snapshot_interval=10**5),
+                         ['task_sim-sdrf-0.7-0.9.csv',
+                          'task_sim-sdrf-0.7-0.9.snapshots.npz'])
+        os.remove(os.path.join(self.saving_dir,
+                               'task_sim-sdrf-0.7-0.9.snapshots.npz'))
+        self.assertEqual(len(self.simulate([0.7], snapshot_interval=10**5)),
+                         2)
+
+        # the resources calculated in chunks differ in the last digits
+        self.assertEqual(len(self.simulate([0.7, 1.0],
+                                           memory_budget=10**6)), 2)
+        self.assertEqual(self.simulate([0.7, 1.0], memory_budget=10**6), [])
+
+        results_manifest._code_sha = 'other'
+        self.assertEqual(len(self.simulate([0.7, 1.0])), 2)
+
+        with open(self.tasks_file, 'ab') as f:
+            f.write('%d,%d,%d,u0,500,0.1,0.1\r\n' % (10**8, 10**8, 10**8 + 1))
+        self.assertEqual(len(self.simulate([0.7, 1.0])), 2)
+        self.assertEqual(self.simulate([0.7, 1.0]), [])
+
+    def test_new_saving_dir(self):
+        self.saving_dir = os.path.join(self.directory, 'new', 'results')
+        fan_out(self.tasks_file, self.saving_dir, 'sdrf',
+                [dict(resource_percentage=0.7, delta=0.9)], memoize=True)
+        self.assertEqual(list(self.modification_times()),
+                         ['task_sim-sdrf-0.7-0.9.csv'])
+        self.assertEqual(self.simulate([0.7]), [])
+
+    def test_time_parallel(self):
+        self.assertIsNotNone(time_parallel_sdrf(
+            self.tasks_file, self.saving_dir, 0.7, 0.9, memoize=True))
+        self.assertIsNone(time_parallel_sdrf(
+            self.tasks_file, self.saving_dir, 0.7, 0.9, memoize=True))
+        self.assertEqual(self.simulate([0.7]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sdrf.service.replay import replay
+from sdrf.service.server import ServiceClient, connect, listening_socket, \
+    scheduler_service, serve
+from sdrf.simulators.simulate_task_allocation import build_sdrf, \
+    simulate_task_allocation
+from sdrf.tasks import first_submit_time
+from sdrf.tasks.system_utilization import SystemUtilization
+from sdrf.tests import SimulationTestCase
+
+
+class TestSchedulerService(SimulationTestCase):
+    def setUp(self):
+        super(TestSchedulerService, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(500):
+                submit_time += random.choice([0, 0, 1, 10**5])
+                finish_time = submit_time + random.randint(1, 10**6)
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time, finish_time,
+                    random.randint(0, 4), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestSchedulerService, self).tearDown()
+
+    def test_replay(self):
+        service = scheduler_service(self.tasks_file, 'sdrf', 0.5, 0.99)
+        socket_file = os.path.join(self.directory, 'sdrf.sock')
+        server = threading.Thread(target=serve, args=(
+            service, listening_socket(socket_file)))
+        server.daemon = True
+        server.start()
+        client = ServiceClient(connect(socket_file))
+        try:
+            replay_file = os.path.join(self.directory, 'replay.csv')
+            stats = replay(self.tasks_file, replay_file, client)
+        finally:
+            client.close()
+            # the server only stops on a shutdown message, sent through a new
+            # connection as the replay may have failed in the middle of a
+            # request
+            if server.is_alive():
+                shutdown_client = ServiceClient(connect(socket_file))
+                try:
+                    shutdown_client.request([{'type': 'shutdown'}])
+                finally:
+                    shutdown_client.close()
+            server.join()
+        self.assertEqual(stats['running_tasks'], 0)
+        self.assertEqual(stats['queued_tasks'], 0)
+        self.assertIn('latency_p99', stats)
+
+        allocator = build_sdrf(SystemUtilization(self.tasks_file), 0.5, 0.99,
+                               first_submit_time(self.tasks_file))
+        simulation_file = os.path.join(self.directory, 'simulation.csv')
+        simulate_task_allocation(allocator, self.tasks_file, simulation_file)
+        with open(replay_file) as f:
+            replay_lines = sorted(f)
+        with open(simulation_file) as f:
+            simulation_lines = sorted(f)
+        self.assertEqual(len(replay_lines), 500)
+        self.assertEqual(replay_lines, simulation_lines)
+
+    def test_errors(self):
+        service = scheduler_service(self.tasks_file, 'wdrf', 1.0)
+
+        def submit(time, task_id, user_id='u0'):
+            return service.handle({'type': 'submit', 'time': time, 'id': 7,
+                                   'tasks': [{'task_id': task_id,
+                                              'user_id': user_id, 'cpu': 0.1,
+                                              'memory': 0.1}]})
+
+        def finish(time, task_id):
+            return service.handle({'type': 'finish', 'time': time,
+                                   'tasks': [task_id]})
+
+        self.assertIn('error', submit(10, 1, 'nobody'))
+        self.assertEqual(submit(10, 1), {'started': [1], 'id': 7})
+        self.assertIn('error', submit(10, 1))
+        self.assertIn('error', finish(10, 2))
+        self.assertIn('error', finish(9, 1))
+        self.assertIn('error', service.handle({'type': 'unknown'}))
+        self.assertEqual(service.stats()['running_tasks'], 1)
+        self.assertEqual(finish(10, 1), {'started': []})
+        self.assertEqual(service.handle({'type': 'tick', 'time': 20}),
+                         {'started': []})
+        self.assertEqual(service.stats()['running_tasks'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdrf.allocators import Task
+from sdrf.allocators.sdrf import QueueProxy, SDRF
+from sdrf.tests import SimulationTestCase
+
+
+class TestSnapshots(SimulationTestCase):
+    def setUp(self):
+        super(TestSnapshots, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestSnapshots, self).tearDown()
+
+    def new_tasks(self, num_tasks):
+        random.seed(0)
+        tasks = []
+        submit_time = 0
+        for i in xrange(num_tasks):
+            submit_time += random.choice([0, 10**5, 10**6])
+            tasks.append(Task('u%d' % random.randint(0, 5), i, submit_time,
+                              submit_time + random.randint(1, 10**7),
+                              (random.uniform(0, 0.3),
+                               random.uniform(0, 0.3)), submit_time))
+        return tasks
+
+    def new_sdrf(self, **kwargs):
+        users_resources = {'u%d' % u: [0.05, 0.02 * u] for u in xrange(6)}
+        return SDRF([1.0, 1.0], users_resources, 0.9, 0, **kwargs)
+
+    def test_bulk_snapshot(self):
+        for buckets in [None, 2]:
+            Task.reset_user_index()
+            allocator = self.new_sdrf(online=True, buckets=buckets)
+            for task in self.new_tasks(12):
+                allocator.submit_tasks([task], task.submit_time)
+            queue = allocator.user_commitments_queue
+            waiting = set(queue.sorted_elements())
+            self.assertTrue(0 < len(waiting) < allocator.num_users)
+
+            time = allocator.current_time + 3 * 10**5
+            snapshot = allocator.commitment_snapshot(time)
+            # the users waiting are copies from the tree (a bucketed tree
+            # also keeps copies of the first user of each bucket, updated at
+            # other times), the others their idle elements (updated last, as
+            # the allocator can't be used anymore after it)
+            elements = {e.name: e for e in
+                        super(QueueProxy, queue).sorted_elements()}
+            for user in xrange(allocator.num_users):
+                element = elements.get(user, allocator.idle_users[user])
+                if user not in waiting:
+                    self.assertEqual(snapshot['update_time'][user],
+                                     element.update_time.value)
+                element.update(time)
+                self.assertEqual(snapshot['cpu_commitment'][user],
+                                 element.cpu_commitment.value)
+                self.assertEqual(snapshot['memory_commitment'][user],
+                                 element.memory_commitment.value)
+                self.assertEqual(snapshot['priority'][user],
+                                 element.priority.value)
+            self.assertTrue(np.all(snapshot['update_time'] <= time))
+            self.assertTrue(np.any(snapshot['cpu_commitment'] > 0))
+
+    def test_save_snapshots(self):
+        allocator = self.new_sdrf(snapshot_interval=10**6)
+        tasks = self.new_tasks(200)
+        allocator.simulate(iter(tasks))
+        saving_file = os.path.join(self.directory, 'task_sim.snapshots.npz')
+        allocator.save_snapshots(saving_file)
+
+        saved = np.load(saving_file)
+        times = saved['time']
+        self.assertEqual(times[0], 0)
+        self.assertTrue(np.all(np.diff(times) == 10**6))
+        self.assertGreaterEqual(times[-1] + 10**6, tasks[-1].submit_time)
+        users = dict((user_id, user)
+                     for user, user_id in enumerate(saved['user_id']))
+        self.assertEqual(users, dict(Task._user_index))
+        for key in ['cpu_commitment', 'memory_commitment', 'priority',
+                    'update_time']:
+            self.assertEqual(saved[key].shape,
+                             (len(times), allocator.num_users))
+            for i, (time, snapshot) in enumerate(allocator.snapshots):
+                self.assertEqual(times[i], time)
+                np.testing.assert_array_equal(saved[key][i], snapshot[key])
+        # users are committed at some point, but never before their update
+        self.assertTrue(np.any(saved['cpu_commitment'] > 0))
+        self.assertTrue(np.all(saved['update_time'] <= times[:, np.newaxis]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdrf.tasks import read_tasks
+import sdrf.tasks.sort_tasks as sort_tasks_module
+from sdrf.tasks.sort_tasks import sort_tasks
+
+
+class TestSortTasks(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        self.lines = []
+        for i in xrange(3000):
+            submit_time = random.randint(0, 100) * 1000
+            start_time = submit_time + random.randint(0, 1000)
+            self.lines.append('%d,%d,%d,u%d,%d-%d,%r,%r\r\n' % (
+                submit_time, start_time, start_time + random.randint(1, 10**6),
+                random.randint(0, 9), i, random.randint(0, 9),
+                random.random(), random.random()))
+        with open(self.tasks_file, 'wb') as f:
+            f.writelines(self.lines)
+        self.sorted_lines = sorted(self.lines,
+                                   key=lambda l: int(l.split(',')[0]))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sort_csv(self):
+        merge_fan_in = sort_tasks_module.merge_fan_in
+        sort_tasks_module.merge_fan_in = 3
+        try:
+            saving_file = os.path.join(self.directory, 'sorted.csv')
+            sort_tasks(self.tasks_file, saving_file, memory_budget=30000)
+            with open(saving_file, 'rb') as f:
+                self.assertEqual(f.readlines(), self.sorted_lines)
+        finally:
+            sort_tasks_module.merge_fan_in = merge_fan_in
+
+        # in place, using multiple processes
+        sort_tasks(self.tasks_file, self.tasks_file, memory_budget=30000,
+                   processes=2)
+        with open(self.tasks_file, 'rb') as f:
+            self.assertEqual(f.readlines(), self.sorted_lines)
+        # temporary files are removed
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['sorted.csv', 'tasks.csv'])
+
+    def test_sort_binary(self):
+        saving_file = os.path.join(self.directory, 'sorted.npy')
+        sort_tasks(self.tasks_file, saving_file, memory_budget=30000)
+        tasks = read_tasks(saving_file)
+        expected = read_tasks(self.tasks_file)
+        expected = expected.iloc[np.argsort(expected['submit_time'].values,
+                                            kind='mergesort')]
+        for column in ['submit_time', 'start_time', 'finish_time', 'cpu',
+                       'memory']:
+            np.testing.assert_array_equal(tasks[column].values,
+                                          expected[column].values)
+        self.assertEqual(list(tasks['task_id']), list(expected['task_id']))
+        self.assertEqual(list(tasks['user_id']), list(expected['user_id']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+
+from sdrf.simulators.simulate_task_allocation import sdrf
+from sdrf.simulators.sweep import create_sweep, sweep_parameters, \
+    sweep_status, work
+from sdrf.tests import SimulationTestCase
+
+
+class TestSweep(SimulationTestCase):
+    def setUp(self):
+        super(TestSweep, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.sweep_dir = os.path.join(self.directory, 'sweep')
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(500):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 5), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestSweep, self).tearDown()
+
+    def create(self, resources, vary=(), **kwargs):
+        parameters = sweep_parameters('sdrf', resources, [0.9], vary)
+        return create_sweep(self.sweep_dir, self.tasks_file, 'sdrf',
+                            parameters, **kwargs)
+
+    def lock_file(self, point):
+        return os.path.join(self.sweep_dir, 'locks', point['id'] + '.lock')
+
+    def test_workers(self):
+        manifest = self.create([0.7, 1.0], ['reserved'], heartbeat=0.1)
+        self.assertEqual(len(manifest['points']), 4)
+        workers = [multiprocessing.Process(target=work,
+                                           args=(self.sweep_dir, 'w%d' % i))
+                   for i in xrange(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        status = sweep_status(self.sweep_dir)
+        self.assertEqual(status['done'], 4)
+        self.assertEqual(status['pending'] + status['running'], 0)
+        self.assertEqual(sum(w['done'] for w in status['workers'].values()),
+                         4)
+        self.assertEqual(os.listdir(os.path.join(self.sweep_dir, 'locks')),
+                         [])
+        self.assertEqual(os.listdir(os.path.join(self.sweep_dir, 'tmp')), [])
+
+        serial_dir = os.path.join(self.directory, 'serial')
+        os.mkdir(serial_dir)
+        for point in manifest['points']:
+            sdrf(self.tasks_file, serial_dir, **point['parameters'])
+            with open(os.path.join(serial_dir, point['output'])) as f:
+                serial = f.readlines()
+            with open(os.path.join(self.sweep_dir, point['output'])) as f:
+                self.assertEqual(f.readlines(), serial)
+
+    def test_stale_lock(self):
+        manifest = self.create([0.7], heartbeat=0.05, stale_after=1.0)
+        point, = manifest['points']
+        with open(self.lock_file(point), 'w') as f:
+            json.dump({'worker': 'dead', 'token': 'dead'}, f)
+        status = sweep_status(self.sweep_dir)
+        self.assertEqual(status['running'], 1)
+        self.assertEqual(status['workers'], {'dead': {'done': 0, 'running': 1,
+                                                      'stale': 0}})
+
+        # a worker that is alive keeps its point
+        self.assertEqual(work(self.sweep_dir, 'w', wait=False), [])
+        self.assertTrue(os.path.exists(self.lock_file(point)))
+
+        past = time.time() - 10
+        os.utime(self.lock_file(point), (past, past))
+        self.assertEqual(sweep_status(self.sweep_dir)['stale'], 1)
+        self.assertEqual(work(self.sweep_dir, 'w', wait=False), [point['id']])
+        status = sweep_status(self.sweep_dir)
+        self.assertEqual(status['done'], 1)
+        self.assertEqual(status['workers'], {'w': {'done': 1, 'running': 0,
+                                                   'stale': 0}})
+        self.assertTrue(os.path.exists(os.path.join(self.sweep_dir,
+                                                    point['output'])))
+
+    def test_errors(self):
+        self.assertRaises(ValueError, create_sweep, self.sweep_dir,
+                          self.tasks_file, 'sdrf', sweep_parameters(
+                              'sdrf', [0.7, 0.7], [0.9]))
+        self.create([0.7])
+        self.assertRaises(ValueError, self.create, [1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.tasks.system_utilization import SystemUtilization
+
+
+def _utilization(tasks_file, memory_budget):
+    utilization = SystemUtilization(tasks_file, memory_budget=memory_budget)
+    utilization.utilization()
+
+
+class TestSystemUtilization(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(2000):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 9), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_streaming(self):
+        in_memory = SystemUtilization(self.tasks_file)
+        streaming = SystemUtilization(self.tasks_file, memory_budget=10**6)
+        self.assertAlmostEqual(streaming.cpu_mean, in_memory.cpu_mean)
+        self.assertAlmostEqual(streaming.memory_mean, in_memory.memory_mean)
+        self.assertAlmostEqual(streaming.cpu_peak, in_memory.cpu_peak)
+        self.assertEqual(streaming.peak_running_tasks,
+                         in_memory.peak_running_tasks)
+        for user, mean in in_memory.users_cpu_mean.iteritems():
+            self.assertAlmostEqual(streaming.users_cpu_mean[user], mean)
+
+        # each one is cached separately, results don't depend on the one
+        # calculated first
+        self.assertNotEqual(streaming.pyramid_file, in_memory.pyramid_file)
+        for memory_budget, expected in [(None, in_memory),
+                                        (10**6, streaming)]:
+            cached = SystemUtilization(self.tasks_file,
+                                       memory_budget=memory_budget)
+            self.assertEqual(cached.cpu_mean, expected.cpu_mean)
+            self.assertEqual(cached.users_memory_mean,
+                             expected.users_memory_mean)
+
+    def test_concurrent(self):
+        # processes sharing the cache load it while others save it
+        for memory_budget in [None, 10**6]:
+            processes = [multiprocessing.Process(
+                target=_utilization, args=(self.tasks_file, memory_budget))
+                for _ in xrange(8)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import sdrf.tasks as tasks_module
+from sdrf.tasks import (merged_tasks_generator, read_tasks, task_id_size,
+                        tasks_file_header, tasks_generator)
+from sdrf.tests import SimulationTestCase
+
+
+class TestTasksGenerator(SimulationTestCase):
+    def setUp(self):
+        super(TestTasksGenerator, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        # many batches, more than the slots of the buffer
+        self.batch_size = tasks_module.batch_size
+        tasks_module.batch_size = 7
+
+    def tearDown(self):
+        tasks_module.batch_size = self.batch_size
+        shutil.rmtree(self.directory)
+        super(TestTasksGenerator, self).tearDown()
+
+    def write_tasks(self, name, num_tasks, seed=0):
+        """
+        :return: file name and the fields of every task in it, as read by
+        pandas
+        """
+        random.seed(seed)
+        tasks_file = os.path.join(self.directory, name)
+        submit_time = 0
+        with open(tasks_file, 'wb') as f:
+            for i in xrange(num_tasks):
+                submit_time += random.choice([0, 1, 1000])
+                start_time = submit_time + random.randint(0, 1000)
+                f.write('%d,%d,%d,u%d,%s%d-0,%r,%r\r\n' % (
+                    submit_time, start_time,
+                    start_time + random.randint(1, 10**6),
+                    random.randint(0, 9), name, i, random.random(),
+                    random.random()))
+        tasks = read_tasks(tasks_file)
+        return tasks_file, zip(*[tasks[c] for c in tasks_file_header])
+
+    def fields(self, task):
+        return (task.submit_time, task.start_time, task.finish_time,
+                task.user_id, task.task_id, task.cpu, task.memory)
+
+    def load(self, tasks_file, **kwargs):
+        return [self.fields(t)
+                for t in tasks_generator(tasks_file, progress_label='',
+                                         **kwargs)]
+
+    def load_merged(self, tasks_files, **kwargs):
+        return [self.fields(t)
+                for t in merged_tasks_generator(tasks_files, **kwargs)]
+
+    def test_batches(self):
+        tasks_file, tasks = self.write_tasks('tasks', 100)
+        self.assertEqual(self.load(tasks_file), tasks)
+
+        stop_time = tasks[50][1]
+        self.assertEqual(self.load(tasks_file, stop_time=stop_time),
+                         [t for t in tasks if t[1] <= stop_time])
+        self.assertEqual(
+            self.load(tasks_file, stop_time=stop_time, truncate=True),
+            [t[:2] + (min(t[2], stop_time),) + t[3:]
+             for t in tasks if t[1] <= stop_time])
+
+    def test_long_task_ids(self):
+        # the task ids of the batches with longer ones than the buffer holds
+        # go through a queue, the other batches are still in the buffer
+        tasks_file, tasks = self.write_tasks('tasks', 20)
+        with open(tasks_file, 'ab') as f:
+            for task_id in ['x' * task_id_size, 'y' * (task_id_size + 1),
+                            'z' * 1000] + ['%d' % i for i in xrange(20)]:
+                f.write('%d,%d,%d,u0,%s,0.5,0.5\r\n' % (
+                    tasks[-1][:3] + (task_id,)))
+        expected = read_tasks(tasks_file)
+        loaded = self.load(tasks_file)
+        self.assertEqual(loaded,
+                         zip(*[expected[c] for c in tasks_file_header]))
+        self.assertEqual([t[4] for t in loaded[20:23]],
+                         ['x' * task_id_size, 'y' * (task_id_size + 1),
+                          'z' * 1000])
+
+    def test_loader_error(self):
+        tasks_file, tasks = self.write_tasks('tasks', 20)
+        with open(tasks_file, 'ab') as f:
+            f.write('not,a,task\r\n')
+        loaded = []
+        with self.assertRaisesRegexp(RuntimeError, 'Failed to load tasks'):
+            for task in tasks_generator(tasks_file, progress_label=''):
+                loaded.append(self.fields(task))
+        # the batches before the error are loaded
+        self.assertGreater(len(loaded), 0)
+        self.assertEqual(loaded, tasks[:len(loaded)])
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_stop_early(self):
+        tasks_file, tasks = self.write_tasks('tasks', 100)
+        generator = tasks_generator(tasks_file, progress_label='')
+        self.assertEqual(self.fields(generator.next()), tasks[0])
+        generator.close()
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_merge(self):
+        # tasks submitted at the same time in several files are taken in the
+        # order of the files
+        tasks_files = []
+        lines = []
+        for file_index in xrange(3):
+            tasks_file, _ = self.write_tasks('tasks%d' % file_index, 40,
+                                             seed=file_index)
+            tasks_files.append(tasks_file)
+            with open(tasks_file, 'rb') as f:
+                lines.extend((int(line.split(',', 1)[0]), file_index,
+                              position, line)
+                             for position, line in enumerate(f))
+        sorted_file = os.path.join(self.directory, 'sorted')
+        with open(sorted_file, 'wb') as f:
+            f.writelines(line for _, _, _, line in sorted(lines))
+
+        self.assertEqual(self.load_merged(tasks_files),
+                         self.load(sorted_file))
+        stop_time = sorted(lines)[60][0]
+        self.assertEqual(
+            self.load_merged(tasks_files, stop_time=stop_time, truncate=True),
+            self.load(sorted_file, stop_time=stop_time, truncate=True))
+        self.assertEqual(self.load_merged(tasks_files[:1]),
+                         self.load(tasks_files[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
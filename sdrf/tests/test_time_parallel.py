@@ -0,0 +1,146 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sdrf.allocators import Task
+from sdrf.simulators.simulate_task_allocation import sdrf
+from sdrf.simulators.time_parallel import _simulate_window, \
+    time_parallel_sdrf
+from sdrf.tasks import read_tasks, submit_time_position, tasks_chunks
+from sdrf.tests import SimulationTestCase
+
+
+class TestTimeParallel(SimulationTestCase):
+    def setUp(self):
+        super(TestTimeParallel, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.tasks_file = os.path.join(self.directory, 'tasks.csv')
+        random.seed(0)
+        submit_time = 10**6
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(1000):
+                submit_time += random.choice([0, 1, 10**5])
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 3 * 10**6),
+                    random.randint(0, 4), i, random.random(),
+                    random.random()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists('time_stats.txt'):
+            os.remove('time_stats.txt')
+        super(TestTimeParallel, self).tearDown()
+
+    def test_submit_time_position(self):
+        submit_time = read_tasks(self.tasks_file)['submit_time'].values
+        for time in [0, submit_time[0], submit_time[1], submit_time[500],
+                     submit_time[500] + 1, submit_time[-1],
+                     submit_time[-1] + 1]:
+            position = submit_time_position(self.tasks_file, time)
+            chunks = tasks_chunks(self.tasks_file, 100, position)
+            self.assertEqual(sum(len(df) for df, _ in chunks),
+                             (submit_time >= time).sum())
+
+    def serial_lines(self, resource_percentage, **kwargs):
+        serial_dir = os.path.join(self.directory, 'serial')
+        os.mkdir(serial_dir)
+        sdrf(self.tasks_file, serial_dir, resource_percentage, 0.5, **kwargs)
+        name, = os.listdir(serial_dir)
+        with open(os.path.join(serial_dir, name)) as f:
+            lines = f.readlines()
+        shutil.rmtree(serial_dir)
+        return name, lines
+
+    def check_time_parallel(self, resource_percentage, num_tasks=1000,
+                            **kwargs):
+        options = {key: kwargs.pop(key)
+                   for key in ['coalesce_events', 'fast_path']
+                   if key in kwargs}
+        name, serial = self.serial_lines(resource_percentage, **options)
+        parallel_dir = os.path.join(self.directory, 'parallel')
+        os.mkdir(parallel_dir)
+        report = time_parallel_sdrf(self.tasks_file, parallel_dir,
+                                    resource_percentage, 0.5,
+                                    **dict(options, **kwargs))
+        self.assertTrue(report['converged'])
+        self.assertLessEqual(report['error_bound'], 1e-9)
+
+        self.assertEqual(os.listdir(parallel_dir), [name])
+        with open(os.path.join(parallel_dir, name)) as f:
+            parallel = f.readlines()
+        shutil.rmtree(parallel_dir)
+        self.assertEqual(len(parallel), num_tasks)
+        self.assertEqual(parallel, serial)
+        return report
+
+    def test_estimated_states(self):
+        report = self.check_time_parallel(1.5, windows=3, processes=2)
+        self.assertLess(report['windows_simulated'], 6)
+
+    def test_iterations(self):
+        # too short to estimate anything, the windows are only right after
+        # the iterations
+        report = self.check_time_parallel(0.5, windows=4, warmup=0.5)
+        self.assertGreater(report['iterations'], 1)
+
+    def test_boundary_events(self):
+        # windows of 10**5, tasks arriving and finishing at their boundaries
+        random.seed(0)
+        with open(self.tasks_file, 'wb') as f:
+            for i in xrange(300):
+                submit_time = min(random.randint(0, 8) * 5 * 10**4,
+                                  4 * 10**5 - 1)
+                f.write('%d,%d,%d,u%d,%d,%r,%r\r\n' % (
+                    submit_time, submit_time,
+                    submit_time + random.randint(1, 4) * 5 * 10**4,
+                    random.randint(0, 4), i, random.random() / 4,
+                    random.random() / 4))
+        with open(self.tasks_file, 'rb') as f:
+            lines = sorted(f, key=lambda l: int(l.split(',', 1)[0]))
+        # the last window ends right after the last task
+        lines[-1] = '399999' + lines[-1][lines[-1].index(','):]
+        with open(self.tasks_file, 'wb') as f:
+            f.writelines(lines)
+
+        for options in [{}, {'coalesce_events': True}, {'fast_path': True}]:
+            self.check_time_parallel(0.5, num_tasks=300, windows=4,
+                                     warmup=0.05, **options)
+
+    def test_new_saving_dir(self):
+        name, serial = self.serial_lines(0.5)
+        saving_dir = os.path.join(self.directory, 'new', 'results')
+        time_parallel_sdrf(self.tasks_file, saving_dir, 0.5, 0.5, windows=2,
+                           memoize=True)
+        with open(os.path.join(saving_dir, name)) as f:
+            self.assertEqual(f.readlines(), serial)
+
+    def test_user_index(self):
+        # the second window runs in a process where the users got other
+        # indices, the state it starts from is indexed as in the first one
+        start, end = 10**6, 10**6 + 30 * 10**5
+        users = ['u%d' % u for u in xrange(5)]
+        arguments = (self.tasks_file, os.path.join(self.directory, '0.csv'),
+                     dict(resource_percentage=0.5, delta=0.5,
+                          same_share=False, reserved=False, fast_path=False,
+                          coalesce_events=False, buckets=None, epoch=None),
+                     users, start, end, start, None)
+        first_file, _, state = _simulate_window(arguments)
+        Task.set_user_index(users[::-1])
+        second_file, _, _ = _simulate_window(
+            (self.tasks_file, os.path.join(self.directory, '1.csv')) +
+            arguments[2:4] + (end, None, end, state))
+        self.assertEqual(Task.user_ids(), users)
+
+        window_lines = []
+        for window_file in [first_file, second_file]:
+            with open(window_file) as f:
+                window_lines.extend(f)
+        self.assertEqual(sorted(window_lines),
+                         sorted(self.serial_lines(0.5)[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from sdrf.helpers.utilization_pyramid import UtilizationPyramid
+
+
+class TestUtilizationPyramid(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.first_time = 5
+        self.last_time = 1003
+        self.bucket_sizes = [10, 30, 120]
+        self.changes = []
+        for _ in xrange(3):
+            times = np.sort(random.choice(
+                np.arange(self.first_time + 1, self.last_time + 1), 40,
+                replace=False))
+            self.changes.append((times, random.rand(40, 2)))
+
+        self.pyramid = UtilizationPyramid(self.first_time, self.last_time,
+                                          self.bucket_sizes,
+                                          len(self.changes))
+        # change points are added in parts, with the series mixed
+        for start, end in [(0, 10), (10, 25), (25, 40)]:
+            series = np.repeat(np.arange(len(self.changes)), end - start)
+            times = np.concatenate([t[start:end] for t, _ in self.changes])
+            values = np.concatenate([v[start:end] for _, v in self.changes])
+            order = random.permutation(len(times))
+            self.pyramid.add(series[order], times[order], values[order])
+        self.pyramid.finish()
+
+    def test_levels(self):
+        time_units = np.arange(self.first_time, self.last_time + 1)
+        for index, (times, values) in enumerate(self.changes):
+            change = np.searchsorted(times, time_units, 'right') - 1
+            usage = np.where(change[:, np.newaxis] >= 0,
+                             values[np.maximum(change, 0)], 0)
+            for level, size in enumerate(self.bucket_sizes):
+                starts, minimum, mean, maximum = self.pyramid.series(level,
+                                                                     index)
+                for bucket, start in enumerate(starts):
+                    in_bucket = ((time_units >= start) &
+                                 (time_units < start + size))
+                    # the last time is an instant, with no duration
+                    in_integral = in_bucket & (time_units < self.last_time)
+                    np.testing.assert_allclose(
+                        mean[bucket], usage[in_integral].sum(axis=0) / size)
+                    np.testing.assert_allclose(minimum[bucket],
+                                               usage[in_bucket].min(axis=0))
+                    np.testing.assert_allclose(maximum[bucket],
+                                               usage[in_bucket].max(axis=0))
+
+    def test_arrays(self):
+        pyramid = UtilizationPyramid.from_arrays(
+            self.pyramid.to_arrays('test_'), 'test_')
+        self.assertEqual(pyramid.bucket_sizes, self.bucket_sizes)
+        for stats, loaded_stats in zip(self.pyramid.levels, pyramid.levels):
+            for array, loaded_array in zip(stats, loaded_stats):
+                np.testing.assert_array_equal(array, loaded_array)
+        self.assertEqual(pyramid.level_for(20), 2)
+        self.assertEqual(pyramid.level_for(40), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()